@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Adaptive Response Budgets
+
+Derives per-question max_tokens and timeouts for one node from a pilot round.
+The pilot repeats are answered with the full MAX_TOKENS/TIMEOUT budget; after
+that, each question gets a budget covering BUDGET_PERCENTILE of the observed
+completion lengths and latencies plus BUDGET_MARGIN headroom. Short factual
+answers then stop reserving a 1024-token, 16-second slot on the node.
+
+A question whose pilot hit MAX_TOKENS keeps the full budget, and any question
+that is truncated or times out under an adapted budget is widened back to it.
+"""
+
+import math
+import logging
+import threading
+from collections import defaultdict
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+if TYPE_CHECKING:
+    from experiment_runner import Config
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseBudget:
+    """Per-question max_tokens and timeout for one node."""
+
+    def __init__(self, config: "Config", name: str):
+        self.config = config
+        self.name = name
+        self._lock = threading.Lock()
+        self._tokens: Dict[str, List[int]] = defaultdict(list)
+        self._latencies: Dict[str, List[float]] = defaultdict(list)
+        self._pilot_truncated = set()
+        self._budgets: Dict[str, Dict[str, float]] = {}
+
+    def record(self, q_key: str, completion_tokens: Optional[int], latency: float, truncated: bool):
+        """
+        Record one pilot response.
+
+        Args:
+            q_key: Question key (e.g., "Q1")
+            completion_tokens: Tokens generated for this response, if reported
+            latency: Seconds taken by the completion call
+            truncated: True if the response stopped at max_tokens
+        """
+        with self._lock:
+            if completion_tokens is not None:
+                self._tokens[q_key].append(completion_tokens)
+            self._latencies[q_key].append(latency)
+            if truncated:
+                self._pilot_truncated.add(q_key)
+
+    def finalize(self) -> pd.DataFrame:
+        """
+        Derive per-question budgets from the recorded pilot responses.
+
+        Returns:
+            pd.DataFrame: The budget per question, for logging
+        """
+        rows = []
+        with self._lock:
+            for q_key in sorted(set(self._tokens) | set(self._latencies), key=lambda q: int(q[1:])):
+                tokens = self._tokens.get(q_key)
+                latencies = self._latencies.get(q_key)
+
+                if q_key in self._pilot_truncated or not tokens:
+                    # Long (or unmeasured) answers keep the full budget
+                    max_tokens = self.config.MAX_TOKENS
+                    timeout = self.config.TIMEOUT
+                else:
+                    token_budget = np.percentile(tokens, self.config.BUDGET_PERCENTILE) * (1 + self.config.BUDGET_MARGIN)
+                    max_tokens = int(min(self.config.MAX_TOKENS, max(self.config.MIN_MAX_TOKENS, math.ceil(token_budget))))
+                    latency_budget = np.percentile(latencies, self.config.BUDGET_PERCENTILE) * (1 + self.config.BUDGET_MARGIN)
+                    timeout = float(min(self.config.TIMEOUT, max(self.config.MIN_TIMEOUT, latency_budget)))
+
+                self._budgets[q_key] = {"max_tokens": max_tokens, "timeout": timeout}
+                rows.append({
+                    "question": q_key,
+                    "pilot_p50_tokens": np.median(tokens) if tokens else np.nan,
+                    "max_tokens": max_tokens,
+                    "timeout": timeout
+                })
+
+        budget_df = pd.DataFrame(rows)
+        logger.info(f"Adaptive budgets for {self.name}:\n" + budget_df.to_string(index=False))
+        return budget_df
+
+    def max_tokens(self, q_key: str) -> int:
+        """Current max_tokens for a question (the full budget until finalized)."""
+        return int(self._budgets.get(q_key, {}).get("max_tokens", self.config.MAX_TOKENS))
+
+    def timeout(self, q_key: str) -> float:
+        """Current timeout in seconds for a question (the full budget until finalized)."""
+        return self._budgets.get(q_key, {}).get("timeout", self.config.TIMEOUT)
+
+    def is_reduced(self, q_key: str) -> bool:
+        """True if the question currently runs with less than the full budget."""
+        return self.max_tokens(q_key) < self.config.MAX_TOKENS or self.timeout(q_key) < self.config.TIMEOUT
+
+    def widen(self, q_key: str, reason: str):
+        """
+        Restore the full budget for a question after a truncation or timeout.
+
+        Args:
+            q_key: Question key
+            reason: What happened, for logging
+        """
+        with self._lock:
+            if q_key in self._budgets:
+                logger.warning(f"{self.name}, {q_key}: {reason} under adapted budget "
+                               f"({self._budgets[q_key]['max_tokens']} tokens, "
+                               f"{self._budgets[q_key]['timeout']:.1f}s); restoring full budget")
+                self._budgets[q_key] = {"max_tokens": self.config.MAX_TOKENS, "timeout": self.config.TIMEOUT}
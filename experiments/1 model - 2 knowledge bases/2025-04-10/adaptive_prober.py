@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Adaptive Probe Selection
+
+Instead of asking every node the same fixed question list in order, the
+prober keeps a belief over candidate models (or knowledge bases) from the
+reference library and always asks the question expected to best tell the
+remaining candidates apart:
+
+- After each answer the belief is recomputed with Bayes' rule from the
+  fit of every candidate to all answers so far: the log density of its
+  score (see ReferenceLibrary.identify), which uses the embeddings'
+  effective dimension k rather than the embedding size d and so isn't
+  overconfident, and doesn't favour references with more responses.
+- The expected information gain of a question is the current entropy minus
+  the expected entropy after one more answer, where the answer's evidence
+  against candidate c' when c is the truth is the KL divergence of
+  isotropic Gaussians around the reference centroids, scaled by k / d.
+  Centroid distances are taken less the centroids' own sampling noise
+  (see separated_distances), and dispersions only count as different
+  beyond theirs, so questions aren't chosen where a candidate's statistics
+  merely happen to be off, which would bias its fit. That gives every
+  question's gain from one (Q, C, C) array operation.
+- Probing stops when one candidate's posterior reaches the threshold and
+  that candidate also fits the answers (its fit p-value is at least
+  `fit_level`), or the budget is spent. When no question is expected to
+  gain anything, e.g. once one candidate dominates or when the candidates
+  are indistinguishable, the least asked questions are asked to test the
+  leading candidate's fit.
+
+With that likelihood the default temperature of 1 is calibrated: in
+simulate() replays of held-out runs, a node whose model has several
+identical references is never decided, while distinct models are decided
+after a few answers.
+"""
+
+import os
+import logging
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from reference_library import (SEPARATION_Z, VARIANCE_FLOOR, ReferenceLibrary, fit_references, group_dimension,
+                               load_results, node_samples, separated_distances)
+
+logger = logging.getLogger(__name__)
+
+
+def _entropy(log_p: np.ndarray) -> np.ndarray:
+    """Entropy (nats) of normalized log-probabilities along the last axis."""
+    p = np.exp(log_p)
+    with np.errstate(invalid="ignore"):
+        return -np.sum(np.where(p > 0, p * log_p, 0.0), axis=-1)
+
+
+def _normalize(log_p: np.ndarray) -> np.ndarray:
+    log_p = log_p - log_p.max(axis=-1, keepdims=True)
+    return log_p - np.log(np.exp(log_p).sum(axis=-1, keepdims=True))
+
+
+class AdaptiveProber:
+    """Chooses probe questions by expected information gain and updates beliefs from answers."""
+
+    def __init__(self, group: Dict[str, np.ndarray], prior: Optional[Dict[str, float]] = None,
+                 threshold: float = 0.99, max_probes: int = 40, max_per_question: int = 5,
+                 temperature: float = 1.0, fit_level: float = 0.05, min_gain: float = 1e-3):
+        """
+        Initialize the prober.
+
+        Args:
+            group: Candidate references from ReferenceLibrary.group
+            prior: Optional prior probability per candidate (uniform by default)
+            threshold: Posterior at which one candidate is accepted
+            max_probes: Maximum answers to collect
+            max_per_question: Maximum answers per question, so evidence isn't drawn from one prompt only
+            temperature: Divides log-likelihoods (1 for the calibrated fit likelihood)
+            fit_level: Smallest fit p-value at which the leading candidate can be accepted
+            min_gain: Questions expected to gain less than this (nats) are only asked to test the leader's fit
+        """
+        self.group = group
+        self.models = list(group["models"].astype(str))
+        counts = group["counts"].astype(float)
+        # Only questions every candidate has a reference for can discriminate between them
+        self.eligible = (counts > 0).all(axis=0)
+        sample_correction = np.where(counts > 1, counts / np.maximum(counts - 1, 1), 1.0)
+        self.variance = (np.maximum(group["dispersion"] * sample_correction, VARIANCE_FLOOR)
+                         * (1 + 1 / np.maximum(counts, 1)))
+        self.dim = group["centroids"].shape[2]
+        self.effective_dimension = group_dimension(group)
+
+        self.threshold = threshold
+        self.max_probes = max_probes
+        self.max_per_question = max_per_question
+        self.temperature = temperature
+        self.fit_level = fit_level
+        self.min_gain = min_gain
+
+        if prior:
+            weights = np.array([prior.get(model, 0.0) for model in self.models], dtype=float)
+        else:
+            weights = np.ones(len(self.models))
+        with np.errstate(divide="ignore"):
+            self.log_prior = _normalize(np.log(weights / weights.sum()))
+        self.log_posterior = self.log_prior
+        self.fit_pvalue = np.full(len(self.models), np.nan)
+        self.answers: Dict[str, List[np.ndarray]] = {}
+        self.asked = np.zeros(counts.shape[1], dtype=int)
+        self.history: List[Dict] = []
+        self._divergence = self._pairwise_divergence()
+
+    def _pairwise_divergence(self) -> np.ndarray:
+        """KL(c || c') per question between the candidates' answer distributions, in k dimensions: (Q, C, C)."""
+        variance = self.variance.T  # (Q, C)
+        squared = np.nan_to_num(separated_distances(self.group))
+        ratio = variance[:, :, None] / variance[:, None, :]
+        # Like the distances, dispersions only count as different beyond their sampling noise
+        # (log-variance standard deviation about sqrt(2 / (k (N - 1))) each)
+        counts = np.maximum(self.group["counts"].T.astype(float) - 1, 1)
+        noise = np.sqrt(2 / (self.effective_dimension * counts))
+        significant = np.abs(np.log(ratio)) > SEPARATION_Z * np.hypot(noise[:, :, None], noise[:, None, :])
+        divergence = 0.5 * (self.dim * np.where(significant, ratio - 1 - np.log(ratio), 0.0)
+                            + squared / variance[:, None, :])
+        # The isotropic model counts d independent dimensions; answers carry about k worth of evidence
+        return divergence * self.effective_dimension / self.dim
+
+    @property
+    def posterior(self) -> pd.Series:
+        """Current belief over the candidates."""
+        return pd.Series(np.exp(self.log_posterior), index=self.models).sort_values(ascending=False)
+
+    def expected_information_gain(self) -> np.ndarray:
+        """
+        Expected reduction in belief entropy from one more answer to each question.
+
+        Returns:
+            np.ndarray: (Q,) gains in nats; -inf for questions that can't be asked
+        """
+        # Posterior after one answer from true candidate c: log p(c') - KL(c || c') / T
+        updated = _normalize(self.log_posterior[None, None, :] - self._divergence / self.temperature)
+        expected_entropy = (np.exp(self.log_posterior)[None, :] * _entropy(updated)).sum(axis=1)
+        gain = _entropy(self.log_posterior) - expected_entropy
+        return np.where(self._allowed(), gain, -np.inf)
+
+    def _allowed(self) -> np.ndarray:
+        return self.eligible & (self.asked < self.max_per_question)
+
+    @property
+    def decided(self) -> bool:
+        """True if the leading candidate reached the threshold and fits the answers."""
+        best = int(np.argmax(self.log_posterior))
+        return bool(np.exp(self.log_posterior[best]) >= self.threshold and self.fit_pvalue[best] >= self.fit_level)
+
+    def should_stop(self) -> bool:
+        """True once a candidate is accepted, the budget is spent or no question can be asked."""
+        return bool(self.decided or len(self.history) >= self.max_probes or not self._allowed().any())
+
+    def next_questions(self, count: int = 1) -> List[int]:
+        """
+        The questions to ask next, highest expected gain first.
+
+        Args:
+            count: Questions wanted (e.g. to query a node concurrently); capped by the remaining budget
+
+        Returns:
+            List[int]: Question indexes; empty when probing should stop
+        """
+        if self.should_stop():
+            return []
+        gain = self.expected_information_gain()
+        count = min(count, self.max_probes - len(self.history))
+        ranked = [int(index) for index in np.argsort(-gain, kind="stable") if gain[index] >= self.min_gain]
+        if not ranked:
+            # Nothing left to tell apart: spread answers over the least asked questions to test the leader's fit
+            allowed = self._allowed()
+            ranked = [int(index) for index in np.argsort(self.asked, kind="stable") if allowed[index]]
+        return ranked[:count]
+
+    def update(self, question: int, embedding: np.ndarray):
+        """
+        Update the belief with one answer.
+
+        Args:
+            question: Index of the question answered
+            embedding: Embedding of the answer
+        """
+        self.answers.setdefault(f"Q{question + 1}", []).append(np.asarray(embedding, dtype=np.float64))
+        fit = fit_references(self.group, {key: np.vstack(vectors) for key, vectors in self.answers.items()})
+        self.log_posterior = _normalize(self.log_prior + fit["log_likelihood"] / self.temperature)
+        self.fit_pvalue = fit["fit_pvalue"]
+        self.asked[question] += 1
+
+        best = int(np.argmax(self.log_posterior))
+        self.history.append({
+            "probe": len(self.history) + 1,
+            "question": f"Q{question + 1}",
+            "best": self.models[best],
+            "posterior": float(np.exp(self.log_posterior[best])),
+            "fit_pvalue": float(self.fit_pvalue[best]),
+            "entropy": float(_entropy(self.log_posterior))
+        })
+
+    def run(self, ask: Callable[[int], Optional[np.ndarray]], batch_size: int = 1) -> Dict:
+        """
+        Probe until the stopping rule fires.
+
+        Args:
+            ask: Returns the embedding of a new answer to a question index, or None on failure
+            batch_size: Questions chosen per round (answers in a round are collected before updating)
+
+        Returns:
+            Dict: best candidate, its posterior and fit p-value, whether it was
+            accepted, answers used and the per-answer history
+        """
+        failures = 0
+        while True:
+            questions = self.next_questions(batch_size)
+            if not questions:
+                break
+            answered = 0
+            for question in questions:
+                embedding = ask(question)
+                if embedding is None:
+                    # Don't ask a question that can't be answered again
+                    self.asked[question] = self.max_per_question
+                    continue
+                self.update(question, embedding)
+                answered += 1
+            failures = 0 if answered else failures + 1
+            if failures >= 3:
+                logger.warning("No answers in three rounds; stopping")
+                break
+
+        best = int(np.argmax(self.log_posterior))
+        return {
+            "best": self.models[best],
+            "posterior": float(np.exp(self.log_posterior[best])),
+            "fit_pvalue": float(self.fit_pvalue[best]),
+            "decided": self.decided,
+            "answers": len(self.history),
+            "history": pd.DataFrame(self.history)
+        }
+
+
+def simulate(library: ReferenceLibrary, results: Dict[str, Dict[str, List[Dict]]], node: str, embedder: str,
+             question_set: str, seed: int = 0, **prober_options) -> Dict:
+    """
+    Replay a stored run's answers through the prober, to see how many it needs.
+
+    Answers to each question are drawn without replacement from the node's
+    stored responses in a random order.
+
+    Returns:
+        Dict: The prober's result for the node
+    """
+    rng = np.random.default_rng(seed)
+    samples = node_samples(results[node], embedder)
+    remaining = {key: list(rng.permutation(len(vectors))) for key, vectors in samples.items()}
+    prober = AdaptiveProber(library.group(embedder, question_set), **prober_options)
+
+    def ask(question: int) -> Optional[np.ndarray]:
+        key = f"Q{question + 1}"
+        if not remaining.get(key):
+            return None
+        return samples[key][remaining[key].pop()]
+
+    return prober.run(ask)
+
+
+def main():
+    """Simulate adaptive probing of the nodes of a stored run."""
+    import argparse
+    from experiment_runner import Config
+
+    config = Config()
+
+    parser = argparse.ArgumentParser(description="Simulate information-gain probe selection on a stored run")
+    parser.add_argument("results_file", help="raw_results pickle/JSON file or spill directory")
+    parser.add_argument("--library", default=config.REFERENCE_LIBRARY, help="Reference library directory")
+    parser.add_argument("--node", action="append", dest="nodes", help="Node to probe (default: all)")
+    parser.add_argument("--embedder", default=config.EMBEDDING_MODEL, help="Embedding model to use")
+    parser.add_argument("--question-set", default=config.EXPERIMENT_MODE, help="Question set of the run")
+    parser.add_argument("--threshold", type=float, default=0.99, help="Posterior at which to stop")
+    parser.add_argument("--max-probes", type=int, default=40, help="Maximum answers per node")
+    parser.add_argument("--temperature", type=float, default=1.0,
+                        help="Log-likelihood tempering (1 for the calibrated fit likelihood)")
+    parser.add_argument("--fit-level", type=float, default=0.05,
+                        help="Smallest fit p-value at which the leading candidate is accepted")
+    parser.add_argument("--verbose", action="store_true", help="Print every probe")
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.results_file):
+        print(f"Error: Results file {args.results_file} not found")
+        return
+
+    library = ReferenceLibrary(args.library)
+    results = load_results(args.results_file)
+    rows = []
+    for node in args.nodes or list(results):
+        outcome = simulate(library, results, node, args.embedder, args.question_set,
+                           threshold=args.threshold, max_probes=args.max_probes, temperature=args.temperature,
+                           fit_level=args.fit_level)
+        full_sweep = sum(len(items) for items in results[node].values())
+        rows.append({"node": node, "best": outcome["best"], "posterior": outcome["posterior"],
+                     "fit_pvalue": outcome["fit_pvalue"], "decided": outcome["decided"], "answers": outcome["answers"], "full_sweep": full_sweep})
+        if args.verbose:
+            print(f"\n{node}:")
+            print(outcome["history"].to_markdown(index=False, floatfmt=".4f"))
+
+    print(pd.DataFrame(rows).to_markdown(index=False, floatfmt=".4f"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Bootstrap Confidence Intervals
+
+Bootstrap confidence intervals (basic by default, percentile on request) for
+the analyzer's point estimates: the Euclidean distance between two models'
+mean embeddings, and each model's mean_stddev and rms_scatter, per question
+and averaged over questions.
+
+Each model-question sample of n responses is resampled with replacement by
+drawing a (B, n) array of resample indices, which is turned into a (B, n)
+count matrix. Every replicate's mean and per-dimension variance is then a
+single matrix product with the (n, d) embeddings, so no (B, n, d) copy is
+ever built. Replicates are produced in chunks to bound memory, the resampled
+means of all models are reused for every model pair, and questions are
+spread over a process pool.
+
+Averages over questions get their interval from the per-replicate averages,
+so replicate b of every question forms one replicate of the average.
+
+Intervals are basic (reflected) bootstrap intervals by default. The plug-in
+statistics are biased in a known direction: noise inflates the distance
+between two sample means, and a resample's duplicated rows deflate its
+standard deviations. Percentile intervals inherit that bias (the interval
+can miss the point estimate entirely), while reflecting the replicates
+around the estimate corrects it to first order. Percentile intervals are
+available with method="percentile".
+
+Since a basic interval is centred on the bias-corrected estimate (twice the
+estimate minus the replicates' mean), not on the plug-in one, each interval
+is reported with that corrected estimate ("<statistic>_corrected"); the
+plug-in estimate can lie outside its own interval when the bias is large
+against the sampling spread.
+"""
+
+import os
+import logging
+import warnings
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Resamples per chunk; a chunk holds (models, chunk, dim) float64 means and variances
+CHUNK_SIZE = 500
+
+
+def resample_counts(n: int, num_resamples: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Draw resample indices and count how often each sample was drawn.
+
+    Returns:
+        np.ndarray: (num_resamples, n) float counts; each row sums to n
+    """
+    indices = rng.integers(0, n, size=(num_resamples, n))
+    offsets = (np.arange(num_resamples) * n)[:, None]
+    return np.bincount((indices + offsets).ravel(), minlength=num_resamples * n).reshape(num_resamples, n).astype(float)
+
+
+def _bootstrap_question(task: Dict) -> Dict[str, np.ndarray]:
+    """Bootstrap replicates of all statistics for one question."""
+    samples = task["samples"]
+    num_resamples, chunk_size = task["num_resamples"], task["chunk_size"]
+    rngs = [np.random.default_rng(seed) for seed in task["seeds"]]
+    num_models = len(samples)
+    pairs = list(itertools.combinations(range(num_models), 2))
+
+    # Center each sample on its own mean: variances are shift invariant and the
+    # replicate means stay accurate in E[x^2] - E[x]^2
+    centers = [sample.mean(axis=0) for sample in samples]
+    centered = [sample - center for sample, center in zip(samples, centers)]
+    squared = [block ** 2 for block in centered]
+
+    estimates = {
+        "distances": np.array([np.linalg.norm(centers[i] - centers[j]) for i, j in pairs]),
+        "mean_stddev": np.array([np.sqrt(np.mean(block, axis=0)).mean() for block in squared]),
+        "rms_scatter": np.array([np.sqrt(np.mean(block)) for block in squared])
+    }
+    distances = np.empty((len(pairs), num_resamples))
+    mean_stddev = np.empty((num_models, num_resamples))
+    rms_scatter = np.empty((num_models, num_resamples))
+
+    for start in range(0, num_resamples, chunk_size):
+        size = min(chunk_size, num_resamples - start)
+        shifts = []
+        for index, sample in enumerate(samples):
+            n = sample.shape[0]
+            weights = resample_counts(n, size, rngs[index]) / n
+            shift = weights @ centered[index]
+            variance = np.maximum(weights @ squared[index] - shift ** 2, 0.0)
+            std_per_dim = np.sqrt(variance)
+            mean_stddev[index, start:start + size] = std_per_dim.mean(axis=1)
+            rms_scatter[index, start:start + size] = np.sqrt(variance.mean(axis=1))
+            shifts.append(shift)
+
+        # ||(c1 + s1) - (c2 + s2)||^2 with the resampled shifts s computed once per model above
+        for pair_index, (i, j) in enumerate(pairs):
+            base = centers[i] - centers[j]
+            delta = shifts[i] - shifts[j]
+            squared_distance = base @ base + 2 * delta @ base + np.einsum("bd,bd->b", delta, delta)
+            distances[pair_index, start:start + size] = np.sqrt(np.maximum(squared_distance, 0.0))
+
+    return {"distances": distances, "mean_stddev": mean_stddev, "rms_scatter": rms_scatter, "estimates": estimates}
+
+
+def bootstrap_replicates(samples: Dict[str, Dict[str, np.ndarray]], models: List[str], questions: List[str],
+                         num_resamples: int = 2000, workers: Optional[int] = None, seed: int = 0,
+                         chunk_size: int = CHUNK_SIZE) -> Dict:
+    """
+    Bootstrap replicates of the distances and consistency metrics.
+
+    Args:
+        samples: Embedding matrices {model: {question: (n, d) array}}
+        models: Models to include
+        questions: Questions to include
+        num_resamples: Bootstrap resamples per model-question sample
+        workers: Worker processes (None = one per CPU, 1 = run in this process)
+        seed: Base random seed
+        chunk_size: Resamples generated at a time
+
+    Returns:
+        Dict: "pairs" (model pairs), "distances" (Q, P, B) and "mean_stddev",
+        "rms_scatter" (Q, M, B) replicate arrays, and the full-sample values in
+        "estimates" ((Q, P) and (Q, M)); NaN where a sample is missing
+    """
+    pairs = list(itertools.combinations(models, 2))
+    replicates = {
+        "models": list(models),
+        "questions": list(questions),
+        "pairs": pairs,
+        "distances": np.full((len(questions), len(pairs), num_resamples), np.nan),
+        "mean_stddev": np.full((len(questions), len(models), num_resamples), np.nan),
+        "rms_scatter": np.full((len(questions), len(models), num_resamples), np.nan),
+        "estimates": {
+            "distances": np.full((len(questions), len(pairs)), np.nan),
+            "mean_stddev": np.full((len(questions), len(models)), np.nan),
+            "rms_scatter": np.full((len(questions), len(models)), np.nan)
+        }
+    }
+
+    tasks = []
+    for q_index, question in enumerate(questions):
+        present = [model for model in models if samples.get(model, {}).get(question) is not None
+                   and len(samples[model][question]) > 0]
+        if not present:
+            continue
+        tasks.append({
+            "question": q_index,
+            "models": present,
+            "samples": [np.asarray(samples[model][question], dtype=np.float64) for model in present],
+            # One stream per model, so a model's replicates don't depend on which others are present
+            "seeds": [np.random.SeedSequence(seed, spawn_key=(q_index, models.index(model))) for model in present],
+            "num_resamples": num_resamples,
+            "chunk_size": chunk_size
+        })
+
+    workers = workers or os.cpu_count() or 1
+    logger.info(f"Bootstrap: {num_resamples} resamples for {len(tasks)} questions, {workers} worker(s)")
+
+    if workers == 1 or len(tasks) <= 1:
+        outputs = [_bootstrap_question(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            outputs = list(executor.map(_bootstrap_question, tasks))
+
+    for task, output in zip(tasks, outputs):
+        q_index = task["question"]
+        model_index = [models.index(model) for model in task["models"]]
+        pair_index = [pairs.index(pair) for pair in itertools.combinations(task["models"], 2)]
+        for name, index in (("mean_stddev", model_index), ("rms_scatter", model_index), ("distances", pair_index)):
+            replicates[name][q_index, index] = output[name]
+            replicates["estimates"][name][q_index, index] = output["estimates"][name]
+
+    return replicates
+
+
+def _interval(replicates: np.ndarray, estimate: np.ndarray, confidence: float, method: str) -> np.ndarray:
+    """Interval along the last axis of the replicates: (..., 2) lower and upper bounds, clipped at 0."""
+    alpha = (1 - confidence) / 2
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        low, high = np.nanquantile(replicates, [alpha, 1 - alpha], axis=-1)
+    if method == "basic":
+        low, high = 2 * estimate - high, 2 * estimate - low
+    elif method != "percentile":
+        raise ValueError(f"Unknown bootstrap interval method: {method}")
+    return np.maximum(np.stack([low, high], axis=-1), 0.0)
+
+
+def _corrected(replicates: np.ndarray, estimate: np.ndarray) -> np.ndarray:
+    """Bias-corrected estimate along the last axis of the replicates, clipped at 0."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.maximum(2 * estimate - np.nanmean(replicates, axis=-1), 0.0)
+
+
+def confidence_intervals(replicates: Dict, confidence: float = 0.95, method: str = "basic") -> Dict[str, pd.DataFrame]:
+    """
+    Confidence intervals from bootstrap replicates.
+
+    Args:
+        replicates: Output of bootstrap_replicates
+        confidence: Interval coverage
+        method: "basic" (reflected around the estimate) or "percentile"
+
+    Returns:
+        Dict[str, pd.DataFrame]:
+            "distances": distance_corrected, ci_low/ci_high per (question, model1, model2)
+            "consistency": mean_stddev and rms_scatter bias-corrected estimates and
+                intervals per (model, question)
+            "pair_summary": the same for each pair's distance averaged over questions
+            "model_summary": the same for each model's metrics averaged over questions
+    """
+    questions, models, pairs = replicates["questions"], replicates["models"], replicates["pairs"]
+    distances = replicates["distances"]
+    mean_stddev, rms_scatter = replicates["mean_stddev"], replicates["rms_scatter"]
+    estimates = replicates["estimates"]
+
+    distance_ci = _interval(distances, estimates["distances"], confidence, method)
+    mean_stddev_ci = _interval(mean_stddev, estimates["mean_stddev"], confidence, method)
+    rms_scatter_ci = _interval(rms_scatter, estimates["rms_scatter"], confidence, method)
+    distance_corrected = _corrected(distances, estimates["distances"])
+    mean_stddev_corrected = _corrected(mean_stddev, estimates["mean_stddev"])
+    rms_scatter_corrected = _corrected(rms_scatter, estimates["rms_scatter"])
+
+    distance_rows, consistency_rows = [], []
+    for q_index, question in enumerate(questions):
+        for p_index, (model1, model2) in enumerate(pairs):
+            if np.isnan(distances[q_index, p_index, 0]):
+                continue
+            distance_rows.append({
+                "question": question,
+                "model1": model1,
+                "model2": model2,
+                "distance_corrected": distance_corrected[q_index, p_index],
+                "ci_low": distance_ci[q_index, p_index, 0],
+                "ci_high": distance_ci[q_index, p_index, 1]
+            })
+        for m_index, model in enumerate(models):
+            if np.isnan(mean_stddev[q_index, m_index, 0]):
+                continue
+            consistency_rows.append({
+                "model": model,
+                "question": question,
+                "mean_stddev_corrected": mean_stddev_corrected[q_index, m_index],
+                "mean_stddev_ci_low": mean_stddev_ci[q_index, m_index, 0],
+                "mean_stddev_ci_high": mean_stddev_ci[q_index, m_index, 1],
+                "rms_scatter_corrected": rms_scatter_corrected[q_index, m_index],
+                "rms_scatter_ci_low": rms_scatter_ci[q_index, m_index, 0],
+                "rms_scatter_ci_high": rms_scatter_ci[q_index, m_index, 1]
+            })
+
+    # Replicate b of the average is the average of replicate b over the questions
+    with warnings.catch_warnings():
+        # Questions missing for every model leave all-NaN slices
+        warnings.simplefilter("ignore", RuntimeWarning)
+        averages = {name: (np.nanmean(replicates[name], axis=0), np.nanmean(estimates[name], axis=0))
+                    for name in ("distances", "mean_stddev", "rms_scatter")}
+    pair_average_ci = _interval(*averages["distances"], confidence, method)
+    mean_stddev_average_ci = _interval(*averages["mean_stddev"], confidence, method)
+    rms_scatter_average_ci = _interval(*averages["rms_scatter"], confidence, method)
+    pair_average_corrected = _corrected(*averages["distances"])
+    mean_stddev_average_corrected = _corrected(*averages["mean_stddev"])
+    rms_scatter_average_corrected = _corrected(*averages["rms_scatter"])
+
+    pair_summary = pd.DataFrame([
+        {"model1": model1, "model2": model2,
+         "distance_corrected": pair_average_corrected[p_index],
+         "ci_low": pair_average_ci[p_index, 0], "ci_high": pair_average_ci[p_index, 1]}
+        for p_index, (model1, model2) in enumerate(pairs)
+    ])
+    model_summary = pd.DataFrame([
+        {"model": model,
+         "mean_stddev_corrected": mean_stddev_average_corrected[m_index],
+         "mean_stddev_ci_low": mean_stddev_average_ci[m_index, 0],
+         "mean_stddev_ci_high": mean_stddev_average_ci[m_index, 1],
+         "rms_scatter_corrected": rms_scatter_average_corrected[m_index],
+         "rms_scatter_ci_low": rms_scatter_average_ci[m_index, 0],
+         "rms_scatter_ci_high": rms_scatter_average_ci[m_index, 1]}
+        for m_index, model in enumerate(models)
+    ])
+
+    return {
+        "distances": pd.DataFrame(distance_rows),
+        "consistency": pd.DataFrame(consistency_rows),
+        "pair_summary": pair_summary.dropna(),
+        "model_summary": model_summary.dropna()
+    }
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Node Capacity Discovery
+
+Finds how many concurrent requests each node can serve, so the runner can size
+its per-node concurrency instead of sharing one hand-tuned MAX_WORKERS.
+
+The probe first asks the node itself: llama-server reports its parallel slot
+count on /props and /slots, and LlamaEdge reports model settings on /v1/info.
+When no slot count is exposed, it runs a short ramp test, doubling concurrency
+until throughput stops improving.
+"""
+
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+import requests
+
+if TYPE_CHECKING:
+    from experiment_runner import Config
+
+logger = logging.getLogger(__name__)
+
+# Metadata endpoints queried in order, and the keys that carry a slot count
+METADATA_ENDPOINTS = ["/props", "/slots", "/v1/info", "/v1/models"]
+SLOT_KEYS = ("total_slots", "n_parallel", "parallel", "n_slots")
+
+
+def _find_slot_count(metadata: Any) -> Optional[int]:
+    """Search a metadata document (recursively) for a parallel slot count."""
+    if isinstance(metadata, dict):
+        for key in SLOT_KEYS:
+            value = metadata.get(key)
+            if isinstance(value, (int, str)) and str(value).isdigit() and int(value) > 0:
+                return int(value)
+        for value in metadata.values():
+            found = _find_slot_count(value)
+            if found:
+                return found
+    elif isinstance(metadata, list):
+        for value in metadata:
+            found = _find_slot_count(value)
+            if found:
+                return found
+    return None
+
+
+class CapacityProbe:
+    """Discovers the concurrency limit of each node."""
+
+    def __init__(self, config: "Config", session: Optional[requests.Session] = None):
+        self.config = config
+        self.session = session or requests.Session()
+
+    def query_metadata(self, base_url: str) -> Dict[str, Any]:
+        """
+        Fetch whatever capacity metadata the node exposes.
+
+        Args:
+            base_url: Base URL of the node's API
+
+        Returns:
+            Dict: Mapping of endpoint path to its JSON document, for endpoints that answered
+        """
+        metadata = {}
+        for path in METADATA_ENDPOINTS:
+            try:
+                response = self.session.get(f"{base_url}{path}", timeout=self.config.TIMEOUT)
+                if response.status_code == 200:
+                    metadata[path] = response.json()
+            except (requests.exceptions.RequestException, ValueError):
+                continue
+        return metadata
+
+    def _timed_request(self, base_url: str) -> bool:
+        """Send one short completion; return True on success."""
+        payload = {
+            "messages": [
+                {"role": "system", "content": self.config.SYSTEM_PROMPT},
+                {"role": "user", "content": "Count from one to ten."}
+            ],
+            "max_tokens": self.config.CAPACITY_RAMP_TOKENS
+        }
+        try:
+            response = self.session.post(
+                f"{base_url}/v1/chat/completions",
+                headers={"Content-Type": "application/json"},
+                json=payload,
+                timeout=self.config.TIMEOUT
+            )
+            return response.status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    def ramp_test(self, name: str, base_url: str) -> int:
+        """
+        Double concurrency until throughput stops improving.
+
+        Levels are 1, 2, 4, ... and finally MAX_WORKERS itself. Each level
+        sends two short requests per worker. The level is accepted if every
+        request succeeded and throughput improved by at least
+        CAPACITY_RAMP_MIN_GAIN over the previous level.
+
+        Args:
+            name: Node name, for logging
+            base_url: Base URL of the node's API
+
+        Returns:
+            int: The best concurrency level found (at least 1)
+        """
+        best_level, best_throughput = 1, 0.0
+        level = 1
+
+        while True:
+            num_requests = 2 * level
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=level) as executor:
+                outcomes = list(executor.map(lambda _: self._timed_request(base_url), range(num_requests)))
+            elapsed = time.perf_counter() - start
+            throughput = num_requests / elapsed if elapsed > 0 else 0.0
+
+            logger.info(f"Ramp test {name}: concurrency {level} -> {throughput:.2f} requests/s, "
+                        f"{outcomes.count(False)} failures")
+
+            if not all(outcomes) or throughput < best_throughput * (1 + self.config.CAPACITY_RAMP_MIN_GAIN):
+                break
+
+            best_level, best_throughput = level, throughput
+            if level >= self.config.MAX_WORKERS:
+                break
+            level = min(2 * level, self.config.MAX_WORKERS)
+
+        return best_level
+
+    def discover(self, name: str, base_url: str) -> Dict[str, Any]:
+        """
+        Determine a node's concurrency limit.
+
+        Args:
+            name: Node name
+            base_url: Base URL of the node's API
+
+        Returns:
+            Dict: "concurrency" (capped at MAX_WORKERS), "source" ("slots" or "ramp")
+            and the raw "metadata" documents
+        """
+        metadata = self.query_metadata(base_url)
+        slots = _find_slot_count(metadata)
+        if not slots and isinstance(metadata.get("/slots"), list):
+            # llama-server lists one entry per parallel slot
+            slots = len(metadata["/slots"])
+
+        if slots:
+            source = "slots"
+            concurrency = slots
+        else:
+            source = "ramp"
+            concurrency = self.ramp_test(name, base_url)
+
+        concurrency = max(1, min(concurrency, self.config.MAX_WORKERS))
+        logger.info(f"Capacity of {name}: {concurrency} concurrent requests (from {source})")
+
+        return {"concurrency": concurrency, "source": source, "metadata": metadata}
+
+
+def main():
+    """Print the discovered capacity of every configured model node."""
+    from experiment_runner import Config
+
+    config = Config()
+    probe = CapacityProbe(config)
+
+    print("\n=== Node Capacity ===")
+    for model, url in config.MODELS.items():
+        capacity = probe.discover(model, url)
+        print(f"{model}: {capacity['concurrency']} concurrent requests (from {capacity['source']})")
+
+
+if __name__ == "__main__":
+    main()
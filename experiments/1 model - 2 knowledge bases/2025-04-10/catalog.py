@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+"""
+Experiment Catalog
+
+Indexes every stored run into one SQLite file so runs can be found and
+combined by what they contain rather than by where they were saved:
+
+- runs: one row per results file or spill directory, with its experiment
+  folder, format, timestamp, checksum and the Config of the folder's
+  experiment_runner.py (literal class attributes, read without importing it;
+  the script may have changed after the run). The run's mode is inferred
+  from its node names (MODELS or KB_URLS keys), not from that Config's
+  current EXPERIMENT_MODE, and left NULL when the names match neither
+- run_embedders: the embedding models a run's responses were embedded with
+  (JSON copies record that, without the vectors)
+- run_nodes: per run and node, a fingerprint of its responses; a node whose
+  fingerprint is already indexed from another file (the JSON copy of a
+  pickle, model_results/ per-model files) is recorded as a duplicate and its
+  responses are not indexed again
+- responses: one row per (run, node, question, repeat) with the response's
+  content hash, latency, truncation, whether the file holds its embedding
+  vector and an embedding pointer: the item's position in its question's
+  list, resolved by loading the run
+
+Queries filter on indexed columns and return rows, and `load_selection`
+turns a query back into the usual {node: {question: [items]}} structure, so
+the analyzer can run on "every gemma-2-9b run embedded with gte-qwen2"
+instead of a file path.
+"""
+
+import os
+import re
+import ast
+import json
+import sqlite3
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from reembed import MODEL_RESULTS_PATTERN, content_hash, file_checksum
+from reference_library import load_results
+from result_store import is_spill_directory
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    checksum TEXT,
+    format TEXT,
+    experiment TEXT,
+    mode TEXT,
+    created TEXT,
+    ingested TEXT,
+    embedding_model TEXT,
+    num_repeats INTEGER,
+    temperature REAL,
+    max_tokens INTEGER,
+    config TEXT
+);
+CREATE TABLE IF NOT EXISTS run_embedders (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    embedding_model TEXT NOT NULL,
+    PRIMARY KEY (run_id, embedding_model)
+);
+CREATE TABLE IF NOT EXISTS run_nodes (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    node TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    num_responses INTEGER,
+    duplicate_of INTEGER,
+    PRIMARY KEY (run_id, node)
+);
+CREATE TABLE IF NOT EXISTS responses (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    node TEXT NOT NULL,
+    question TEXT NOT NULL,
+    repeat INTEGER,
+    item_index INTEGER NOT NULL,
+    response_hash TEXT,
+    has_embedding INTEGER,
+    latency REAL,
+    truncated INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_runs_experiment ON runs(experiment);
+CREATE INDEX IF NOT EXISTS idx_runs_embedding_model ON runs(embedding_model);
+CREATE INDEX IF NOT EXISTS idx_run_embedders_model ON run_embedders(embedding_model);
+CREATE INDEX IF NOT EXISTS idx_run_nodes_node ON run_nodes(node);
+CREATE INDEX IF NOT EXISTS idx_run_nodes_fingerprint ON run_nodes(fingerprint);
+CREATE INDEX IF NOT EXISTS idx_responses_node_question ON responses(node, question);
+CREATE INDEX IF NOT EXISTS idx_responses_run ON responses(run_id, node, question);
+CREATE INDEX IF NOT EXISTS idx_responses_hash ON responses(response_hash);
+"""
+
+# Folders results are written to inside an experiment folder
+RESULT_FOLDERS = ("results", "model_results", "partial_results")
+RAW_RESULTS_PATTERN = re.compile(r"^raw_results_\d{8}_\d{6}\.(pkl|json)$")
+TIMESTAMP_PATTERN = re.compile(r"(\d{8}_\d{6})")
+
+# Filters accepted by Catalog.query, and the column each one matches
+FILTERS = {
+    "run": "runs.path",
+    "experiment": "runs.experiment",
+    "mode": "runs.mode",
+    "format": "runs.format",
+    "node": "responses.node",
+    "question": "responses.question",
+    "repeat": "responses.repeat",
+    "response_hash": "responses.response_hash"
+}
+
+
+def experiment_folder(path: str) -> str:
+    """The experiment folder a results file or spill directory belongs to."""
+    folder = os.path.dirname(os.path.abspath(path.rstrip("/")))
+    while os.path.basename(folder) in RESULT_FOLDERS:
+        folder = os.path.dirname(folder)
+    return folder
+
+
+def runner_config(folder: str) -> Dict:
+    """
+    Literal Config attributes of a folder's experiment_runner.py.
+
+    The script is parsed, not imported, so old folders with other
+    dependencies can be read too; attributes that aren't literals are left out.
+    """
+    script = os.path.join(folder, "experiment_runner.py")
+    if not os.path.exists(script):
+        return {}
+    with open(script) as f:
+        tree = ast.parse(f.read(), filename=script)
+
+    config = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ClassDef) and node.name == "Config":
+            for statement in node.body:
+                if isinstance(statement, ast.Assign) and len(statement.targets) == 1 \
+                        and isinstance(statement.targets[0], ast.Name):
+                    try:
+                        config[statement.targets[0].id] = ast.literal_eval(statement.value)
+                    except ValueError:
+                        continue
+    return config
+
+
+def run_mode(config: Dict, nodes) -> Optional[str]:
+    """
+    "models" or "knowledge_bases": the Config mapping (MODELS or KB_URLS) that names
+    every node of the run. None if neither or both do.
+    """
+    nodes = set(nodes)
+    modes = [mode for mode, key in (("models", "MODELS"), ("knowledge_bases", "KB_URLS"))
+             if nodes and nodes <= set(config.get(key) or {})]
+    return modes[0] if len(modes) == 1 else None
+
+
+def run_questions(config: Dict, mode: Optional[str]) -> Optional[List[str]]:
+    """Question texts a folder's Config gives for a mode (QUESTIONS in folders without modes); None if unknown."""
+    if "QUESTIONS" in config:
+        return config["QUESTIONS"]
+    return config.get({"models": "MODEL_QUESTIONS", "knowledge_bases": "KB_QUESTIONS"}.get(mode))
+
+
+def results_format(path: str) -> Optional[str]:
+    """"spill", "raw_results" or "model_results" for a stored run; None for other files."""
+    if is_spill_directory(path):
+        return "spill"
+    name = os.path.basename(path)
+    if RAW_RESULTS_PATTERN.match(name):
+        return "raw_results"
+    if MODEL_RESULTS_PATTERN.match(name) and os.path.basename(os.path.dirname(path)) == "model_results":
+        return "model_results"
+    return None
+
+
+def find_runs(paths: List[str]) -> List[str]:
+    """
+    Stored runs under the given files or directories.
+
+    Pickles come before their JSON copies and raw results before per-model
+    files, so duplicates are recognised on the copy rather than the original.
+    """
+    found = []
+    for path in paths:
+        if results_format(path):
+            found.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            for name in sorted(dirs):
+                if is_spill_directory(os.path.join(root, name)):
+                    found.append(os.path.join(root, name))
+            dirs[:] = [name for name in dirs if not is_spill_directory(os.path.join(root, name))]
+            found.extend(os.path.join(root, name) for name in sorted(files) if results_format(os.path.join(root, name)))
+
+    priority = {"spill": 0, "raw_results": 1, "model_results": 2}
+    return sorted(dict.fromkeys(found), key=lambda run: (priority[results_format(run)], not run.endswith(".pkl"), run))
+
+
+def node_fingerprint(node_results: Dict[str, List[Dict]]) -> str:
+    """Hash of a node's (question, repeat, response) triples, independent of item order."""
+    triples = sorted(f"{question}\t{item.get('repeat')}\t{content_hash(item.get('response') or '')}"
+                     for question, items in node_results.items() for item in items)
+    return hashlib.sha256("\n".join(triples).encode("utf-8")).hexdigest()
+
+
+def _has_vector(item: Dict) -> bool:
+    """True if the item carries an embedding vector (JSON copies only record that one existed)."""
+    if item.get("embeddings"):
+        return any(vector is not None and len(vector) > 0 for vector in item["embeddings"].values())
+    vector = item.get("embedding")
+    return vector is not None and len(vector) > 0
+
+
+def _run_embedders(results: Dict[str, Dict[str, List[Dict]]], config: Dict, path: str) -> List[str]:
+    if is_spill_directory(path):
+        with open(os.path.join(path, "manifest.json")) as f:
+            return json.load(f)["embedding_models"]
+    embedders = []
+    for node_results in results.values():
+        for items in node_results.values():
+            for item in items:
+                if item.get("embeddings"):
+                    embedders.extend(model for model in item["embeddings"] if model not in embedders)
+                elif (_has_vector(item) or item.get("has_embedding")) and not embedders \
+                        and config.get("EMBEDDING_MODEL"):
+                    embedders.append(config["EMBEDDING_MODEL"])
+    return embedders
+
+
+class Catalog:
+    """SQLite index of stored runs."""
+
+    def __init__(self, path: str = "./catalog.sqlite"):
+        """
+        Open a catalog, creating it if needed.
+
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def ingest(self, run_path: str, force: bool = False) -> Optional[int]:
+        """
+        Index one stored run.
+
+        A run already indexed with the same checksum is skipped unless `force`;
+        a changed file is re-indexed.
+
+        Args:
+            run_path: Results file or spill directory
+            force: Re-index even if unchanged
+
+        Returns:
+            Optional[int]: The run's id, None if it was skipped
+        """
+        path = os.path.abspath(run_path.rstrip("/"))
+        checksum = (file_checksum(os.path.join(path, "manifest.json")) if is_spill_directory(path)
+                    else file_checksum(path))
+        existing = self.connection.execute("SELECT run_id, checksum FROM runs WHERE path = ?", (path,)).fetchone()
+        if existing and existing["checksum"] == checksum and not force:
+            logger.info(f"{path} is already indexed")
+            return None
+
+        results = load_results(path)
+        folder = experiment_folder(path)
+        config = runner_config(folder)
+        timestamp = TIMESTAMP_PATTERN.search(os.path.basename(path))
+        created = (datetime.strptime(timestamp.group(1), "%Y%m%d_%H%M%S") if timestamp
+                   else datetime.fromtimestamp(os.path.getmtime(path))).isoformat()
+        embedders = _run_embedders(results, config, path)
+
+        with self.connection:
+            if existing:
+                self.connection.execute("DELETE FROM runs WHERE run_id = ?", (existing["run_id"],))
+            cursor = self.connection.execute(
+                "INSERT INTO runs (path, checksum, format, experiment, mode, created, ingested, embedding_model, "
+                "num_repeats, temperature, max_tokens, config) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, checksum, results_format(path), os.path.join(os.path.basename(os.path.dirname(folder)),
+                                                                    os.path.basename(folder)),
+                 run_mode(config, results), created, datetime.now().isoformat(),
+                 embedders[0] if embedders else None, config.get("NUM_REPEATS"), config.get("TEMPERATURE"),
+                 config.get("MAX_TOKENS"), json.dumps(config, default=str)))
+            run_id = cursor.lastrowid
+            self.connection.executemany("INSERT INTO run_embedders VALUES (?, ?)",
+                                        [(run_id, embedder) for embedder in embedders])
+
+            indexed = 0
+            for node, node_results in results.items():
+                fingerprint = node_fingerprint(node_results)
+                count = sum(len(items) for items in node_results.values())
+                original = self.connection.execute(
+                    "SELECT run_id FROM run_nodes WHERE fingerprint = ? AND duplicate_of IS NULL AND run_id != ?",
+                    (fingerprint, run_id)).fetchone()
+                self.connection.execute("INSERT INTO run_nodes VALUES (?, ?, ?, ?, ?)",
+                                        (run_id, node, fingerprint, count, original["run_id"] if original else None))
+                if original:
+                    logger.info(f"{path}: {node} duplicates run {original['run_id']}; responses not indexed again")
+                    continue
+                self.connection.executemany(
+                    "INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._response_rows(run_id, node, node_results))
+                indexed += count
+
+        logger.info(f"Indexed {path} as run {run_id}: {len(results)} nodes, {indexed} responses")
+        return run_id
+
+    @staticmethod
+    def _response_rows(run_id: int, node: str, node_results: Dict[str, List[Dict]]) -> Iterator[Tuple]:
+        for question, items in node_results.items():
+            for index, item in enumerate(items):
+                response = item.get("response")
+                yield (run_id, node, question, item.get("repeat"), index,
+                       content_hash(response) if response is not None else None,
+                       int(_has_vector(item)), item.get("latency"),
+                       None if item.get("truncated") is None else int(item["truncated"]))
+
+    def ingest_all(self, paths: List[str], force: bool = False) -> List[int]:
+        """Index every stored run under the given files or directories; returns the new run ids."""
+        run_ids = []
+        for run_path in find_runs(paths):
+            try:
+                run_id = self.ingest(run_path, force)
+            except Exception as e:
+                logger.error(f"Could not index {run_path}: {str(e)}")
+                continue
+            if run_id is not None:
+                run_ids.append(run_id)
+        return run_ids
+
+    def _where(self, filters: Dict) -> Tuple[str, List]:
+        """SQL conditions and parameters for query filters; list values match any of their items."""
+        clauses, parameters = [], []
+        for name, value in filters.items():
+            if value is None:
+                continue
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            if name in ("since", "until") and len(values) != 1:
+                raise ValueError(f"Filter {name!r} takes one value, got {len(values)}")
+            if name == "embedder":
+                clauses.append(f"runs.run_id IN (SELECT run_id FROM run_embedders WHERE embedding_model IN "
+                               f"({', '.join('?' * len(values))}))")
+            elif name == "since":
+                clauses.append("runs.created >= ?")
+            elif name == "until":
+                clauses.append("runs.created < ?")
+            elif name in FILTERS:
+                clauses.append(f"{FILTERS[name]} IN ({', '.join('?' * len(values))})")
+            else:
+                raise ValueError(f"Unknown filter {name!r}; use one of {sorted(FILTERS) + ['embedder', 'since', 'until']}")
+            parameters.extend(os.path.abspath(item) if name == "run" else item for item in values)
+        return (" AND ".join(clauses) or "1"), parameters
+
+    def query(self, with_embeddings: bool = False, **filters) -> pd.DataFrame:
+        """
+        Indexed responses matching the filters.
+
+        Args:
+            with_embeddings: Only responses whose embedding vector is stored
+            **filters: Column filters (run, experiment, mode, format, node, question,
+                repeat, response_hash, embedder, since, until); a list matches any value
+
+        Returns:
+            pd.DataFrame: One row per response, with its run's path and experiment
+        """
+        where, parameters = self._where(filters)
+        if with_embeddings:
+            where += " AND responses.has_embedding = 1"
+        return pd.read_sql_query(
+            "SELECT runs.path, runs.experiment, runs.created, responses.* FROM responses "
+            f"JOIN runs ON runs.run_id = responses.run_id WHERE {where} "
+            "ORDER BY runs.created, responses.node, responses.question, responses.item_index",
+            self.connection, params=parameters)
+
+    def runs(self, **filters) -> pd.DataFrame:
+        """
+        Runs with at least one response matching the filters.
+
+        Returns:
+            pd.DataFrame: One row per run, with its nodes and embedding models
+        """
+        where, parameters = self._where(filters)
+        return pd.read_sql_query(
+            "SELECT runs.run_id, runs.path, runs.experiment, runs.format, runs.mode, runs.created, "
+            "runs.num_repeats, runs.max_tokens, "
+            "(SELECT group_concat(node, ', ') FROM run_nodes WHERE run_nodes.run_id = runs.run_id) AS nodes, "
+            "(SELECT group_concat(embedding_model, ', ') FROM run_embedders "
+            " WHERE run_embedders.run_id = runs.run_id) AS embedders, "
+            "COUNT(*) AS responses FROM responses JOIN runs ON runs.run_id = responses.run_id "
+            f"WHERE {where} GROUP BY runs.run_id ORDER BY runs.created",
+            self.connection, params=parameters)
+
+
+def load_selection(catalog: Catalog, with_embeddings: bool = True,
+                   **filters) -> Dict[str, Dict[str, List[Dict]]]:
+    """
+    Load the responses a query selects as {node: {question: [items]}}.
+
+    Each matching run is loaded once and its items are picked by their
+    embedding pointer. Nodes that appear in several runs are kept apart as
+    "node (run timestamp)".
+
+    Args:
+        catalog: Catalog to query
+        with_embeddings: Only responses whose embedding vector is stored
+        **filters: Filters as for Catalog.query
+
+    Returns:
+        Dict: Selected results in the runner's usual structure
+    """
+    rows = catalog.query(with_embeddings=with_embeddings, **filters)
+    runs_per_node = rows.groupby("node")["path"].nunique()
+    results: Dict[str, Dict[str, List[Dict]]] = {}
+    for path, run_rows in rows.groupby("path", sort=False):
+        loaded = load_results(path)
+        for (node, question), pointer_rows in run_rows.groupby(["node", "question"], sort=False):
+            label = node
+            if runs_per_node[node] > 1:
+                label = f"{node} ({run_rows['created'].iloc[0].replace('T', ' ')})"
+            items = loaded[node][question]
+            results.setdefault(label, {}).setdefault(question, []).extend(
+                items[index] for index in pointer_rows["item_index"])
+
+    logger.info(f"Selected {len(rows)} responses from {rows['path'].nunique()} runs")
+    return results
+
+
+def parse_filters(expressions: List[str]) -> Dict[str, List[str]]:
+    """Parse repeated "name=value" command-line filters into query keyword arguments."""
+    filters: Dict[str, List] = {}
+    for expression in expressions or []:
+        name, _, value = expression.partition("=")
+        if not value:
+            raise ValueError(f"Filter {expression!r} should look like name=value")
+        filters.setdefault(name.strip(), []).append(int(value) if name.strip() == "repeat" else value.strip())
+    return filters
+
+
+def main():
+    """Index stored runs and query the catalog."""
+    import argparse
+    from experiment_runner import Config
+
+    config = Config()
+
+    parser = argparse.ArgumentParser(description="Index stored runs into a SQLite catalog and query it")
+    parser.add_argument("--catalog", default=config.CATALOG_FILE, help="Catalog database file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest = subparsers.add_parser("ingest", help="Index the runs under files or directories")
+    ingest.add_argument("paths", nargs="+", help="Results files, spill directories or folders to search")
+    ingest.add_argument("--force", action="store_true", help="Re-index runs that are already indexed")
+
+    for name, help_text in (("runs", "List runs matching filters"), ("query", "List responses matching filters")):
+        command = subparsers.add_parser(name, help=help_text)
+        command.add_argument("--where", action="append", metavar="NAME=VALUE",
+                             help="Filter, e.g. node=gemma-2-9b or embedder=gte-qwen2 (repeatable)")
+    subparsers.choices["query"].add_argument("--limit", type=int, default=50, help="Rows to print")
+
+    args = parser.parse_args()
+
+    catalog = Catalog(args.catalog)
+    try:
+        if args.command == "ingest":
+            run_ids = catalog.ingest_all(args.paths, args.force)
+            print(f"Indexed {len(run_ids)} runs into {args.catalog}")
+        elif args.command == "runs":
+            print(catalog.runs(**parse_filters(args.where)).to_markdown(index=False))
+        else:
+            rows = catalog.query(**parse_filters(args.where))
+            print(rows.drop(columns=["path"]).head(args.limit).to_markdown(index=False))
+            print(f"\n{len(rows)} responses in {rows['path'].nunique()} runs")
+    finally:
+        catalog.close()
+
+
+if __name__ == "__main__":
+    main()
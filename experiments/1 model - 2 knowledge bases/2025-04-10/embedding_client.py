@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Embedding Client
+
+Thin client for an OpenAI-style /v1/embeddings endpoint that returns vectors
+as float32 numpy arrays.
+
+It asks the server for `encoding_format: base64` and decodes each vector with
+np.frombuffer straight into a preallocated float32 buffer, so no per-float
+Python objects are created and the payload is roughly 3x smaller than a JSON
+float array. Servers that reject or ignore the parameter are detected on the
+first call and served through the JSON float-array path from then on.
+"""
+
+import base64
+import logging
+import threading
+from typing import List, Optional
+
+import numpy as np
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Embedding servers return little-endian float32 when asked for base64
+BASE64_DTYPE = np.dtype("<f4")
+
+
+class EmbeddingClient:
+    """Embeds texts through one /v1/embeddings endpoint."""
+
+    def __init__(self, base_url: str, model: str, session: Optional[requests.Session] = None,
+                 timeout: float = 16, prefer_base64: bool = True):
+        """
+        Initialize the client.
+
+        Args:
+            base_url: Base URL of the embedding server
+            model: Embedding model name sent with each request
+            session: Optional shared HTTP session
+            timeout: Request timeout in seconds
+            prefer_base64: Request base64-encoded vectors when the server supports them
+        """
+        self.base_url = base_url
+        self.model = model
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        # None until the first response tells us whether the server honours base64
+        self.base64_supported = None if prefer_base64 else False
+        self._lock = threading.Lock()
+
+    def _post(self, texts: List[str], use_base64: bool) -> requests.Response:
+        payload = {
+            "model": self.model,
+            "input": texts
+        }
+        if use_base64:
+            payload["encoding_format"] = "base64"
+        return self.session.post(
+            f"{self.base_url}/v1/embeddings",
+            headers={
+                "accept": "application/json",
+                "Content-Type": "application/json"
+            },
+            json=payload,
+            timeout=self.timeout
+        )
+
+    def _set_base64_support(self, supported: bool):
+        with self._lock:
+            if self.base64_supported is None:
+                self.base64_supported = supported
+                logger.info(f"Base64 embeddings {'supported' if supported else 'not supported'} "
+                            f"by {self.base_url}, model {self.model}")
+
+    def embed(self, texts: List[str], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Embed a batch of texts.
+
+        Args:
+            texts: Texts to embed
+            out: Optional preallocated float32 array of shape (len(texts), dim)
+                to decode into
+
+        Returns:
+            np.ndarray: float32 array of shape (len(texts), dim), in input order
+
+        Raises:
+            requests.exceptions.RequestException: On HTTP errors
+            KeyError, IndexError, ValueError: On malformed responses
+        """
+        use_base64 = self.base64_supported is not False
+        response = self._post(texts, use_base64)
+
+        if use_base64 and response.status_code in (400, 422):
+            # Server rejected encoding_format; fall back to JSON floats
+            self._set_base64_support(False)
+            use_base64 = False
+            response = self._post(texts, use_base64)
+
+        response.raise_for_status()
+        data = response.json()["data"]
+        if len(data) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(data)}")
+
+        for position, entry in enumerate(data):
+            vector = entry["embedding"]
+            row = entry.get("index", position)
+
+            if isinstance(vector, str):
+                if use_base64:
+                    self._set_base64_support(True)
+                decoded = np.frombuffer(base64.b64decode(vector), dtype=BASE64_DTYPE)
+            else:
+                if use_base64:
+                    # Server ignored encoding_format and sent floats anyway
+                    self._set_base64_support(False)
+                decoded = np.asarray(vector, dtype=np.float32)
+
+            if out is None:
+                out = np.empty((len(texts), decoded.shape[0]), dtype=np.float32)
+            out[row] = decoded
+
+        return out
+
+    def embed_one(self, text: str) -> np.ndarray:
+        """
+        Embed a single text.
+
+        Args:
+            text: Text to embed
+
+        Returns:
+            np.ndarray: float32 embedding vector
+        """
+        return self.embed([text])[0]
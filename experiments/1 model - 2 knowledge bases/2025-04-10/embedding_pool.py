@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Reference Embedding Pool
+
+Embeds responses on one or more dedicated reference embedding servers instead
+of on the node under test. All texts go through one shared queue; each
+endpoint runs a few worker threads that pull whatever is waiting, up to a
+batch, and send it as a single /v1/embeddings call. Because idle workers pull
+from the same queue, faster endpoints naturally take more of the load. A
+batch that fails is retried by the same worker on each other endpoint in
+turn, never on the one that failed, before its texts fail.
+
+Using a pool keeps the tested nodes' chat slots free and puts every node's
+responses into the same vector space.
+"""
+
+import queue
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+import requests
+
+from embedding_client import EmbeddingClient
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingText(NamedTuple):
+    text: str
+    future: Future
+
+
+class EmbeddingPool:
+    """Batched, load-balanced embedding queue over reference endpoints."""
+
+    def __init__(self, endpoints: List[str], model: str, session: Optional[requests.Session] = None,
+                 timeout: float = 16, batch_size: int = 32, batch_wait: float = 0.05,
+                 workers_per_endpoint: int = 2, prefer_base64: bool = True):
+        """
+        Start the pool's worker threads.
+
+        Args:
+            endpoints: Base URLs of the reference embedding servers
+            model: Embedding model name sent with each request
+            session: Optional shared HTTP session
+            timeout: Request timeout in seconds
+            batch_size: Maximum texts per /v1/embeddings call
+            batch_wait: Seconds a worker waits to fill a batch once it has one text
+            workers_per_endpoint: Concurrent requests per endpoint
+            prefer_base64: Request base64-encoded vectors when supported
+        """
+        if not endpoints:
+            raise ValueError("EmbeddingPool needs at least one endpoint")
+
+        self.endpoints = list(endpoints)
+        self.model = model
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue: "queue.Queue[Optional[_PendingText]]" = queue.Queue()
+        self._workers = []
+
+        session = session or requests.Session()
+        self._clients = [EmbeddingClient(endpoint, model, session=session, timeout=timeout,
+                                         prefer_base64=prefer_base64) for endpoint in self.endpoints]
+        for index in range(len(self._clients)):
+            for _ in range(workers_per_endpoint):
+                worker = threading.Thread(target=self._worker, args=(index,), daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+        logger.info(f"Embedding pool: {len(self.endpoints)} endpoint(s), model {model}, "
+                    f"{workers_per_endpoint} worker(s) each, batches of up to {batch_size}")
+
+    def submit(self, text: str) -> Future:
+        """
+        Queue a text for embedding.
+
+        Args:
+            text: Text to embed
+
+        Returns:
+            Future: Resolves to the float32 embedding vector
+        """
+        future = Future()
+        self._queue.put(_PendingText(text, future))
+        return future
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embed a single text, blocking until its batch completes."""
+        return self.submit(text).result()
+
+    def _next_batch(self) -> Optional[List[_PendingText]]:
+        """Block for one text, then gather more for up to batch_wait seconds."""
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                pending = self._queue.get(timeout=max(0.0, remaining)) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending is None:
+                # Shutdown sentinel: hand it back for this worker's next loop
+                self._queue.put(None)
+                break
+            batch.append(pending)
+        return batch
+
+    def _worker(self, index: int):
+        # Own endpoint first, then every other endpoint once
+        clients = self._clients[index:] + self._clients[:index]
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            texts = [pending.text for pending in batch]
+            for client in clients:
+                try:
+                    vectors = client.embed(texts)
+                except Exception as e:
+                    logger.error(f"Embedding batch of {len(batch)} failed on {client.base_url}: {str(e)}")
+                    error = e
+                    continue
+                for pending, vector in zip(batch, vectors):
+                    pending.future.set_result(vector)
+                break
+            else:
+                for pending in batch:
+                    pending.future.set_exception(error)
+
+    def close(self):
+        """Stop the worker threads once the queue has drained."""
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
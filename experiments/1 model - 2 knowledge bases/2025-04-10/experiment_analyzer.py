@@ -7,6 +7,7 @@ experiment, focusing on Euclidean distances between mean embeddings.
 """
 
 import os
+import copy
 import json
 import pickle
 import numpy as np
@@ -18,33 +19,78 @@ from typing import Dict, List, Tuple, Any, Optional
 import logging
 from pathlib import Path
 from scipy.spatial.distance import euclidean
+from scipy.stats import spearmanr
 import itertools
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("analysis_log.txt"),
-        logging.StreamHandler()
-    ]
-)
+from reembed import attach_embedding_set, load_embedding_set
+from tracing import span, tracer
+from log_setup import configure_logging
+from result_store import is_spill_directory, load_spilled_results
+from separation_tests import summarize_tests, two_sample_tests
+from bootstrap import bootstrap_replicates, confidence_intervals
+from kernel_distances import distribution_distances
+from catalog import Catalog, load_selection, parse_filters
+from reference_library import primary_embedder
+
+# Configure logging (queued, written by a background thread; see log_setup.py)
+configure_logging("analysis_log.txt")
 logger = logging.getLogger(__name__)
 
+def has_embedding(item: Dict) -> bool:
+    """True if a result item carries a non-empty embedding (list or numpy array)."""
+    embedding = item.get("embedding")
+    return embedding is not None and len(embedding) > 0
+
+def select_embedder(results: Dict, embedder: str) -> Dict:
+    """
+    Return a copy of the results whose "embedding" fields hold one embedding model's vectors.
+    
+    Args:
+        results: Raw results with per-item "embeddings" dicts
+        embedder: Embedding model name
+        
+    Returns:
+        Dict: Results with the same structure, items sharing everything but "embedding"
+    """
+    selected = {}
+    for model, model_data in results.items():
+        selected[model] = {}
+        for q_key, q_data in model_data.items():
+            selected[model][q_key] = [
+                {**item, "embedding": item.get("embeddings", {}).get(embedder, [])}
+                for item in q_data
+            ]
+    return selected
+
 class ExperimentAnalyzer:
     """Analyzes results from the model consistency experiment."""
     
-    def __init__(self, results_file: str, num_questions: int = 20):
+    def __init__(self, results_file: str, num_questions: int = 20, embedder: Optional[str] = None,
+                 embedding_sets: Optional[List[str]] = None, raw_results: Optional[Dict] = None):
         """
         Initialize the analyzer with experiment results.
         
         Args:
-            results_file: Path to the pickle file containing raw results
+            results_file: Path to the pickle file containing raw results (or a spill directory)
             num_questions: Number of questions in the experiment
+            embedder: Embedding model to analyze, for runs with several
+                (defaults to the primary one stored in "embedding")
+            embedding_sets: Optional embedding set files from reembed.py to attach
+            raw_results: Results already loaded (see from_catalog); results_file then only labels the report
         """
         self.results_file = results_file
         self.num_questions = num_questions
-        self.results = self._load_results()
+        if raw_results is not None:
+            self.raw_results = raw_results
+        else:
+            with span("load_results", "analyzer"):
+                self.raw_results = self._load_results()
+        for embedding_set_file in embedding_sets or []:
+            embedding_set = load_embedding_set(embedding_set_file)
+            attached = attach_embedding_set(self.raw_results, embedding_set)
+            logger.info(f"Attached {attached} {embedding_set['embedding_model']} embeddings from {embedding_set_file}")
+        self.embedder = embedder
+        self.results = select_embedder(self.raw_results, embedder) if embedder else self.raw_results
         self.models = list(self.results.keys())
         self.questions = [f"Q{i+1}" for i in range(num_questions)]
         
@@ -55,21 +101,139 @@ class ExperimentAnalyzer:
         logger.info(f"Analyzing results from {results_file}")
         logger.info(f"Models: {self.models}")
         logger.info(f"Questions: {len(self.questions)}")
+        if self.available_embedders():
+            logger.info(f"Embedding models: {self.available_embedders()} (analyzing {embedder or 'primary'})")
+        
+    @classmethod
+    def from_catalog(cls, catalog_file: str, filters: Dict, num_questions: int = 20,
+                     embedder: Optional[str] = None) -> "ExperimentAnalyzer":
+        """
+        Create an analyzer over the responses a catalog query selects, possibly from several runs.
         
+        Args:
+            catalog_file: Catalog database written by catalog.py
+            filters: Query filters, e.g. {"node": ["gemma-2-9b"], "embedder": ["gte-qwen2"]}
+            num_questions: Number of questions in the experiment
+            embedder: Embedding model to analyze (defaults to the primary one)
+            
+        Returns:
+            ExperimentAnalyzer: Analyzer over the selection
+        """
+        catalog = Catalog(catalog_file)
+        try:
+            with span("load_results", "analyzer"):
+                raw_results = load_selection(catalog, **filters)
+        finally:
+            catalog.close()
+        if not raw_results:
+            raise ValueError(f"No responses with embeddings match {filters}")
+        label = f"{catalog_file} where " + ", ".join(f"{name} in {values}" for name, values in filters.items())
+        return cls(label, num_questions, embedder, raw_results=raw_results)
+    
     def _load_results(self) -> Dict:
         """
-        Load results from pickle file.
+        Load results from pickle file, or from a spill directory written by a
+        SPILL_RESULTS run (embeddings are memory-mapped).
         
         Returns:
             Dict: The experiment results
         """
         try:
+            if is_spill_directory(self.results_file):
+                return load_spilled_results(self.results_file)
             with open(self.results_file, "rb") as f:
                 return pickle.load(f)
         except Exception as e:
             logger.error(f"Error loading results: {str(e)}")
             raise
     
+    def available_embedders(self) -> List[str]:
+        """
+        List the embedding models stored per response, for multi-embedder runs.
+        
+        Returns:
+            List[str]: Embedding model names in run order (empty for single-embedder runs)
+        """
+        embedders = []
+        for model_data in self.raw_results.values():
+            for q_data in model_data.values():
+                for item in q_data:
+                    for embedder in item.get("embeddings", {}):
+                        if embedder not in embedders:
+                            embedders.append(embedder)
+        return embedders
+    
+    def analyzed_embedder(self) -> Optional[str]:
+        """
+        Embedding model the metrics are computed from.
+        
+        The selected embedder, else the run's primary one (the vectors in each
+        item's "embedding"), which attached embedding sets don't change.
+        
+        Returns:
+            Optional[str]: Embedding model name, None if the run doesn't record it
+        """
+        if self.embedder:
+            return self.embedder
+        if os.path.exists(self.results_file):
+            return primary_embedder(self.results_file)
+        return None
+    
+    def for_embedder(self, embedder: str) -> "ExperimentAnalyzer":
+        """
+        Get an analyzer view over one embedding model's vectors.
+        
+        The view shares the loaded data and output directory with this analyzer.
+        
+        Args:
+            embedder: Embedding model name
+            
+        Returns:
+            ExperimentAnalyzer: Analyzer whose metrics use the given embedding model
+        """
+        view = copy.copy(self)
+        view.embedder = embedder
+        view.results = select_embedder(self.raw_results, embedder)
+        return view
+    
+    def compare_embedders(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Calculate model pair distances and consistency metrics under every embedding model.
+        
+        Returns:
+            Tuple[pd.DataFrame, pd.DataFrame]: Average distance per model pair and
+            average mean_stddev / rms_scatter per model, one column per embedding model
+        """
+        distance_columns = []
+        consistency_columns = []
+        
+        for embedder in self.available_embedders():
+            view = self.for_embedder(embedder)
+            
+            distances_df = view.calculate_euclidean_distances()
+            if len(distances_df) > 0:
+                avg_distances = distances_df.groupby(["model1", "model2"])["distance"].mean()
+                distance_columns.append(avg_distances.rename(embedder))
+            
+            rows = []
+            for model in view.models:
+                for question in view.questions:
+                    if not any(has_embedding(item) for item in view.results[model].get(question, [])):
+                        continue
+                    rows.append({
+                        "model": model,
+                        "mean_stddev": view.calculate_mean_stddev(model, question),
+                        "rms_scatter": view.calculate_rms_scatter(model, question)
+                    })
+            if rows:
+                model_metrics = pd.DataFrame(rows).groupby("model").mean()
+                model_metrics.columns = [f"{column} ({embedder})" for column in model_metrics.columns]
+                consistency_columns.append(model_metrics)
+        
+        distance_df = pd.concat(distance_columns, axis=1).reset_index() if distance_columns else pd.DataFrame()
+        consistency_df = pd.concat(consistency_columns, axis=1).reset_index() if consistency_columns else pd.DataFrame()
+        return distance_df, consistency_df
+    
     def calculate_mean_embedding(self, model: str, question: str) -> np.ndarray:
         """
         Calculate the mean embedding for a model-question pair.
@@ -82,7 +246,7 @@ class ExperimentAnalyzer:
             np.ndarray: The mean embedding vector
         """
         question_data = self.results[model].get(question, [])
-        embeddings = [np.array(item["embedding"]) for item in question_data if item.get("embedding")]
+        embeddings = [np.array(item["embedding"]) for item in question_data if has_embedding(item)]
         
         if not embeddings:
             logger.warning(f"No embeddings found for {model}, {question}")
@@ -163,7 +327,7 @@ class ExperimentAnalyzer:
             float: Mean standard deviation
         """
         question_data = self.results[model].get(question, [])
-        embeddings = [np.array(item["embedding"]) for item in question_data if item.get("embedding")]
+        embeddings = [np.array(item["embedding"]) for item in question_data if has_embedding(item)]
         
         if not embeddings:
             logger.warning(f"No embeddings found for {model}, {question}")
@@ -189,7 +353,7 @@ class ExperimentAnalyzer:
             float: Root-mean-square scatter
         """
         question_data = self.results[model].get(question, [])
-        embeddings = [np.array(item["embedding"]) for item in question_data if item.get("embedding")]
+        embeddings = [np.array(item["embedding"]) for item in question_data if has_embedding(item)]
         
         if not embeddings:
             logger.warning(f"No embeddings found for {model}, {question}")
@@ -202,6 +366,45 @@ class ExperimentAnalyzer:
         # Root-mean-square of standard deviations (sqrt of mean of squares)
         return np.sqrt(np.mean(np.square(std_per_dim)))
     
+    def calculate_bootstrap_intervals(self, num_resamples: int = 2000, confidence: float = 0.95,
+                                      workers: Optional[int] = None) -> Dict[str, pd.DataFrame]:
+        """
+        Calculate bootstrap confidence intervals for the distances and consistency metrics.
+        
+        Args:
+            num_resamples: Bootstrap resamples per model-question pair
+            confidence: Interval coverage
+            workers: Worker processes (None = one per CPU)
+            
+        Returns:
+            Dict[str, pd.DataFrame]: Intervals per question ("distances", "consistency")
+            and averaged over questions ("pair_summary", "model_summary")
+        """
+        replicates = bootstrap_replicates(self._embedding_samples(), self.models, self.questions, num_resamples, workers)
+        return confidence_intervals(replicates, confidence)
+    
+    def calculate_distribution_distances(self) -> pd.DataFrame:
+        """
+        Calculate distances between the models' full response distributions for each question.
+        
+        Returns:
+            pd.DataFrame: Unbiased MMD² (RBF and cosine kernels) and energy distance
+            per (question, model pair)
+        """
+        return distribution_distances(self._embedding_samples(), self.models, self.questions)
+    
+    def _embedding_samples(self) -> Dict[str, Dict[str, np.ndarray]]:
+        """Stack each model-question pair's embeddings: {model: {question: (n, d) array}}."""
+        samples = {}
+        for model in self.models:
+            samples[model] = {}
+            for question in self.questions:
+                embeddings = [np.asarray(item["embedding"], dtype=np.float64)
+                              for item in self.results[model].get(question, []) if has_embedding(item)]
+                if embeddings:
+                    samples[model][question] = np.vstack(embeddings)
+        return samples
+    
     def calculate_consistency_metrics(self) -> pd.DataFrame:
         """
         Calculate both consistency metrics for all model-question pairs.
@@ -218,7 +421,7 @@ class ExperimentAnalyzer:
             for question in self.questions:
                 # Get question data
                 question_data = self.results[model].get(question, [])
-                embeddings = [np.array(item["embedding"]) for item in question_data if item.get("embedding")]
+                embeddings = [np.array(item["embedding"]) for item in question_data if has_embedding(item)]
                 
                 if not embeddings:
                     logger.warning(f"No embeddings found for {model}, {question}")
@@ -229,7 +432,8 @@ class ExperimentAnalyzer:
                 identical_responses = len(set(responses)) == 1
                 if identical_responses:
                     identical_response_counts[model] += 1
-                    logger.info(f"Identical responses found for {model}, {question}")
+                    logger.info(f"Identical responses found for {model}, {question}",
+                                extra={"event": "identical_responses", "model": model, "question": question})
                 
                 # Stack embeddings and calculate standard deviation for each dimension
                 stacked = np.vstack(embeddings)
@@ -239,7 +443,9 @@ class ExperimentAnalyzer:
                 zero_std_dims = np.sum(std_per_dim == 0)
                 if zero_std_dims > 0:
                     zero_std_counts[model] += 1
-                    logger.info(f"{model}, {question}: {zero_std_dims} dimensions have zero std dev out of {len(std_per_dim)}")
+                    logger.info(f"{model}, {question}: {zero_std_dims} dimensions have zero std dev out of {len(std_per_dim)}",
+                                extra={"event": "zero_std_dims", "model": model, "question": question,
+                                       "zero_std_dims": int(zero_std_dims)})
                 
                 # Calculate metrics
                 mean_stddev = np.mean(std_per_dim)
@@ -304,19 +510,52 @@ class ExperimentAnalyzer:
         
         plt.close()
     
-    def plot_consistency_metrics(self, save_dir: Optional[str] = None):
+    def plot_distance_intervals(self, pair_df: pd.DataFrame, save_path: Optional[str] = None):
+        """
+        Plot each model pair's average distance with its bootstrap confidence interval.
+        
+        Args:
+            pair_df: Average distance per pair with distance_corrected, ci_low and ci_high columns
+            save_path: Optional path to save the plot
+        """
+        labels = [f"{row.model1} vs {row.model2}" for row in pair_df.itertuples()]
+        positions = np.arange(len(pair_df))
+        
+        plt.figure(figsize=(14, 8))
+        plt.vlines(positions, pair_df["ci_low"], pair_df["ci_high"], linewidth=3, alpha=0.6, label="Bootstrap CI")
+        plt.plot(positions, pair_df["distance"], "o", color="black", label="Average distance")
+        plt.plot(positions, pair_df["distance_corrected"], "x", color="black", label="Bias-corrected average")
+        plt.legend()
+        plt.xticks(positions, labels, rotation=45, ha="right")
+        plt.title("Average Euclidean Distance Between Model Mean Embeddings (bootstrap CI)")
+        plt.xlabel("Model Pairs")
+        plt.ylabel("Euclidean Distance")
+        plt.tight_layout()
+        
+        if save_path:
+            plt.savefig(save_path)
+            logger.info(f"Saved distance interval plot to {save_path}")
+        
+        plt.close()
+    
+    def plot_consistency_metrics(self, save_dir: Optional[str] = None, metrics_df: Optional[pd.DataFrame] = None,
+                                 model_ci_df: Optional[pd.DataFrame] = None):
         """
         Plot consistency metrics for all models.
         
         Args:
             save_dir: Optional directory to save the plots
+            metrics_df: Metrics from calculate_consistency_metrics, if already computed
+            model_ci_df: Bootstrap intervals of each model's average metrics, drawn over the boxes
         """
-        # Calculate metrics
-        metrics_df = self.calculate_consistency_metrics()
+        # Calculate metrics unless the caller already has them
+        if metrics_df is None:
+            metrics_df = self.calculate_consistency_metrics()
         
         # Plot mean standard deviation
         plt.figure(figsize=(14, 8))
         sns.boxplot(x="model", y="mean_stddev", data=metrics_df)
+        self._plot_average_intervals(metrics_df, model_ci_df, "mean_stddev")
         plt.title("Mean Standard Deviation Across Dimensions")
         plt.xlabel("Model")
         plt.ylabel("Mean Standard Deviation")
@@ -333,6 +572,7 @@ class ExperimentAnalyzer:
         # Plot RMS scatter
         plt.figure(figsize=(14, 8))
         sns.boxplot(x="model", y="rms_scatter", data=metrics_df)
+        self._plot_average_intervals(metrics_df, model_ci_df, "rms_scatter")
         plt.title("Root-Mean-Square Scatter")
         plt.xlabel("Model")
         plt.ylabel("RMS Scatter")
@@ -346,6 +586,22 @@ class ExperimentAnalyzer:
         
         plt.close()
 
+    def _plot_average_intervals(self, metrics_df: pd.DataFrame, model_ci_df: Optional[pd.DataFrame], metric: str):
+        """Overlay each model's average metric and its bootstrap interval on the current boxplot."""
+        if model_ci_df is None or len(model_ci_df) == 0:
+            return
+        order = list(metrics_df["model"].unique())
+        averages = metrics_df.groupby("model")[metric].mean()
+        intervals = model_ci_df.set_index("model")
+        models = [model for model in order if model in intervals.index]
+        positions = [order.index(model) for model in models]
+        plt.vlines(positions, intervals.loc[models, f"{metric}_ci_low"], intervals.loc[models, f"{metric}_ci_high"],
+                   color="black", linewidth=3, alpha=0.6, label="Bootstrap CI of the average")
+        plt.plot(positions, averages[models].values, "D", color="black", label="Average")
+        plt.plot(positions, intervals.loc[models, f"{metric}_corrected"], "x", color="black",
+                 label="Bias-corrected average")
+        plt.legend()
+    
     def analyze_zero_std_cases(self):
         """
         Analyze cases where standard deviation is zero to understand the cause.
@@ -355,7 +611,7 @@ class ExperimentAnalyzer:
         for model in self.models:
             for question in self.questions:
                 question_data = self.results[model].get(question, [])
-                embeddings = [np.array(item["embedding"]) for item in question_data if item.get("embedding")]
+                embeddings = [np.array(item["embedding"]) for item in question_data if has_embedding(item)]
                 
                 if not embeddings:
                     continue
@@ -402,24 +658,161 @@ class ExperimentAnalyzer:
         
         return zero_df
     
-    def generate_report(self) -> str:
+    def analyze_scheduling(self) -> pd.DataFrame:
+        """
+        Summarize request scheduling for runs that recorded it.
+        
+        Reports the scheduling policy and completion latency per model, plus an
+        ordering check: the Spearman correlation between a response's position
+        in the request schedule and its distance from the question's mean
+        embedding. Correlations near zero mean request order did not bias the
+        embedding statistics.
+        
+        Returns:
+            pd.DataFrame: One row per model, empty if no scheduling data was recorded
+        """
+        rows = []
+        
+        for model in self.models:
+            latencies = []
+            policies = set()
+            correlations = []
+            
+            for question in self.questions:
+                question_data = [item for item in self.results[model].get(question, [])
+                                 if "sequence" in item and has_embedding(item)]
+                if not question_data:
+                    continue
+                
+                policies.update(item["schedule"] for item in question_data)
+                latencies.extend(item["latency"] for item in question_data)
+                
+                stacked = np.vstack([np.array(item["embedding"]) for item in question_data])
+                distances = np.linalg.norm(stacked - stacked.mean(axis=0), axis=1)
+                sequence = [item["sequence"] for item in question_data]
+                if len(set(sequence)) > 2 and np.ptp(distances) > 0:
+                    correlations.append(spearmanr(sequence, distances)[0])
+            
+            if not latencies:
+                continue
+            
+            rows.append({
+                "model": model,
+                "policy": ", ".join(sorted(policies)),
+                "responses": len(latencies),
+                "mean_latency": np.mean(latencies),
+                "median_latency": np.median(latencies),
+                "order_correlation": np.mean(correlations) if correlations else np.nan
+            })
+        
+        return pd.DataFrame(rows)
+    
+    def summarize_response_lengths(self) -> pd.DataFrame:
+        """
+        Summarize token usage and truncation for runs that recorded it.
+        
+        Returns:
+            pd.DataFrame: One row per model-question with the number of responses,
+            median completion tokens, the max_tokens budget used and how many
+            responses were truncated; empty if no usage data was recorded
+        """
+        rows = []
+        
+        for model in self.models:
+            for question in self.questions:
+                question_data = [item for item in self.results[model].get(question, []) if "finish_reason" in item]
+                if not question_data:
+                    continue
+                
+                tokens = [item["completion_tokens"] for item in question_data if item.get("completion_tokens") is not None]
+                rows.append({
+                    "model": model,
+                    "question": question,
+                    "responses": len(question_data),
+                    "median_tokens": np.median(tokens) if tokens else np.nan,
+                    "max_tokens": max(item.get("max_tokens") or 0 for item in question_data),
+                    "truncated": sum(1 for item in question_data if item.get("truncated"))
+                })
+        
+        return pd.DataFrame(rows)
+    
+    def calculate_two_sample_tests(self, num_permutations: int = 999, workers: Optional[int] = None) -> pd.DataFrame:
+        """
+        Test every model pair and question for a difference in response distributions.
+        
+        Args:
+            num_permutations: Random relabellings per permutation test
+            workers: Worker processes (None = one per CPU)
+            
+        Returns:
+            pd.DataFrame: Centroid distance and shrinkage Hotelling's T² statistics with
+            permutation p-values and Benjamini-Hochberg q-values per (question, model pair)
+        """
+        return two_sample_tests(self.results, self.models, self.questions, num_permutations, workers)
+    
+    def generate_report(self, num_permutations: int = 999, workers: Optional[int] = None,
+                        num_resamples: int = 2000, confidence: float = 0.95) -> str:
         """
         Generate a detailed report of the analysis.
         
+        Args:
+            num_permutations: Permutations for the two-sample tests (0 to skip them)
+            workers: Worker processes for the tests and the bootstrap (None = one per CPU)
+            num_resamples: Bootstrap resamples for the confidence intervals (0 to skip them)
+            confidence: Coverage of the bootstrap confidence intervals
+        
         Returns:
             str: Path to the generated report
         """
         # Calculate metrics
-        distances_df = self.calculate_euclidean_distances()
-        metrics_df = self.calculate_consistency_metrics()
+        with span("calculate_euclidean_distances", "analyzer"):
+            distances_df = self.calculate_euclidean_distances()
+        with span("calculate_consistency_metrics", "analyzer"):
+            metrics_df = self.calculate_consistency_metrics()
+        with span("calculate_distribution_distances", "analyzer"):
+            distribution_df = self.calculate_distribution_distances()
+        intervals = None
+        if num_resamples > 0:
+            with span("calculate_bootstrap_intervals", "analyzer"):
+                intervals = self.calculate_bootstrap_intervals(num_resamples, confidence, workers)
         
         # Create plots
-        self.plot_distance_matrix(os.path.join(self.output_dir, "distance_matrix.png"))
-        self.plot_consistency_metrics(self.output_dir)
+        with span("plot_distance_matrix", "analyzer"):
+            self.plot_distance_matrix(os.path.join(self.output_dir, "distance_matrix.png"))
+        with span("plot_consistency_metrics", "analyzer"):
+            self.plot_consistency_metrics(self.output_dir, metrics_df,
+                                          intervals["model_summary"] if intervals else None)
         
         # Calculate summary statistics
         avg_distances = distances_df.groupby(["model1", "model2"])["distance"].mean().reset_index()
         avg_distances = avg_distances.sort_values("distance")
+        avg_metrics = metrics_df.groupby("model")[["mean_stddev", "rms_scatter"]].mean().reset_index()
+        if intervals:
+            avg_distances = avg_distances.merge(intervals["pair_summary"], on=["model1", "model2"], how="left")
+            avg_metrics = avg_metrics.merge(intervals["model_summary"], on="model", how="left")
+            distances_df = distances_df.merge(intervals["distances"], on=["question", "model1", "model2"], how="left")
+            metrics_df = metrics_df.merge(intervals["consistency"], on=["model", "question"], how="left")
+            with span("plot_distance_intervals", "analyzer"):
+                self.plot_distance_intervals(avg_distances, os.path.join(self.output_dir, "distance_intervals.png"))
+        if len(distribution_df) > 0:
+            distances_df = distances_df.merge(distribution_df, on=["question", "model1", "model2"], how="left")
+            avg_distribution = distribution_df.groupby(["model1", "model2"])[
+                ["mmd2_rbf", "mmd2_cosine", "energy_distance"]].mean().reset_index()
+            avg_distribution = avg_distances[["model1", "model2"]].merge(avg_distribution, on=["model1", "model2"])
+        ci_label = (f" with {confidence:.0%} basic bootstrap confidence intervals ({num_resamples} resamples)"
+                    if intervals else "")
+        ci_note = ""
+        if intervals:
+            outside = ((avg_distances["distance"] < avg_distances["ci_low"]) |
+                       (avg_distances["distance"] > avg_distances["ci_high"])).sum()
+            outside += sum(((avg_metrics[metric] < avg_metrics[f"{metric}_ci_low"]) |
+                            (avg_metrics[metric] > avg_metrics[f"{metric}_ci_high"])).sum()
+                           for metric in ["mean_stddev", "rms_scatter"])
+            ci_note = ("Basic bootstrap intervals are centred on the bias-corrected estimates (columns ending in "
+                       "_corrected: the estimate minus its bootstrap bias); sampling noise inflates the plug-in "
+                       "distances and few repeats deflate the plug-in spreads. "
+                       f"{int(outside)} of the {len(avg_distances) + 2 * len(avg_metrics)} plug-in estimates below "
+                       "lie outside their interval.\n\n")
         
         model_metrics = metrics_df.groupby("model").agg({
             "mean_stddev": ["mean", "std", "min", "max"],
@@ -433,25 +826,81 @@ class ExperimentAnalyzer:
         report_content += "## Experiment Overview\n\n"
         report_content += f"- Models tested: {', '.join(self.models)}\n"
         report_content += f"- Number of questions: {self.num_questions}\n"
-        report_content += f"- Results file: {self.results_file}\n\n"
+        report_content += f"- Results file: {self.results_file}\n"
+        if self.available_embedders():
+            report_content += f"- Embedding models: {', '.join(self.available_embedders())} "
+            analyzed = self.analyzed_embedder() or "the primary embedder of each run"
+            report_content += f"(sections below use {analyzed})\n"
+        report_content += "\n"
         
         report_content += "## Model Pair Distances\n\n"
-        report_content += "Average Euclidean distances between model mean embeddings across all questions:\n\n"
+        report_content += ci_note
+        report_content += f"Average Euclidean distances between model mean embeddings across all questions{ci_label}:\n\n"
         report_content += avg_distances.to_markdown(index=False, floatfmt=".4f") + "\n\n"
         
+        if len(distribution_df) > 0:
+            report_content += "### Distribution Distances\n\n"
+            report_content += "Average distances between the full response distributions (unbiased MMD² with RBF "
+            report_content += "and cosine kernels, energy distance); unlike the centroid distance these also "
+            report_content += "separate models whose answers differ in spread or shape but not in mean:\n\n"
+            report_content += avg_distribution.to_markdown(index=False, floatfmt=".4f") + "\n\n"
+        
         report_content += "## Consistency Metrics\n\n"
         report_content += "### Mean Standard Deviation\n\n"
-        report_content += "Average of standard deviations across all embedding dimensions:\n\n"
-        report_content += metrics_df.groupby("model")["mean_stddev"].mean().to_markdown(floatfmt=".4f") + "\n\n"
+        report_content += f"Average of standard deviations across all embedding dimensions{ci_label}:\n\n"
+        report_content += avg_metrics.filter(regex="^(model|mean_stddev)").to_markdown(index=False, floatfmt=".4f") + "\n\n"
         
         report_content += "### Root-Mean-Square Scatter\n\n"
-        report_content += "Root-mean-square of standard deviations across all embedding dimensions:\n\n"
-        report_content += metrics_df.groupby("model")["rms_scatter"].mean().to_markdown(floatfmt=".4f") + "\n\n"
+        report_content += f"Root-mean-square of standard deviations across all embedding dimensions{ci_label}:\n\n"
+        report_content += avg_metrics.filter(regex="^(model|rms_scatter)").to_markdown(index=False, floatfmt=".4f") + "\n\n"
+        
+        tests_df = pd.DataFrame()
+        if num_permutations > 0:
+            with span("calculate_two_sample_tests", "analyzer"):
+                tests_df = self.calculate_two_sample_tests(num_permutations, workers)
+        if len(tests_df) > 0:
+            tests_df.to_csv(os.path.join(self.output_dir, "two_sample_tests.csv"), index=False)
+            report_content += "## Two-Sample Tests\n\n"
+            report_content += f"Permutation tests ({num_permutations} permutations) of centroid distance and of "
+            report_content += "shrinkage Hotelling's T² per question. Share of questions where the pair differs "
+            report_content += "at FDR 0.05 (Benjamini-Hochberg over all tests), and median p-values:\n\n"
+            report_content += summarize_tests(tests_df).to_markdown(index=False, floatfmt=".4f") + "\n\n"
+        
+        if len(self.available_embedders()) > 1:
+            with span("compare_embedders", "analyzer"):
+                embedder_distances_df, embedder_consistency_df = self.compare_embedders()
+            report_content += "## Embedder Comparison\n\n"
+            report_content += "Average model pair distances under each embedding model:\n\n"
+            report_content += embedder_distances_df.to_markdown(index=False, floatfmt=".4f") + "\n\n"
+            report_content += "Average consistency metrics under each embedding model:\n\n"
+            report_content += embedder_consistency_df.to_markdown(index=False, floatfmt=".4f") + "\n\n"
+        
+        with span("analyze_scheduling", "analyzer"):
+            scheduling_df = self.analyze_scheduling()
+        if len(scheduling_df) > 0:
+            report_content += "## Request Scheduling\n\n"
+            report_content += "Completion latency (seconds) per model and the correlation between request order "
+            report_content += "and distance from the question's mean embedding (near zero = no ordering bias):\n\n"
+            report_content += scheduling_df.to_markdown(index=False, floatfmt=".4f") + "\n\n"
+        
+        with span("summarize_response_lengths", "analyzer"):
+            lengths_df = self.summarize_response_lengths()
+        if len(lengths_df) > 0:
+            truncated_df = lengths_df[lengths_df["truncated"] > 0]
+            report_content += "## Response Lengths\n\n"
+            report_content += f"Truncated responses (finish_reason = length): {int(lengths_df['truncated'].sum())} "
+            report_content += f"of {int(lengths_df['responses'].sum())}\n\n"
+            if len(truncated_df) > 0:
+                report_content += truncated_df.to_markdown(index=False, floatfmt=".1f") + "\n\n"
         
         report_content += "## Visualizations\n\n"
         report_content += "### Distance Matrix\n\n"
         report_content += "![Distance Matrix](distance_matrix.png)\n\n"
         
+        if intervals:
+            report_content += "### Distance Confidence Intervals\n\n"
+            report_content += "![Distance Intervals](distance_intervals.png)\n\n"
+        
         report_content += "### Mean Standard Deviation\n\n"
         report_content += "![Mean Standard Deviation](mean_stddev.png)\n\n"
         
@@ -464,6 +913,7 @@ class ExperimentAnalyzer:
         for question in self.questions:
             question_distances = distances_df[distances_df["question"] == question]
             question_metrics = metrics_df[metrics_df["question"] == question]
+            question_tests = tests_df[tests_df["question"] == question] if len(tests_df) > 0 else tests_df
             
             if len(question_distances) > 0:
                 report_content += f"### {question}\n\n"
@@ -473,6 +923,10 @@ class ExperimentAnalyzer:
                 
                 report_content += "#### Consistency Metrics\n\n"
                 report_content += question_metrics.to_markdown(index=False, floatfmt=".4f") + "\n\n"
+                
+                if len(question_tests) > 0:
+                    report_content += "#### Two-Sample Tests\n\n"
+                    report_content += question_tests.drop(columns="question").to_markdown(index=False, floatfmt=".4f") + "\n\n"
         
         # Save report
         report_path = os.path.join(self.output_dir, "analysis_report.md")
@@ -488,17 +942,44 @@ def main():
     import argparse
     
     parser = argparse.ArgumentParser(description="Analyze AI model consistency experiment results")
-    parser.add_argument("results_file", help="Path to the pickle file containing raw results")
+    parser.add_argument("results_file", nargs="?",
+                        help="Path to the pickle file containing raw results (or a spill directory)")
+    parser.add_argument("--catalog", help="Select the results from this catalog (see catalog.py) instead of a file")
+    parser.add_argument("--where", action="append", metavar="NAME=VALUE",
+                        help="Catalog filter, e.g. node=gemma-2-9b or embedder=gte-qwen2 (repeatable)")
     parser.add_argument("--num-questions", type=int, default=20, help="Number of questions in the experiment")
+    parser.add_argument("--embedder", help="Embedding model to analyze in multi-embedder runs (default: the primary one)")
+    parser.add_argument("--embedding-set", action="append", dest="embedding_sets",
+                        help="Embedding set from reembed.py to attach (repeatable)")
+    parser.add_argument("--trace", help="Write a trace-event JSON of the analysis stages to this file")
+    parser.add_argument("--permutations", type=int, default=999,
+                        help="Permutations for the two-sample tests (0 to skip them)")
+    parser.add_argument("--resamples", type=int, default=2000,
+                        help="Bootstrap resamples for confidence intervals (0 to skip them)")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Coverage of the bootstrap confidence intervals")
+    parser.add_argument("--workers", type=int,
+                        help="Worker processes for the two-sample tests and bootstrap (default: one per CPU)")
     
     args = parser.parse_args()
     
-    if not os.path.exists(args.results_file):
+    if args.catalog:
+        if not os.path.exists(args.catalog):
+            print(f"Error: Catalog {args.catalog} not found")
+            return
+    elif not args.results_file or not os.path.exists(args.results_file):
         print(f"Error: Results file {args.results_file} not found")
         return
     
-    analyzer = ExperimentAnalyzer(args.results_file, args.num_questions)
-    report_path = analyzer.generate_report()
+    if args.trace:
+        tracer.enable(args.trace)
+    
+    if args.catalog:
+        analyzer = ExperimentAnalyzer.from_catalog(args.catalog, parse_filters(args.where), args.num_questions,
+                                                   args.embedder)
+    else:
+        analyzer = ExperimentAnalyzer(args.results_file, args.num_questions, args.embedder, args.embedding_sets)
+    report_path = analyzer.generate_report(args.permutations, args.workers, args.resamples, args.confidence)
+    tracer.save()
     
     print(f"\nAnalysis complete!")
     print(f"Report saved to: {report_path}")
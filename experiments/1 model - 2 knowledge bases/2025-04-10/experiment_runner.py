@@ -6,7 +6,8 @@ This script automates testing the consistency of responses across different
 AI inference models.
 
 
-This version rotates through all 20 questions once, then goes through them all a second time, and so on until it each question 25 times.
+By default this version rotates through all 20 questions once, then goes through them all a second time, and so on until it each question 25 times.
+Other request orders can be selected with Config.SCHEDULING_POLICY (see scheduling.py).
 """
 
 import os
@@ -16,6 +17,7 @@ import numpy as np
 import requests
 import pandas as pd
 from datetime import datetime
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Tuple, Any, Optional
 import logging
@@ -23,22 +25,38 @@ from pathlib import Path
 import pickle
 import warnings
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("experiment_log.txt"),
-        logging.StreamHandler()
-    ]
-)
+from scheduling import build_schedule, CACHE_FRIENDLY_POLICIES
+from capacity_probe import CapacityProbe
+from adaptive_budget import ResponseBudget
+from embedding_client import EmbeddingClient
+from embedding_pool import EmbeddingPool
+from record_replay import RecordingAdapter, ReplayAdapter
+from tracing import span, tracer
+from log_setup import configure_logging, update_logging
+from progress import ProgressTracker
+from result_store import ResultStore
+
+# Configure logging (queued, written by a background thread; see log_setup.py)
+configure_logging("experiment_log.txt")
 logger = logging.getLogger(__name__)
 
+def _json_default(value):
+    """Serialize numpy values (e.g. float32 embeddings) for json.dump."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
 class Config:
     """Configuration parameters for the experiment."""
     # User-configurable experiment parameters
     TIMEOUT = 16  # API request timeout in seconds
-    MAX_WORKERS = 15  # Concurrency (parallel workers)
+    MAX_WORKERS = 15  # Upper bound on concurrent requests per node
+    AUTO_CAPACITY = False  # Size each node's concurrency from its slot metadata or a ramp test (else MAX_WORKERS)
+    NODE_MAX_WORKERS = {}  # Optional fixed concurrency per model/knowledge base name
+    CAPACITY_RAMP_TOKENS = 16  # max_tokens of ramp-test requests
+    CAPACITY_RAMP_MIN_GAIN = 0.1  # Minimum throughput gain to accept the next ramp level
     REQUEST_DELAY = 0.00625  # Delay between requests in seconds
     
     # No API key needed for local execution
@@ -72,11 +90,92 @@ class Config:
     
     # Embedding model to use for semantic comparison
     EMBEDDING_MODEL = "gte-qwen2"
+    # Optional list of embedding models to apply to every response in the same run
+    # (e.g. ["gte-qwen2", "nomic-embed"]); the first one fills the "embedding" field
+    EMBEDDING_MODELS = []
+    EMBEDDING_BASE64 = True  # Request base64 vectors (decoded to float32), falling back to JSON floats
+    
+    # Dedicated reference embedding servers. When set, all responses from all nodes are embedded
+    # here through one batched queue per embedding model; when empty, each node embeds its own
+    # responses. Either a list shared by all embedding models, or a dict of model -> list.
+    EMBEDDING_ENDPOINTS = []  # e.g. ["http://localhost:9000"] or {"nomic-embed": ["http://localhost:9001"]}
+    EMBEDDING_BATCH_SIZE = 32  # Maximum texts per embedding call
+    EMBEDDING_BATCH_WAIT = 0.05  # Seconds to wait for a batch to fill
+    EMBEDDING_WORKERS_PER_ENDPOINT = 2  # Concurrent embedding calls per reference endpoint
+    
+    # Record/replay of node traffic (see record_replay.py). RECORD_FILE captures every
+    # request/response of a run; REPLAY_FILE serves a recorded run instead of the nodes.
+    RECORD_FILE = None  # e.g. "./recordings/run.jsonl.gz"
+    REPLAY_FILE = None
+    REPLAY_LATENCY_SCALE = 1.0  # Multiplier for recorded latencies during replay (0 = no waiting)
+    
+    # Memory-bounded mode: stream result items to a spill directory (see result_store.py)
+    # as they complete, keeping only running statistics in memory. The analyzer reads the
+    # spill directory in place of the raw results pickle.
+    SPILL_RESULTS = False
+    SPILL_DIR = "./results"  # Parent of the per-run spill_<timestamp> directory
+    
+    # Progress: machine-readable status (progress, throughput, failure rate, ETA per node)
+    PROGRESS_STATUS_FILE = "./results/progress_status.json"  # None to disable
+    PROGRESS_STATUS_INTERVAL = 5  # Seconds between status file updates
+    
+    # Logging: keep one in N per-request INFO lines (all are counted in the periodic summary)
+    LOG_SAMPLE_EVERY = {"INFO": 20}
+    LOG_SUMMARY_INTERVAL = 60  # Seconds between summaries of sampled log events
+    LOG_STRUCTURED = False  # Write experiment_log.txt as JSON lines with model/question/repeat fields
+    
+    # Span tracing (see tracing.py): writes a trace-event JSON of every runner stage
+    TRACE_FILE = None  # e.g. "./traces/run_trace.json"
+    
+    # Online verification service (see verification_service.py and reference_library.py)
+    REFERENCE_LIBRARY = "./reference_library"
+    VERIFY_HOST = "127.0.0.1"
+    VERIFY_PORT = 8090
+    VERIFY_WORKERS = 2  # Jobs verified at the same time
+    VERIFY_QUESTIONS = 5  # Probe questions per job
+    VERIFY_REQUEST_BUDGET = 20  # Maximum completions per job
+    VERIFY_CONCURRENCY = 5  # Concurrent requests to the node per job
+    VERIFY_DEADLINE = 120  # Seconds allowed for probing a node
+    VERIFY_CONFIDENCE = 0.95  # 1 - significance level of the fit tests behind verified and rejected verdicts
+    VERIFY_RESULT_TTL = 600  # Seconds a finished job is kept and its verdict reused for identical jobs
+    VERIFY_ADAPTIVE = False  # Choose probes round by round by expected information gain (see adaptive_prober.py)
+    VERIFY_TEMPERATURE = 1.0  # Extra tempering of the adaptive prober's log-likelihoods (1 is calibrated)
+    
+    # Cross-run catalog (see catalog.py)
+    CATALOG_FILE = "./catalog.sqlite"
     
     # API request parameters
     TEMPERATURE = 0.7
     MAX_TOKENS = 1024
     TOP_P = 0.9
+    SAMPLES_PER_REQUEST = 1  # Samples requested per completion call ("n"); falls back to 1 if unsupported
+    
+    # Adaptive per-question budgets: after PILOT_REPEATS full-budget repeats, each question's
+    # max_tokens/timeout covers the BUDGET_PERCENTILE of pilot lengths/latencies plus BUDGET_MARGIN
+    ADAPTIVE_BUDGET = False
+    PILOT_REPEATS = 3
+    BUDGET_PERCENTILE = 99
+    BUDGET_MARGIN = 0.25
+    MIN_MAX_TOKENS = 32  # Smallest adapted max_tokens
+    MIN_TIMEOUT = 2  # Smallest adapted timeout in seconds
+    
+    # Request order: "round_robin", "grouped" or "random_blocks" (see scheduling.py)
+    SCHEDULING_POLICY = "round_robin"
+    SCHEDULE_SEED = None  # Seed for randomized policies
+    
+    # Fingerprint mode parameters (greedy decoding, one request per probe)
+    FINGERPRINT_TOP_LOGPROBS = 5  # Top-k logprobs requested per generated token
+    FINGERPRINT_MAX_TOKENS = 16  # Tokens generated per probe
+    FINGERPRINT_PROMPTS = [
+        "Complete the sentence: The quick brown fox",
+        "Continue the sequence: 2, 3, 5, 7, 11,",
+        "Name a color.",
+        "Write the first line of a poem about the sea.",
+        "Say hello in French.",
+        "What is 17 times 23?",
+        "Give one word that rhymes with 'light'.",
+        "Describe a cat in three words."
+    ]
     
     # Auto-retry parameters for checking model availability
     CHECK_INTERVAL = 10  # Seconds between availability checks
@@ -142,6 +241,46 @@ class ExperimentRunner:
         self.config = config
         self.start_time = datetime.now()
         
+        # Shared HTTP session so repeated calls to a node reuse connections,
+        # with a connection pool large enough for the busiest node. In record or
+        # replay mode, all node traffic goes through the recording/replay adapter.
+        self.session = requests.Session()
+        if config.REPLAY_FILE:
+            self.http_adapter = ReplayAdapter(config.REPLAY_FILE, latency_scale=config.REPLAY_LATENCY_SCALE)
+        elif config.RECORD_FILE:
+            self.http_adapter = RecordingAdapter(config.RECORD_FILE, pool_maxsize=config.MAX_WORKERS)
+        else:
+            self.http_adapter = requests.adapters.HTTPAdapter(pool_maxsize=config.MAX_WORKERS)
+        self.session.mount("http://", self.http_adapter)
+        self.session.mount("https://", self.http_adapter)
+        
+        if config.TRACE_FILE:
+            tracer.enable(config.TRACE_FILE)
+        
+        update_logging(config.LOG_SAMPLE_EVERY, config.LOG_SUMMARY_INTERVAL, config.LOG_STRUCTURED)
+        
+        # Per-node concurrency limits, discovered when each node is first used
+        self.node_concurrency = {}
+        
+        # Embedding models applied to every response; the first is the primary one
+        self.embedding_models = list(config.EMBEDDING_MODELS) or [config.EMBEDDING_MODEL]
+        
+        # Per-node, per-embedding-model clients, created on first use
+        self.embedding_clients = {}
+        
+        # Shared reference embedding pools (one per embedding model), created for
+        # each run when EMBEDDING_ENDPOINTS is set
+        self.embedding_pools = {}
+        
+        # Per-node multi-sample ("n" > 1) support, detected on first use
+        self.multi_sample_support = {}
+        
+        # Progress of the current run, created by run_sequential_experiment
+        self.progress = None
+        
+        # Disk-backed result store of the current run (SPILL_RESULTS mode)
+        self.store = None
+        
         # Initialize results structure based on experiment mode
         if config.EXPERIMENT_MODE == "models":
             self.results = {model: {} for model in config.MODELS.keys()}
@@ -161,8 +300,23 @@ class ExperimentRunner:
         logger.info(f"Number of questions: {len(config.QUESTIONS)}")
         logger.info(f"Repeats per question: {config.NUM_REPEATS}")
         logger.info(f"Timeout: {config.TIMEOUT} seconds")
-        logger.info(f"Concurrency: {config.MAX_WORKERS} workers")
+        logger.info(f"Embedding models: {self.embedding_models}")
+        if config.REPLAY_FILE:
+            logger.info(f"Replaying node traffic from {config.REPLAY_FILE} ({config.REPLAY_LATENCY_SCALE}x latency)")
+        elif config.RECORD_FILE:
+            logger.info(f"Recording node traffic to {config.RECORD_FILE}")
+        if config.EMBEDDING_ENDPOINTS:
+            logger.info(f"Reference embedding endpoints: {config.EMBEDDING_ENDPOINTS}")
+        if config.AUTO_CAPACITY:
+            logger.info(f"Concurrency: discovered per node, at most {config.MAX_WORKERS} workers")
+        else:
+            logger.info(f"Concurrency: {config.MAX_WORKERS} workers")
         logger.info(f"Delay between requests: {config.REQUEST_DELAY} seconds")
+        logger.info(f"Samples per request: {config.SAMPLES_PER_REQUEST}")
+        logger.info(f"Scheduling policy: {config.SCHEDULING_POLICY}")
+        if config.ADAPTIVE_BUDGET:
+            logger.info(f"Adaptive budgets after {config.PILOT_REPEATS} pilot repeats "
+                        f"(p{config.BUDGET_PERCENTILE} + {config.BUDGET_MARGIN:.0%})")
         
         if config.EXPERIMENT_MODE == "models":
             logger.info(f"Total API calls expected: {len(config.MODELS) * len(config.QUESTIONS) * config.NUM_REPEATS}")
@@ -185,7 +339,8 @@ class ExperimentRunner:
             logger.error(f"Model {model} not found in configuration")
             return False
             
-        # Check completion endpoint
+        # Check completion endpoint (and the node's embedding endpoint, unless
+        # a reference embedding pool does the embedding)
         completion_url = f"{base_url}/v1/chat/completions"
         embedding_url = f"{base_url}/v1/embeddings"
         
@@ -200,7 +355,7 @@ class ExperimentRunner:
                 ],
                 "max_tokens": 10
             }
-            completion_response = requests.post(
+            completion_response = self.session.post(
                 completion_url, 
                 headers={"Content-Type": "application/json"},
                 json=completion_payload,
@@ -211,12 +366,16 @@ class ExperimentRunner:
                 logger.warning(f"Completion endpoint for {model} returned {completion_response.status_code}")
                 return False
                 
+            if all(self.get_reference_endpoints(embedding_model) for embedding_model in self.embedding_models):
+                logger.info(f"Model {model} is available and responsive")
+                return True
+            
             # Test embedding endpoint
             embedding_payload = {
-                "model": self.config.EMBEDDING_MODEL,
+                "model": self.embedding_models[0],
                 "input": ["Test embedding"]
             }
-            embedding_response = requests.post(
+            embedding_response = self.session.post(
                 embedding_url,
                 headers={"Content-Type": "application/json"},
                 json=embedding_payload,
@@ -260,18 +419,64 @@ class ExperimentRunner:
         logger.error(f"Max attempts reached. {model} is still not available.")
         return False
     
-    def make_completion_request(self, model: str, question: str) -> Dict:
+    def get_base_url(self, name: str) -> str:
+        """
+        Get the API base URL for a model or knowledge base.
+        
+        Args:
+            name: Model name ("models" mode) or knowledge base name ("knowledge_bases" mode)
+            
+        Returns:
+            str: Base URL of the node serving it
+        """
+        if self.config.EXPERIMENT_MODE == "knowledge_bases":
+            return f"http://localhost:{self.config.KB_PORT}"
+        return self.config.MODELS[name]
+    
+    def get_concurrency(self, name: str) -> int:
+        """
+        Get the number of concurrent requests to send to a model or knowledge base.
+        
+        Uses NODE_MAX_WORKERS if set for this name, otherwise (with AUTO_CAPACITY)
+        the node's discovered capacity, otherwise MAX_WORKERS.
+        
+        Args:
+            name: Model or knowledge base name
+            
+        Returns:
+            int: Concurrency limit for this node
+        """
+        if name not in self.node_concurrency:
+            if name in self.config.NODE_MAX_WORKERS:
+                self.node_concurrency[name] = self.config.NODE_MAX_WORKERS[name]
+            elif self.config.AUTO_CAPACITY:
+                with span("capacity_discovery", model=name):
+                    capacity = CapacityProbe(self.config, self.session).discover(name, self.get_base_url(name))
+                self.node_concurrency[name] = capacity["concurrency"]
+            else:
+                self.node_concurrency[name] = self.config.MAX_WORKERS
+            logger.info(f"Concurrency for {name}: {self.node_concurrency[name]} workers")
+        
+        return self.node_concurrency[name]
+    
+    def make_completion_request(self, model: str, question: str, n: int = 1,
+                                cache_prompt: bool = False, max_tokens: Optional[int] = None,
+                                timeout: Optional[float] = None) -> Dict:
         """
         Send a request to the model's completion API endpoint.
         
         Args:
             model: Name of the model to query
             question: The question to ask the model
+            n: Number of samples to request in this call
+            cache_prompt: Ask the server to reuse its cached prompt prefix
+            max_tokens: Token budget for this call (defaults to MAX_TOKENS)
+            timeout: Timeout in seconds for this call (defaults to TIMEOUT)
             
         Returns:
             Dict: The JSON response from the API
         """
-        url = f"{self.config.MODELS[model]}/v1/chat/completions"
+        url = f"{self.get_base_url(model)}/v1/chat/completions"
         headers = {
             "accept": "application/json",
             "Content-Type": "application/json"
@@ -282,57 +487,435 @@ class ExperimentRunner:
                 {"role": "user", "content": question}
             ],
             "temperature": self.config.TEMPERATURE,
-            "max_tokens": self.config.MAX_TOKENS,
+            "max_tokens": max_tokens or self.config.MAX_TOKENS,
             "top_p": self.config.TOP_P
         }
+        if n > 1:
+            payload["n"] = n
+        if cache_prompt:
+            payload["cache_prompt"] = True
         
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=self.config.TIMEOUT)
+            response = self.session.post(url, headers=headers, json=payload, timeout=timeout or self.config.TIMEOUT)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
             logger.error(f"Error making completion request to {model}: {str(e)}")
             return {"error": str(e)}
     
-    def get_embedding(self, model: str, text: str) -> List[float]:
+    def request_samples(self, model: str, question: str, count: int,
+                        cache_prompt: bool = False, max_tokens: Optional[int] = None,
+                        timeout: Optional[float] = None) -> List[Dict]:
+        """
+        Get several sampled completions for one question, in as few calls as
+        the node allows.
+        
+        The first multi-sample call to a node detects whether it honours "n";
+        nodes that return fewer choices (or reject the call) are switched to
+        single-sample requests for the rest of the run.
+        
+        Args:
+            model: Name of the model to query
+            question: The question to ask the model
+            count: Number of samples wanted
+            cache_prompt: Ask the server to reuse its cached prompt prefix
+            max_tokens: Token budget per call (defaults to MAX_TOKENS)
+            timeout: Timeout in seconds per call (defaults to TIMEOUT)
+            
+        Returns:
+            List[Dict]: Up to `count` completion choices, in repeat order. Each
+            choice carries a "usage" entry with its share of the call's token usage.
+        """
+        choices = []
+        
+        if count > 1 and self.multi_sample_support.get(model) is not False:
+            completion = self.make_completion_request(model, question, n=count, cache_prompt=cache_prompt,
+                                                      max_tokens=max_tokens, timeout=timeout)
+            returned = sorted(self._choices_with_usage(completion), key=lambda choice: choice.get("index", 0))
+            
+            if model not in self.multi_sample_support:
+                supported = len(returned) >= count
+                self.multi_sample_support[model] = supported
+                logger.info(f"Multi-sample requests (n={count}) {'supported' if supported else 'not supported'} by {model}")
+            
+            choices.extend(returned[:count])
+        
+        # Fall back to single-sample requests for anything still missing
+        while len(choices) < count:
+            completion = self.make_completion_request(model, question, cache_prompt=cache_prompt,
+                                                      max_tokens=max_tokens, timeout=timeout)
+            if "error" in completion:
+                logger.error(f"Error in completion for {model}, skipping {count - len(choices)} sample(s)")
+                break
+            choices.extend(self._choices_with_usage(completion)[:1])
+            if not completion.get("choices"):
+                break
+        
+        return choices
+    
+    @staticmethod
+    def _choices_with_usage(completion: Dict) -> List[Dict]:
+        """
+        Attach each choice's share of the call's token usage to the choice.
+        
+        Servers report usage per call, so with n > 1 the completion tokens are
+        split evenly across the returned choices.
+        """
+        choices = completion.get("choices", [])
+        usage = completion.get("usage") or {}
+        for choice in choices:
+            choice["usage"] = {
+                "prompt_tokens": usage.get("prompt_tokens"),
+                "completion_tokens": (round(usage["completion_tokens"] / len(choices))
+                                      if usage.get("completion_tokens") is not None else None)
+            }
+        return choices
+    
+    def get_embedding_client(self, model: str, embedding_model: Optional[str] = None) -> EmbeddingClient:
+        """
+        Get the embedding client for a model's node.
+        
+        Args:
+            model: Name of the model whose node embeds the responses
+            embedding_model: Embedding model to request (defaults to the primary one)
+            
+        Returns:
+            EmbeddingClient: Client for the node's /v1/embeddings endpoint
+        """
+        embedding_model = embedding_model or self.embedding_models[0]
+        if (model, embedding_model) not in self.embedding_clients:
+            self.embedding_clients[(model, embedding_model)] = EmbeddingClient(
+                self.get_base_url(model),
+                embedding_model,
+                session=self.session,
+                timeout=self.config.TIMEOUT,
+                prefer_base64=self.config.EMBEDDING_BASE64
+            )
+        return self.embedding_clients[(model, embedding_model)]
+    
+    def get_embedding(self, model: str, text: str, embedding_model: Optional[str] = None) -> np.ndarray:
         """
         Get embedding vector for a text response.
         
         Args:
             model: Name of the model to use for embedding
             text: The text to get embedding for
+            embedding_model: Embedding model to use (defaults to the primary one)
             
         Returns:
-            List[float]: The embedding vector
+            np.ndarray: The float32 embedding vector (empty on failure)
         """
-        url = f"{self.config.MODELS[model]}/v1/embeddings"
-        headers = {
-            "accept": "application/json",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "model": self.config.EMBEDDING_MODEL,
-            "input": [text]
-        }
-            
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=self.config.TIMEOUT)
-            response.raise_for_status()
-            result = response.json()
-            return result["data"][0]["embedding"]
+            return self.get_embedding_client(model, embedding_model).embed_one(text)
         except requests.exceptions.RequestException as e:
             logger.error(f"Error getting embedding from {model}: {str(e)}")
-            return []
-        except (KeyError, IndexError) as e:
+            return np.array([], dtype=np.float32)
+        except (KeyError, IndexError, ValueError) as e:
             logger.error(f"Unexpected response format from embedding API: {str(e)}")
-            return []
+            return np.array([], dtype=np.float32)
+    
+    def get_reference_endpoints(self, embedding_model: str) -> List[str]:
+        """
+        Get the reference embedding endpoints for an embedding model.
+        
+        Args:
+            embedding_model: Embedding model name
+            
+        Returns:
+            List[str]: Base URLs, empty if this model is embedded on the nodes themselves
+        """
+        if isinstance(self.config.EMBEDDING_ENDPOINTS, dict):
+            return list(self.config.EMBEDDING_ENDPOINTS.get(embedding_model, []))
+        return list(self.config.EMBEDDING_ENDPOINTS)
     
     def run_sequential_experiment(self):
         """Run the experiment sequentially through all models/knowledge bases and questions."""
-        if self.config.EXPERIMENT_MODE == "models":
-            return self._run_models_experiment()
-        else:
-            return self._run_knowledge_bases_experiment()
+        names = self.config.MODELS if self.config.EXPERIMENT_MODE == "models" else self.config.KB_URLS
+        self.progress = ProgressTracker(
+            {name: len(self.config.QUESTIONS) * self.config.NUM_REPEATS for name in names},
+            status_file=self.config.PROGRESS_STATUS_FILE,
+            status_interval=self.config.PROGRESS_STATUS_INTERVAL
+        )
+        
+        if self.config.SPILL_RESULTS:
+            base_dir = os.path.join(self.config.SPILL_DIR, f"spill_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+            spill_dir, suffix = base_dir, 1
+            while os.path.exists(spill_dir):
+                suffix += 1
+                spill_dir = f"{base_dir}_{suffix}"
+            self.store = ResultStore(spill_dir, self.embedding_models, len(self.config.QUESTIONS))
+            logger.info(f"Spilling results to {spill_dir}")
+        
+        for embedding_model in self.embedding_models:
+            endpoints = self.get_reference_endpoints(embedding_model)
+            if endpoints:
+                self.embedding_pools[embedding_model] = EmbeddingPool(
+                    endpoints,
+                    embedding_model,
+                    session=self.session,
+                    timeout=self.config.TIMEOUT,
+                    batch_size=self.config.EMBEDDING_BATCH_SIZE,
+                    batch_wait=self.config.EMBEDDING_BATCH_WAIT,
+                    workers_per_endpoint=self.config.EMBEDDING_WORKERS_PER_ENDPOINT,
+                    prefer_base64=self.config.EMBEDDING_BASE64
+                )
+        
+        try:
+            if self.config.EXPERIMENT_MODE == "models":
+                return self._run_models_experiment()
+            else:
+                return self._run_knowledge_bases_experiment()
+        finally:
+            for pool in self.embedding_pools.values():
+                pool.close()
+            self.embedding_pools = {}
+            # Flushes the archive in record mode
+            self.http_adapter.close()
+            tracer.save()
+            self.progress.write_status()
+            if self.store:
+                self.store.close()
+    
+    def _process_work_item(self, name: str, item, sequence: int, cache_prompt: bool,
+                           budget: Optional[ResponseBudget] = None) -> List[Dict]:
+        """
+        Run one scheduled completion call and embed its responses.
+        
+        Args:
+            name: Model or knowledge base name
+            item: The scheduling.WorkItem to run
+            sequence: Position of the item in the schedule
+            cache_prompt: Ask the server to reuse its cached prompt prefix
+            budget: Optional adaptive budget for this node
+            
+        Returns:
+            List[Dict]: Result items, one per returned sample
+        """
+        q_key = f"Q{item.q_idx+1}"
+        question = self.config.QUESTIONS[item.q_idx]
+        last_repeat = item.first_repeat + item.count - 1
+        logger.info(f"Processing {name}, {q_key}, repeat {item.first_repeat}"
+                    + (f"-{last_repeat}" if item.count > 1 else ""),
+                    extra={"event": "processing", "model": name, "question": q_key,
+                           "repeat": item.first_repeat, "count": item.count})
+        
+        max_tokens = budget.max_tokens(q_key) if budget else self.config.MAX_TOKENS
+        timeout = budget.timeout(q_key) if budget else self.config.TIMEOUT
+        
+        # Get completions; returned choices map onto consecutive repeat indices
+        request_start = time.perf_counter()
+        with span("completion", model=name, question=q_key, repeat=item.first_repeat, count=item.count):
+            choices = self.request_samples(name, question, item.count, cache_prompt=cache_prompt,
+                                           max_tokens=max_tokens, timeout=timeout)
+        latency = time.perf_counter() - request_start
+        
+        if budget and budget.is_reduced(q_key):
+            # Never keep answers cut short by an adapted budget: widen it and
+            # ask again for anything truncated or lost to a timeout
+            kept = [choice for choice in choices if choice.get("finish_reason") != "length"]
+            if len(kept) < item.count:
+                budget.widen(q_key, "truncation" if len(kept) < len(choices) else "timeout or error")
+                retry_start = time.perf_counter()
+                with span("completion_retry", model=name, question=q_key, repeat=item.first_repeat,
+                          count=item.count - len(kept)):
+                    retried = self.request_samples(name, question, item.count - len(kept), cache_prompt=cache_prompt)
+                latency += time.perf_counter() - retry_start
+                for choice in retried:
+                    choice["max_tokens"] = self.config.MAX_TOKENS
+                kept += retried
+                choices = kept
+        
+        items = []
+        for offset, choice in enumerate(choices):
+            repeat = item.first_repeat + offset
+            try:
+                response_text = choice["message"]["content"]
+                
+                # Get one embedding per embedding model; those handled by a
+                # reference pool are Futures, resolved by _resolve_embeddings
+                # once the node is done
+                embeddings = {}
+                for embedding_model in self.embedding_models:
+                    if embedding_model in self.embedding_pools:
+                        embeddings[embedding_model] = self.embedding_pools[embedding_model].submit(response_text)
+                    else:
+                        with span("embedding", model=name, question=q_key, repeat=repeat, embedder=embedding_model):
+                            embeddings[embedding_model] = self.get_embedding(name, response_text, embedding_model)
+                embedding = embeddings[self.embedding_models[0]]
+                
+                usage = choice.get("usage") or {}
+                finish_reason = choice.get("finish_reason")
+                
+                # Store result for this question and repeat
+                items.append({
+                    "repeat": repeat,
+                    "response": response_text,
+                    "embedding": embedding,
+                    "embeddings": embeddings,
+                    "schedule": self.config.SCHEDULING_POLICY,
+                    "sequence": sequence,
+                    "latency": latency,
+                    "finish_reason": finish_reason,
+                    "truncated": finish_reason == "length",
+                    "prompt_tokens": usage.get("prompt_tokens"),
+                    "completion_tokens": usage.get("completion_tokens"),
+                    "max_tokens": choice.get("max_tokens", max_tokens)
+                })
+                
+                if budget and repeat <= self.config.PILOT_REPEATS:
+                    budget.record(q_key, usage.get("completion_tokens"), latency, finish_reason == "length")
+            
+            except (KeyError, IndexError, TypeError) as e:
+                logger.error(f"Error processing {name}, {q_key}, repeat {repeat}: {str(e)}")
+        
+        if self.progress:
+            self.progress.record(name, len(items), item.count - len(items), latency)
+        
+        # Delay between requests
+        with span("request_delay", model=name, question=q_key, repeat=item.first_repeat):
+            time.sleep(self.config.REQUEST_DELAY)
+        
+        return items
+    
+    def _resolve_embeddings(self, name: str, results: Dict[str, List[Dict]]):
+        """
+        Wait for a node's pending reference-pool embeddings and store the vectors.
+        
+        Args:
+            name: Model or knowledge base name
+            results: The node's results, whose pooled "embeddings" entries are Futures
+        """
+        failures = {embedding_model: 0 for embedding_model in self.embedding_pools}
+        for q_items in results.values():
+            for result_item in q_items:
+                for embedding_model in self.embedding_pools:
+                    try:
+                        vector = result_item["embeddings"][embedding_model].result()
+                    except Exception:
+                        vector = np.array([], dtype=np.float32)
+                        failures[embedding_model] += 1
+                    result_item["embeddings"][embedding_model] = vector
+                result_item["embedding"] = result_item["embeddings"][self.embedding_models[0]]
+        
+        for embedding_model, count in failures.items():
+            if count:
+                logger.error(f"{name}: {count} responses could not be embedded with {embedding_model} by the reference pool")
+    
+    def _collect_responses(self, name: str) -> Dict[str, List[Dict]]:
+        """
+        Ask every question NUM_REPEATS times for one model or knowledge base,
+        in the order given by the configured scheduling policy.
+        
+        Calls are dispatched in schedule order to a pool sized by the node's
+        concurrency limit (see get_concurrency), with at most twice that many
+        calls in flight, so finished calls are stored (or spilled) and dropped
+        as the run goes rather than held until the phase ends. Each result item records the
+        policy, its position in the schedule and the latency of the completion
+        call that produced it, so runs with different policies can be compared.
+        
+        Args:
+            name: Model or knowledge base name
+            
+        Returns:
+            Dict: Mapping of question key to the list of result items
+        """
+        results = {f"Q{q_idx+1}": [] for q_idx in range(len(self.config.QUESTIONS))}
+        policy = self.config.SCHEDULING_POLICY
+        schedule = build_schedule(
+            policy,
+            len(self.config.QUESTIONS),
+            self.config.NUM_REPEATS,
+            self.config.SAMPLES_PER_REQUEST,
+            self.config.SCHEDULE_SEED
+        )
+        cache_prompt = policy in CACHE_FRIENDLY_POLICIES
+        budget = ResponseBudget(self.config, name) if self.config.ADAPTIVE_BUDGET else None
+        
+        # With adaptive budgets, the pilot repeats run first at the full budget.
+        # Servers report usage per call, so pilot repeats are asked one sample
+        # per call to give the budget each response's own completion tokens.
+        phases = [list(enumerate(schedule))]
+        if budget:
+            phases = [[], []]
+            for sequence, item in enumerate(schedule):
+                pilot_count = min(max(self.config.PILOT_REPEATS - item.first_repeat + 1, 0), item.count)
+                phases[0].extend((sequence, item._replace(first_repeat=repeat, count=1))
+                                 for repeat in range(item.first_repeat, item.first_repeat + pilot_count))
+                if pilot_count < item.count:
+                    phases[1].append((sequence, item._replace(first_repeat=item.first_repeat + pilot_count,
+                                                              count=item.count - pilot_count)))
+        
+        def run_item(sequence, item):
+            if sequence == 0 or item.block != schedule[sequence - 1].block:
+                logger.info(f"Starting {item.block}", extra={"event": "block_start", "model": name})
+            return item, self._process_work_item(name, item, sequence, cache_prompt, budget)
+        
+        concurrency = self.get_concurrency(name)
+        if self.progress:
+            self.progress.start_node(name, concurrency)
+        if self.store:
+            self.store.start_node(name)
+        
+        def store_result(future):
+            try:
+                item, items = future.result()
+                if self.store:
+                    # Spill each item as soon as its embeddings are in
+                    q_items = {f"Q{item.q_idx+1}": items}
+                    if self.embedding_pools:
+                        self._resolve_embeddings(name, q_items)
+                    self.store.append(f"Q{item.q_idx+1}", items)
+                else:
+                    results[f"Q{item.q_idx+1}"].extend(items)
+            except Exception as e:
+                logger.error(f"Error in scheduled request for {name}: {str(e)}")
+        
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for phase_idx, phase in enumerate(phases):
+                if phase_idx > 0:
+                    budget.finalize()
+                
+                # Bounded submission window: a call is only submitted once the
+                # oldest of the 2 x concurrency in flight has been stored
+                in_flight = deque()
+                for sequence, item in phase:
+                    if len(in_flight) >= 2 * concurrency:
+                        store_result(in_flight.popleft())
+                    in_flight.append(executor.submit(run_item, sequence, item))
+                while in_flight:
+                    store_result(in_flight.popleft())
+        
+        if self.progress:
+            self.progress.finish_node(name)
+        print()  # New line after progress indicator
+        
+        if self.store:
+            truncated = self.store.truncated
+            self.store.finish_node()
+            if truncated:
+                logger.warning(f"{name}: {truncated} responses were truncated at max_tokens")
+            # Results live on disk; nothing is kept in memory for this node
+            return results
+        
+        if self.embedding_pools:
+            with span("embedding_wait", model=name):
+                self._resolve_embeddings(name, results)
+        
+        # Per-model embeddings are only kept when there is more than one model
+        if len(self.embedding_models) == 1:
+            for q_items in results.values():
+                for result_item in q_items:
+                    del result_item["embeddings"]
+        
+        truncated = sum(1 for q_items in results.values() for result_item in q_items if result_item["truncated"])
+        if truncated:
+            logger.warning(f"{name}: {truncated} responses were truncated at max_tokens")
+        
+        # Keep each question's items in repeat order regardless of schedule
+        for q_items in results.values():
+            q_items.sort(key=lambda result_item: result_item["repeat"])
+        
+        return results
             
     def _run_models_experiment(self):
         """Run the experiment with different models."""
@@ -345,48 +928,16 @@ class ExperimentRunner:
             print(f"Model URL: {model_url}")
             
             # Wait for model to become available
-            if not self.wait_for_model_availability(model_name):
+            with span("wait_for_model_availability", model=model_name):
+                available = self.wait_for_model_availability(model_name)
+            if not available:
                 print(f"Skipping {model_name} as it's not available")
+                self.progress.skip_node(model_name)
                 continue
             
-            # Initialize model results structure
-            model_results = {f"Q{q_idx+1}": [] for q_idx in range(len(self.config.QUESTIONS))}
-            
-            # Process questions in rotations
-            for repeat in range(self.config.NUM_REPEATS):
-                logger.info(f"Starting repeat {repeat+1}/{self.config.NUM_REPEATS} for all questions")
-                
-                for q_idx, question in enumerate(self.config.QUESTIONS):
-                    q_key = f"Q{q_idx+1}"
-                    logger.info(f"Processing {model_name}, {q_key}, repeat {repeat+1}")
-                    
-                    # Get completion
-                    completion = self.make_completion_request(model_name, question)
-                    if "error" in completion:
-                        logger.error(f"Error in completion for {q_key}, repeat {repeat+1}")
-                        continue
-                    
-                    try:
-                        response_text = completion["choices"][0]["message"]["content"]
-                        
-                        # Get embedding
-                        embedding = self.get_embedding(model_name, response_text)
-                        
-                        # Store result for this question and repeat
-                        model_results[q_key].append({
-                            "repeat": repeat+1,
-                            "response": response_text,
-                            "embedding": embedding
-                        })
-                        
-                        # Delay between requests
-                        time.sleep(self.config.REQUEST_DELAY)
-                    
-                    except (KeyError, IndexError) as e:
-                        logger.error(f"Error processing {q_key}, repeat {repeat+1}: {str(e)}")
-            
             # Update overall results
-            self.results[model_name] = model_results
+            with span("collect_responses", model=model_name):
+                self.results[model_name] = self._collect_responses(model_name)
             
             # Save intermediate results for this model
             self.save_model_results(model_name)
@@ -430,80 +981,12 @@ class ExperimentRunner:
             os.system(f"gaianet start {local_flag} --base {self.config.NODE_PATH}")
             
             # Wait for node to start
-            time.sleep(15)
-            
-            # Initialize results structure for this knowledge base
-            kb_results = {f"Q{q_idx+1}": [] for q_idx in range(len(self.config.QUESTIONS))}
-            
-            # Process questions in rotations
-            for repeat in range(self.config.NUM_REPEATS):
-                logger.info(f"Starting repeat {repeat+1}/{self.config.NUM_REPEATS} for all questions")
-                
-                for q_idx, question in enumerate(self.config.QUESTIONS):
-                    q_key = f"Q{q_idx+1}"
-                    logger.info(f"Processing {kb_name}, {q_key}, repeat {repeat+1}")
-                    
-                    # Make request to fixed model port
-                    url = f"http://localhost:{self.config.KB_PORT}/v1/chat/completions"
-                    payload = {
-                        "messages": [
-                            {"role": "system", "content": self.config.SYSTEM_PROMPT},
-                            {"role": "user", "content": question}
-                        ],
-                        "temperature": self.config.TEMPERATURE,
-                        "max_tokens": self.config.MAX_TOKENS,
-                        "top_p": self.config.TOP_P
-                    }
-                    
-                    try:
-                        # Get completion
-                        response = requests.post(
-                            url,
-                            headers={"Content-Type": "application/json"},
-                            json=payload,
-                            timeout=self.config.TIMEOUT
-                        )
-                        response.raise_for_status()
-                        response_text = response.json()["choices"][0]["message"]["content"]
-                        
-                        # Get embedding
-                        embedding_url = f"http://localhost:{self.config.KB_PORT}/v1/embeddings"
-                        embedding_payload = {
-                            "model": self.config.EMBEDDING_MODEL,
-                            "input": [response_text]
-                        }
-                        
-                        embedding_response = requests.post(
-                            embedding_url,
-                            headers={"Content-Type": "application/json"},
-                            json=embedding_payload,
-                            timeout=self.config.TIMEOUT
-                        )
-                        embedding_response.raise_for_status()
-                        embedding = embedding_response.json()["data"][0]["embedding"]
-                        
-                        # Store result for this question and repeat
-                        kb_results[q_key].append({
-                            "repeat": repeat+1,
-                            "response": response_text,
-                            "embedding": embedding
-                        })
-                        
-                        # Print progress
-                        print(f"\rProcessed {kb_name}: Question {q_idx+1}/{len(self.config.QUESTIONS)} - "
-                              f"Repeat {repeat+1}/{self.config.NUM_REPEATS}", end="")
-                        
-                        # Delay between requests
-                        time.sleep(self.config.REQUEST_DELAY)
-                        
-                    except Exception as e:
-                        logger.error(f"Error processing {kb_name}, {q_key}, repeat {repeat+1}: {str(e)}")
-                        continue
-                
-                print()  # New line after progress indicator
+            with span("node_start", model=kb_name):
+                time.sleep(15)
             
             # Update overall results
-            self.results[kb_name] = kb_results
+            with span("collect_responses", model=kb_name):
+                self.results[kb_name] = self._collect_responses(kb_name)
             
             # Save intermediate results for this knowledge base
             self.save_model_results(kb_name)
@@ -522,14 +1005,19 @@ class ExperimentRunner:
         Args:
             model_name: Name of the model to save results for
         """
+        if self.store:
+            # Already on disk: records, embeddings and statistics in the spill directory
+            logger.info(f"Results for {model_name} are in {self.store.directory}")
+            return
+        
         output_dir = "./model_results"
         os.makedirs(output_dir, exist_ok=True)
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"{output_dir}/{model_name}_results_{timestamp}.json"
         
-        with open(filename, "w") as f:
-            json.dump(self.results[model_name], f, indent=2)
+        with span("save_model_results", model=model_name), open(filename, "w") as f:
+            json.dump(self.results[model_name], f, indent=2, default=_json_default)
         
         logger.info(f"Saved results for {model_name} to {filename}")
     
@@ -537,7 +1025,13 @@ class ExperimentRunner:
         """
         Save the raw experiment data for analysis.
         Uses pickle to preserve arrays and ensure all data is captured.
+        In SPILL_RESULTS mode the data is already on disk and the spill
+        directory is returned instead.
         """
+        if self.store:
+            logger.info(f"Raw data is in spill directory {self.store.directory}")
+            return self.store.directory
+        
         output_dir = "./results"
         os.makedirs(output_dir, exist_ok=True)
         
@@ -546,7 +1040,7 @@ class ExperimentRunner:
         json_file = f"{output_dir}/raw_results_{timestamp}.json"
         
         # Save as pickle for complete data preservation
-        with open(pickle_file, "wb") as f:
+        with span("save_raw_data_pickle"), open(pickle_file, "wb") as f:
             pickle.dump(self.results, f)
             
         # Save a JSON version for easier inspection (without embeddings)
@@ -557,13 +1051,24 @@ class ExperimentRunner:
                 json_results[model][q_key] = []
                 for item in q_data:
                     # Exclude the embedding to make JSON viewable
-                    json_results[model][q_key].append({
+                    json_item = {
                         "repeat": item["repeat"],
                         "response": item["response"],
                         "has_embedding": len(item.get("embedding", [])) > 0
-                    })
+                    }
+                    # Request scheduling and token usage details, when recorded
+                    for key in ("schedule", "sequence", "latency", "finish_reason", "truncated",
+                                "prompt_tokens", "completion_tokens", "max_tokens"):
+                        if key in item:
+                            json_item[key] = item[key]
+                    if "embeddings" in item:
+                        json_item["embedding_models"] = [
+                            embedding_model for embedding_model, vector in item["embeddings"].items()
+                            if len(vector) > 0
+                        ]
+                    json_results[model][q_key].append(json_item)
         
-        with open(json_file, "w") as f:
+        with span("save_raw_data_json"), open(json_file, "w") as f:
             json.dump(json_results, f, indent=2)
             
         logger.info(f"Saved raw data to {pickle_file} and {json_file}")
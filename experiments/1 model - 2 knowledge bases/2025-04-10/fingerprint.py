@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Deterministic Logprob Fingerprinting
+
+Identifies the model behind a node from a small fixed probe set instead of
+NUM_REPEATS sampled generations per question. Each probe is sent once with
+greedy decoding (temperature 0). Where the node returns top-k logprobs, the
+per-position token distributions form the model's signature and nodes are
+compared by Jensen-Shannon divergence. Nodes that don't return logprobs fall
+back to a hash of the greedy text.
+"""
+
+import os
+import json
+import math
+import hashlib
+import itertools
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import requests
+import pandas as pd
+
+from experiment_runner import Config
+
+logger = logging.getLogger(__name__)
+
+# Maximum Jensen-Shannon divergence (natural log), used for positions that
+# cannot be compared because the greedy continuations have already diverged
+MAX_DIVERGENCE = math.log(2)
+
+
+class LogprobFingerprinter:
+    """Collects compact greedy-decoding signatures from model endpoints."""
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.session = requests.Session()
+        # Nodes that rejected the logprobs parameters; they get text hashes only
+        self.logprobs_unsupported = set()
+
+    def make_probe_request(self, model: str, base_url: str, prompt: str) -> Dict:
+        """
+        Send one greedy probe, requesting top-k logprobs unless the node is
+        known not to support them.
+
+        Args:
+            model: Name of the model being probed
+            base_url: Base URL of the model's API
+            prompt: The probe prompt
+
+        Returns:
+            Dict: The JSON response from the API, or {"error": ...}
+        """
+        payload = {
+            "messages": [
+                {"role": "system", "content": self.config.SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0,
+            "max_tokens": self.config.FINGERPRINT_MAX_TOKENS
+        }
+        if model not in self.logprobs_unsupported:
+            payload["logprobs"] = True
+            payload["top_logprobs"] = self.config.FINGERPRINT_TOP_LOGPROBS
+
+        url = f"{base_url}/v1/chat/completions"
+        headers = {
+            "accept": "application/json",
+            "Content-Type": "application/json"
+        }
+
+        try:
+            response = self.session.post(url, headers=headers, json=payload, timeout=self.config.TIMEOUT)
+            if response.status_code in (400, 422) and "logprobs" in payload:
+                # Server doesn't understand the logprobs parameters; retry without them
+                logger.info(f"{model} rejected logprobs parameters, falling back to text hashing")
+                self.logprobs_unsupported.add(model)
+                return self.make_probe_request(model, base_url, prompt)
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error making probe request to {model}: {str(e)}")
+            return {"error": str(e)}
+
+    def build_probe_signature(self, completion: Dict) -> Dict:
+        """
+        Reduce a probe completion to its compact signature.
+
+        Args:
+            completion: The JSON response from the chat completions API
+
+        Returns:
+            Dict: Greedy text hash plus, where available, the greedy tokens and
+            the top-k {token: logprob} distribution at each position
+        """
+        choice = completion["choices"][0]
+        text = choice["message"]["content"]
+        signature = {
+            "text_hash": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+            "tokens": None,
+            "top_logprobs": None
+        }
+
+        content = (choice.get("logprobs") or {}).get("content")
+        if content:
+            positions = content[:self.config.FINGERPRINT_MAX_TOKENS]
+            signature["tokens"] = [entry["token"] for entry in positions]
+            signature["top_logprobs"] = [
+                {alt["token"]: alt["logprob"] for alt in entry.get("top_logprobs", [])}
+                or {entry["token"]: entry["logprob"]}
+                for entry in positions
+            ]
+
+        return signature
+
+    def collect_fingerprint(self, model: str, base_url: str) -> Dict:
+        """
+        Send every probe once to a model and collect its signature.
+
+        Args:
+            model: Name of the model to fingerprint
+            base_url: Base URL of the model's API
+
+        Returns:
+            Dict: Fingerprint with one signature per probe prompt
+        """
+        probes = {}
+        for p_idx, prompt in enumerate(self.config.FINGERPRINT_PROMPTS):
+            p_key = f"P{p_idx+1}"
+            logger.info(f"Probing {model}, {p_key}")
+
+            completion = self.make_probe_request(model, base_url, prompt)
+            if "error" in completion:
+                continue
+
+            try:
+                probes[p_key] = self.build_probe_signature(completion)
+            except (KeyError, IndexError, TypeError) as e:
+                logger.error(f"Unexpected probe response from {model}, {p_key}: {str(e)}")
+
+        with_logprobs = sum(1 for sig in probes.values() if sig["top_logprobs"])
+        logger.info(f"Fingerprinted {model}: {len(probes)}/{len(self.config.FINGERPRINT_PROMPTS)} probes, "
+                    f"{with_logprobs} with logprobs")
+
+        return {
+            "model": model,
+            "created": datetime.now().isoformat(),
+            "top_logprobs": self.config.FINGERPRINT_TOP_LOGPROBS,
+            "max_tokens": self.config.FINGERPRINT_MAX_TOKENS,
+            "prompts": list(self.config.FINGERPRINT_PROMPTS),
+            "probes": probes
+        }
+
+    def run(self, endpoints: Optional[Dict[str, str]] = None) -> Dict[str, Dict]:
+        """
+        Fingerprint every configured model.
+
+        Args:
+            endpoints: Optional mapping of model name to base URL
+                (defaults to config.MODELS)
+
+        Returns:
+            Dict: Mapping of model name to fingerprint
+        """
+        endpoints = endpoints or self.config.MODELS
+        return {model: self.collect_fingerprint(model, url) for model, url in endpoints.items()}
+
+    def save_fingerprints(self, fingerprints: Dict[str, Dict], output_dir: str = "./fingerprints") -> List[str]:
+        """
+        Save one JSON file per fingerprint.
+
+        Args:
+            fingerprints: Mapping of model name to fingerprint
+            output_dir: Directory to write the files to
+
+        Returns:
+            List[str]: Paths of the written files
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        paths = []
+        for model, fingerprint in fingerprints.items():
+            filename = f"{output_dir}/{model}_fingerprint_{timestamp}.json"
+            with open(filename, "w") as f:
+                json.dump(fingerprint, f, indent=2)
+            logger.info(f"Saved fingerprint for {model} to {filename}")
+            paths.append(filename)
+
+        return paths
+
+
+def _position_divergence(p_logprobs: Dict[str, float], q_logprobs: Dict[str, float]) -> float:
+    """
+    Jensen-Shannon divergence between two truncated top-k distributions.
+
+    Probability mass outside the top-k is lumped into a single "other" bucket,
+    so tokens missing from one side are compared against that residual.
+    """
+    tokens = set(p_logprobs) | set(q_logprobs)
+
+    def to_distribution(logprobs):
+        probs = {token: math.exp(logprobs[token]) for token in tokens if token in logprobs}
+        other = max(0.0, 1.0 - sum(probs.values()))
+        # Split the residual evenly over tokens that fell outside this top-k
+        missing = [token for token in tokens if token not in probs]
+        for token in missing:
+            probs[token] = other / (len(missing) + 1)
+        probs[None] = other / (len(missing) + 1)
+        total = sum(probs.values())
+        return {token: prob / total for token, prob in probs.items()}
+
+    p = to_distribution(p_logprobs)
+    q = to_distribution(q_logprobs)
+
+    divergence = 0.0
+    for token in tokens | {None}:
+        m = (p[token] + q[token]) / 2
+        if p[token] > 0:
+            divergence += 0.5 * p[token] * math.log(p[token] / m)
+        if q[token] > 0:
+            divergence += 0.5 * q[token] * math.log(q[token] / m)
+    return divergence
+
+
+def probe_divergence(sig_a: Dict, sig_b: Dict) -> float:
+    """
+    Divergence between two signatures for the same probe, in [0, ln 2].
+
+    Positions are compared up to and including the first differing greedy
+    token; later positions condition on different prefixes and count as
+    maximally divergent. Without logprobs on both sides, falls back to
+    comparing greedy text hashes.
+    """
+    if not sig_a["top_logprobs"] or not sig_b["top_logprobs"]:
+        return 0.0 if sig_a["text_hash"] == sig_b["text_hash"] else MAX_DIVERGENCE
+
+    length = max(len(sig_a["top_logprobs"]), len(sig_b["top_logprobs"]))
+    divergences = []
+    for pos in range(length):
+        if pos >= len(sig_a["top_logprobs"]) or pos >= len(sig_b["top_logprobs"]):
+            divergences.append(MAX_DIVERGENCE)
+            continue
+        divergences.append(_position_divergence(sig_a["top_logprobs"][pos], sig_b["top_logprobs"][pos]))
+        if sig_a["tokens"][pos] != sig_b["tokens"][pos]:
+            divergences.extend([MAX_DIVERGENCE] * (length - pos - 1))
+            break
+
+    return sum(divergences) / len(divergences)
+
+
+def compare_fingerprints(fp_a: Dict, fp_b: Dict) -> float:
+    """
+    Mean probe divergence between two fingerprints over their shared probes.
+
+    Args:
+        fp_a: First fingerprint
+        fp_b: Second fingerprint
+
+    Returns:
+        float: Mean divergence (0 = identical, ln 2 = completely different),
+        or NaN if the fingerprints share no probes
+    """
+    shared = [p for p in fp_a["probes"] if p in fp_b["probes"]]
+    if fp_a.get("prompts") != fp_b.get("prompts"):
+        logger.warning(f"Fingerprints for {fp_a['model']} and {fp_b['model']} used different probe sets")
+    if not shared:
+        return float("nan")
+    return sum(probe_divergence(fp_a["probes"][p], fp_b["probes"][p]) for p in shared) / len(shared)
+
+
+def divergence_table(fingerprints: Dict[str, Dict]) -> pd.DataFrame:
+    """
+    Pairwise divergences between all fingerprints.
+
+    Args:
+        fingerprints: Mapping of name to fingerprint
+
+    Returns:
+        pd.DataFrame: One row per pair with columns model1, model2, divergence
+    """
+    rows = []
+    for name1, name2 in itertools.combinations(fingerprints.keys(), 2):
+        rows.append({
+            "model1": name1,
+            "model2": name2,
+            "divergence": compare_fingerprints(fingerprints[name1], fingerprints[name2])
+        })
+    return pd.DataFrame(rows, columns=["model1", "model2", "divergence"])
+
+
+def load_fingerprint(path: str) -> Dict:
+    """Load a fingerprint saved by LogprobFingerprinter.save_fingerprints."""
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def main():
+    """Fingerprint the configured models, or compare saved fingerprints."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Greedy logprob fingerprinting of model nodes")
+    parser.add_argument("--compare", nargs="+", metavar="FILE",
+                        help="Compare saved fingerprint files instead of probing nodes")
+    parser.add_argument("--output-dir", default="./fingerprints", help="Directory to save fingerprints")
+    args = parser.parse_args()
+
+    if args.compare:
+        fingerprints = {}
+        for path in args.compare:
+            fingerprint = load_fingerprint(path)
+            fingerprints[fingerprint["model"]] = fingerprint
+    else:
+        fingerprinter = LogprobFingerprinter(Config())
+        fingerprints = fingerprinter.run()
+        fingerprinter.save_fingerprints(fingerprints, args.output_dir)
+
+    print("\nPairwise fingerprint divergence (0 = identical, 0.693 = unrelated):")
+    print(divergence_table(fingerprints).to_markdown(index=False, floatfmt=".4f"))
+
+
+if __name__ == "__main__":
+    main()
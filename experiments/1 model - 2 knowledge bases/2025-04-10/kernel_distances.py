@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Distribution Distances
+
+Centroid distance only compares mean embeddings, so two models with the same
+mean but differently shaped answer distributions (one of them sometimes
+refusing, say) look alike. This module compares the full response
+distributions per question with:
+
+- MMD² (unbiased) under a Gaussian RBF kernel, with the bandwidth set by the
+  median heuristic over all of the question's responses
+- MMD² (unbiased) under the cosine kernel
+- energy distance, 2 E|X - Y| - E|X - X'| - E|Y - Y'|
+
+All three only need inner products. For each question the responses of all
+models are pooled into one (N, d) matrix and a single Gram matrix is
+computed; the kernel and distance matrices follow elementwise. Block sums
+per model pair then come from one product A^T K A with the (N, M) model
+membership matrix, so every within-model and between-model block is summed
+once and reused by all M (M - 1) / 2 pairs.
+"""
+
+import logging
+import itertools
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def _block_sums(matrix: np.ndarray, membership: np.ndarray) -> np.ndarray:
+    """Sums of every (model, model) block of an (N, N) matrix: (M, M)."""
+    return membership.T @ matrix @ membership
+
+
+def question_distances(samples: List[np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Distribution distances between every pair of samples of one question.
+
+    Args:
+        samples: (n_m, d) embedding matrices, one per model, each with n_m >= 2
+
+    Returns:
+        Dict[str, np.ndarray]: (M, M) matrices "mmd2_rbf", "mmd2_cosine" and
+        "energy_distance", plus the RBF "bandwidth"
+    """
+    counts = np.array([sample.shape[0] for sample in samples])
+    pooled = np.vstack(samples)
+    membership = np.zeros((pooled.shape[0], len(samples)))
+    membership[np.arange(pooled.shape[0]), np.repeat(np.arange(len(samples)), counts)] = 1.0
+
+    gram = pooled @ pooled.T
+    norms_sq = np.diag(gram).copy()
+    squared = np.maximum(norms_sq[:, None] + norms_sq[None, :] - 2 * gram, 0.0)
+    np.fill_diagonal(squared, 0.0)
+
+    # Median heuristic over distinct pairs: 2 sigma^2 = median squared distance
+    upper = squared[np.triu_indices_from(squared, k=1)]
+    positive = upper[upper > 0]
+    bandwidth = float(np.median(positive)) if positive.size else 1.0
+
+    norms = np.sqrt(norms_sq)
+    norms[norms == 0] = 1.0
+    kernels = {
+        "mmd2_rbf": np.exp(-squared / bandwidth),
+        "mmd2_cosine": gram / np.outer(norms, norms)
+    }
+
+    # Within-model means exclude the diagonal (unbiased U-statistics)
+    pairs_within = counts * (counts - 1)
+    pairs_between = np.outer(counts, counts)
+    distances = {}
+    for name, kernel in kernels.items():
+        sums = _block_sums(kernel, membership)
+        within = (np.diag(sums) - membership.T @ np.diag(kernel)) / pairs_within
+        between = sums / pairs_between
+        distances[name] = within[:, None] + within[None, :] - 2 * between
+
+    # Energy distance from Euclidean distances (the diagonal is zero already)
+    sums = _block_sums(np.sqrt(squared), membership)
+    within = np.diag(sums) / pairs_within
+    between = sums / pairs_between
+    distances["energy_distance"] = 2 * between - within[:, None] - within[None, :]
+
+    for matrix in distances.values():
+        np.fill_diagonal(matrix, 0.0)
+    distances["bandwidth"] = bandwidth
+    return distances
+
+
+def distribution_distances(samples: Dict[str, Dict[str, np.ndarray]], models: List[str],
+                           questions: List[str]) -> pd.DataFrame:
+    """
+    Distribution distances for every model pair and question.
+
+    Args:
+        samples: Embedding matrices {model: {question: (n, d) array}}
+        models: Models to compare
+        questions: Questions to include
+
+    Returns:
+        pd.DataFrame: One row per (question, model pair) with mmd2_rbf,
+        mmd2_cosine and energy_distance
+    """
+    rows = []
+    for question in questions:
+        present = [model for model in models
+                   if question in samples.get(model, {}) and samples[model][question].shape[0] >= 2]
+        if len(present) < 2:
+            continue
+        distances = question_distances([np.asarray(samples[model][question], dtype=np.float64)
+                                        for model in present])
+        for i, j in itertools.combinations(range(len(present)), 2):
+            rows.append({
+                "question": question,
+                "model1": present[i],
+                "model2": present[j],
+                "mmd2_rbf": distances["mmd2_rbf"][i, j],
+                "mmd2_cosine": distances["mmd2_cosine"][i, j],
+                "energy_distance": distances["energy_distance"][i, j]
+            })
+
+    logger.info(f"Distribution distances: {len(rows)} (question, pair) comparisons over {len(questions)} questions")
+    return pd.DataFrame(rows)
@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""
+Legacy Result Loader
+
+Reads every result format the experiments have written and normalises them
+into one columnar table, so historic runs can be analysed together:
+
+- "raw_pickle" / "raw_json": save_raw_data's raw_results_*.pkl (with
+  embeddings) and its JSON copy (responses only), {node: {question: [items]}}
+- "model_results": the runner's per-model model_results/*_results_*.json,
+  {question: [items]}
+- "spill": spill directories written with SPILL_RESULTS
+- "std_model" / "std_full": experiment_script_std.py's per-model
+  {"responses", "embeddings", "stats"} files (read by response_analysis.py)
+  and its full_experiment_results_*.json with one of those per model
+- "compact": experiment_2.py's results_*.json, per node and question a
+  "stats" dict with "median_embedding" and "std_dev", plus up to three
+  sample responses
+- "std_stats": response_analysis.py's *_stats.json, per question the mean
+  and standard deviation of the embeddings only
+
+Individual responses go into a DataFrame (source, format, node, question,
+repeat, response, latency, ...) with one float32 (N, d) matrix per embedding
+model aligned to its rows (NaN rows where a response has no vector). Formats
+that only kept per-question statistics go into a second DataFrame of
+summaries with the centre embedding (median or mean) and its spread.
+
+Files are parsed in parallel with a process pool; each worker returns a
+table for one file and the tables are concatenated in input order.
+"""
+
+import os
+import re
+import json
+import pickle
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from catalog import experiment_folder, runner_config
+from reembed import MODEL_RESULTS_PATTERN
+from result_store import is_spill_directory, load_spilled_results
+
+logger = logging.getLogger(__name__)
+
+QUESTION_KEY = re.compile(r"^Q\d+$")
+
+# Per-item fields kept as response columns, when present
+ITEM_COLUMNS = ("latency", "finish_reason", "truncated", "prompt_tokens", "completion_tokens")
+
+# Formats from most to least complete, to choose among identical copies
+FORMAT_PREFERENCE = ["spill", "raw_pickle", "std_full", "std_model", "model_results", "raw_json", "compact", "std_stats"]
+
+# Name used for vectors whose embedding model isn't recorded anywhere
+UNKNOWN_EMBEDDER = "unknown"
+
+
+def _question_keyed(data, extra_keys: Tuple[str, ...] = ()) -> bool:
+    return isinstance(data, dict) and bool(data) and all(QUESTION_KEY.match(str(key)) or key in extra_keys
+                                                         for key in data)
+
+
+def detect_format(path: str, data=None) -> Optional[str]:
+    """
+    Name the result format of a file or directory.
+
+    Args:
+        path: File or spill directory
+        data: The file's parsed content, if already loaded
+
+    Returns:
+        Optional[str]: One of the formats in this module's docstring, None if unrecognised
+    """
+    if is_spill_directory(path):
+        return "spill"
+    if path.endswith(".pkl"):
+        return "raw_pickle"
+    if data is None:
+        return None
+
+    if isinstance(data, dict) and {"responses", "embeddings"} <= set(data):
+        return "std_model"
+    # response_analysis.py adds an "overall" entry next to the questions
+    if _question_keyed(data, ("overall",)):
+        values = [value for key, value in data.items() if key != "overall"]
+        if values and all(isinstance(value, list) for value in values) and "overall" not in data:
+            return "model_results"
+        if any(isinstance(value, dict) and "mean_embedding" in value for value in values):
+            return "std_stats"
+        return None
+    if not isinstance(data, dict) or not data or not all(isinstance(value, dict) for value in data.values()):
+        return None
+
+    # Nodes that produced nothing are saved as empty dicts
+    node_values = [value for value in data.values() if value]
+    if not node_values:
+        return None
+    if all({"responses", "embeddings"} <= set(value) for value in node_values):
+        return "std_full"
+    if all(_question_keyed(value) for value in node_values):
+        first = next(iter(node_values[0].values()))
+        if isinstance(first, list):
+            return "raw_json"
+        if isinstance(first, dict) and ("stats" in first or "num_responses" in first):
+            return "compact"
+    return None
+
+
+class ResultTable:
+    """Responses of one or more result files in columnar form."""
+
+    def __init__(self, responses: pd.DataFrame, vectors: Dict[str, np.ndarray],
+                 summaries: Optional[pd.DataFrame] = None):
+        """
+        Args:
+            responses: One row per response
+            vectors: Per embedding model, (len(responses), d) float32 with NaN rows where missing
+            summaries: One row per (source, node, question) for formats that only kept statistics
+        """
+        self.responses = responses.reset_index(drop=True)
+        self.vectors = vectors
+        self.summaries = summaries if summaries is not None else pd.DataFrame(
+            columns=["source", "format", "node", "question", "num_responses", "center_kind", "center", "std_dev"])
+
+    def __len__(self) -> int:
+        return len(self.responses)
+
+    @classmethod
+    def concat(cls, tables: List["ResultTable"]) -> "ResultTable":
+        """
+        Stack tables row-wise.
+
+        An embedding model seen with different dimensions in different files
+        (e.g. two gte-qwen2 sizes) is split into one matrix per dimension.
+        """
+        tables = [table for table in tables if table is not None]
+        sizes = [len(table) for table in tables]
+        offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(int)
+
+        dims: Dict[str, set] = {}
+        for table in tables:
+            for embedder, matrix in table.vectors.items():
+                dims.setdefault(embedder, set()).add(matrix.shape[1])
+        vectors: Dict[str, np.ndarray] = {}
+        for t_index, table in enumerate(tables):
+            for embedder, matrix in table.vectors.items():
+                name = embedder if len(dims[embedder]) == 1 else f"{embedder} ({matrix.shape[1]}d)"
+                if name not in vectors:
+                    vectors[name] = np.full((offsets[-1], matrix.shape[1]), np.nan, dtype=np.float32)
+                vectors[name][offsets[t_index]:offsets[t_index + 1]] = matrix
+        for embedder, found in dims.items():
+            if len(found) > 1:
+                logger.warning(f"{embedder} vectors have dimensions {sorted(found)}; kept apart")
+
+        responses = pd.concat([table.responses for table in tables], ignore_index=True) if tables \
+            else pd.DataFrame(columns=["source", "format", "node", "question", "repeat", "response"])
+        summary_frames = [table.summaries for table in tables if len(table.summaries)]
+        summaries = pd.concat(summary_frames, ignore_index=True) if summary_frames else None
+        return cls(responses, vectors, summaries)
+
+    def has_vector(self) -> np.ndarray:
+        """(N,) True for responses with a vector from any embedding model."""
+        present = np.zeros(len(self), dtype=bool)
+        for matrix in self.vectors.values():
+            present |= ~np.isnan(matrix).any(axis=1)
+        return present
+
+    def node_labels(self) -> pd.Series:
+        """Node names, suffixed with the experiment folder and file where a node appears in several sources."""
+        sources = self.responses.groupby("node")["source"].nunique()
+        shared = self.responses["node"].map(sources) > 1
+        names = self.responses["source"].map(lambda source: os.path.join(
+            os.path.basename(experiment_folder(source)), os.path.splitext(os.path.basename(source))[0]))
+        return self.responses["node"].where(~shared, self.responses["node"] + " (" + names + ")")
+
+    def drop_duplicates(self) -> "ResultTable":
+        """
+        Keep one copy of each node's responses.
+
+        A node's responses in one source are fingerprinted by the node name and
+        their (question, repeat, response) triples; among identical copies (a
+        pickle and its JSON, model_results files, runs copied between folders)
+        the one with the most vectors is kept, then the one in the fuller
+        format (FORMAT_PREFERENCE), then the first.
+        """
+        if not len(self):
+            return self
+        frame = self.responses[["source", "node"]].assign(
+            preference=self.responses["format"].map(FORMAT_PREFERENCE.index),
+            key=self.responses["question"].astype(str) + "\t" + self.responses["repeat"].astype(str) + "\t"
+            + self.responses["response"].astype(str),
+            vectors=self.has_vector())
+        groups = frame.groupby(["source", "node"], sort=False)
+        copies = groups["vectors"].sum().rename("vectors").to_frame()
+        copies["preference"] = groups["preference"].first()
+        copies["fingerprint"] = [hashlib.sha256("\n".join([node] + sorted(keys)).encode("utf-8")).hexdigest()
+                                 for (_, node), keys in groups["key"]]
+        copies["order"] = np.arange(len(copies))
+        keep = copies.sort_values(["vectors", "preference", "order"],
+                                  ascending=[False, True, True]).drop_duplicates("fingerprint")
+        dropped = len(copies) - len(keep)
+        if not dropped:
+            return self
+
+        mask = pd.MultiIndex.from_frame(frame[["source", "node"]]).isin(keep.index)
+        logger.info(f"Dropped {dropped} duplicate (source, node) copies, {int((~mask).sum())} responses")
+        return ResultTable(self.responses[mask], {embedder: matrix[mask] for embedder, matrix in self.vectors.items()},
+                           self.summaries)
+
+    def embedding_samples(self, embedder: str) -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        Embedding matrices per node and question, as the analyzer's statistics take them.
+
+        Returns:
+            Dict: {node: {question: (n, d) float64}} for responses with a vector from the embedder
+        """
+        matrix = self.vectors[embedder]
+        present = ~np.isnan(matrix).any(axis=1)
+        frame = pd.DataFrame({"node": self.node_labels(), "question": self.responses["question"]})[present]
+        samples: Dict[str, Dict[str, np.ndarray]] = {}
+        for (node, question), rows in frame.groupby(["node", "question"], sort=False):
+            samples.setdefault(node, {})[question] = matrix[rows.index.to_numpy()].astype(np.float64)
+        return samples
+
+    def to_results(self) -> Dict[str, Dict[str, List[Dict]]]:
+        """
+        The responses in the runner's {node: {question: [items]}} structure.
+
+        Items carry "embedding" (the first embedding model's vector) and, when
+        there are several models, "embeddings".
+        """
+        embedders = list(self.vectors)
+        labels = self.node_labels()
+        extra = [column for column in ITEM_COLUMNS if column in self.responses]
+        results: Dict[str, Dict[str, List[Dict]]] = {}
+        for index, row in enumerate(self.responses.itertuples(index=False)):
+            vectors = {embedder: self.vectors[embedder][index] for embedder in embedders}
+            vectors = {embedder: vector for embedder, vector in vectors.items() if not np.isnan(vector).any()}
+            item = {"repeat": row.repeat, "response": row.response,
+                    "embedding": vectors.get(embedders[0], []) if embedders else []}
+            if len(embedders) > 1:
+                item["embeddings"] = vectors
+            for column in extra:
+                value = getattr(row, column)
+                if value is not None and not (isinstance(value, float) and np.isnan(value)):
+                    item[column] = value
+            results.setdefault(labels.iloc[index], {}).setdefault(row.question, []).append(item)
+        return results
+
+
+class _TableBuilder:
+    """Collects one file's rows before they are turned into columns."""
+
+    def __init__(self, source: str, result_format: str, default_embedder: str):
+        self.source = source
+        self.format = result_format
+        self.default_embedder = default_embedder
+        self.rows: List[Dict] = []
+        self.vectors: Dict[str, Dict[int, np.ndarray]] = {}
+        self.summaries: List[Dict] = []
+
+    def add(self, node: str, question: str, repeat, response, vectors: Dict[str, object], **extra):
+        index = len(self.rows)
+        self.rows.append({"source": self.source, "format": self.format, "node": node, "question": question,
+                          "repeat": repeat, "response": response, **extra})
+        for embedder, vector in vectors.items():
+            if vector is not None and len(vector) > 0:
+                self.vectors.setdefault(embedder, {})[index] = np.asarray(vector, dtype=np.float32)
+
+    def add_items(self, node: str, node_results: Dict[str, List[Dict]]):
+        """Add runner-style items (raw results, model_results and spill formats)."""
+        for question, items in node_results.items():
+            for item in items:
+                if item.get("embeddings"):
+                    vectors = item["embeddings"]
+                else:
+                    vectors = {self.default_embedder: item.get("embedding")}
+                self.add(node, question, item.get("repeat"), item.get("response"), vectors,
+                         **{column: item[column] for column in ITEM_COLUMNS if column in item})
+
+    def add_summary(self, node: str, question: str, num_responses, center_kind: str, center, std_dev):
+        self.summaries.append({
+            "source": self.source, "format": self.format, "node": node, "question": question,
+            "num_responses": num_responses, "center_kind": center_kind,
+            "center": np.asarray(center, dtype=np.float32) if center is not None else None,
+            "std_dev": std_dev
+        })
+
+    def build(self) -> ResultTable:
+        vectors = {}
+        for embedder, by_row in self.vectors.items():
+            dim = len(next(iter(by_row.values())))
+            matrix = np.full((len(self.rows), dim), np.nan, dtype=np.float32)
+            for index, vector in by_row.items():
+                if len(vector) == dim:
+                    matrix[index] = vector
+            vectors[embedder] = matrix
+        responses = pd.DataFrame(self.rows, columns=None if self.rows else
+                                 ["source", "format", "node", "question", "repeat", "response"])
+        return ResultTable(responses, vectors, pd.DataFrame(self.summaries) if self.summaries else None)
+
+
+def _node_from_filename(path: str) -> str:
+    match = MODEL_RESULTS_PATTERN.match(os.path.basename(path))
+    return match.group("model") if match else os.path.splitext(os.path.basename(path))[0]
+
+
+def _add_std_model(builder: _TableBuilder, node: str, data: Dict):
+    embeddings = data.get("embeddings", {})
+    for question, responses in data.get("responses", {}).items():
+        question_vectors = embeddings.get(question, [])
+        for index, response in enumerate(responses):
+            vector = question_vectors[index] if index < len(question_vectors) else None
+            builder.add(node, question, index + 1, response, {builder.default_embedder: vector})
+
+
+def load_file(path: str) -> ResultTable:
+    """
+    Load one result file or spill directory of any known format.
+
+    The embedding model of single-embedder files comes from the
+    EMBEDDING_MODEL of the experiment folder's runner script, when it has one.
+
+    Args:
+        path: Result file or spill directory
+
+    Returns:
+        ResultTable: The file's responses and summaries
+
+    Raises:
+        ValueError: If the format isn't recognised
+    """
+    data = None
+    if not is_spill_directory(path) and path.endswith(".json"):
+        with open(path) as f:
+            data = json.load(f)
+    result_format = detect_format(path, data)
+    if result_format is None:
+        raise ValueError(f"Unrecognised result format: {path}")
+
+    default_embedder = runner_config(experiment_folder(path)).get("EMBEDDING_MODEL", UNKNOWN_EMBEDDER)
+    builder = _TableBuilder(path, result_format, default_embedder)
+
+    if result_format == "spill":
+        for node, node_results in load_spilled_results(path, mmap=False).items():
+            builder.add_items(node, node_results)
+    elif result_format == "raw_pickle":
+        with open(path, "rb") as f:
+            for node, node_results in pickle.load(f).items():
+                builder.add_items(node, node_results)
+    elif result_format == "raw_json":
+        for node, node_results in data.items():
+            builder.add_items(node, node_results)
+    elif result_format == "model_results":
+        builder.add_items(_node_from_filename(path), data)
+    elif result_format == "std_model":
+        _add_std_model(builder, _node_from_filename(path), data)
+    elif result_format == "std_full":
+        for node, node_data in data.items():
+            _add_std_model(builder, node, node_data)
+    elif result_format == "compact":
+        for node, node_results in data.items():
+            for question, entry in node_results.items():
+                for index, response in enumerate(entry.get("sample_responses", [])):
+                    builder.add(node, question, index + 1, response, {})
+                stats = entry.get("stats") or {}
+                if stats:
+                    builder.add_summary(node, question, stats.get("num_responses", entry.get("num_responses")),
+                                        "median", stats.get("median_embedding"), stats.get("std_dev"))
+    elif result_format == "std_stats":
+        node = os.path.basename(path).rsplit("_stats", 1)[0]
+        for question, stats in data.items():
+            if QUESTION_KEY.match(question):
+                builder.add_summary(node, question, None, "mean", stats.get("mean_embedding"), stats.get("mean_std"))
+
+    table = builder.build()
+    logger.info(f"{path}: {result_format}, {len(table)} responses, {len(table.summaries)} summaries")
+    return table
+
+
+def find_result_files(paths: List[str]) -> List[str]:
+    """
+    Result files under the given files or directories, in a stable order.
+
+    JSON copies of raw_results pickles are left out when the pickle is there.
+    """
+    found = []
+    for path in paths:
+        if os.path.isfile(path) or is_spill_directory(path):
+            found.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            spills = [name for name in dirs if is_spill_directory(os.path.join(root, name))]
+            found.extend(os.path.join(root, name) for name in sorted(spills))
+            dirs[:] = sorted(name for name in dirs if name not in spills and name != "__pycache__")
+            found.extend(os.path.join(root, name) for name in sorted(files)
+                         if name.endswith((".pkl", ".json")) and name != "manifest.json")
+
+    present = set(found)
+    return [path for path in dict.fromkeys(found)
+            if not (path.endswith(".json") and path[:-len(".json")] + ".pkl" in present)]
+
+
+def _load_or_none(path: str) -> Optional[ResultTable]:
+    try:
+        return load_file(path)
+    except Exception as e:
+        logger.debug(f"Skipping {path}: {str(e)}")
+        return None
+
+
+def load_all(paths: List[str], workers: Optional[int] = None,
+             keep_duplicates: bool = False) -> Tuple[ResultTable, List[str]]:
+    """
+    Load every recognised result file under the given paths, in parallel.
+
+    Args:
+        paths: Files, spill directories or folders to search
+        workers: Worker processes (default: one per CPU)
+        keep_duplicates: Keep identical copies of a node's responses (see ResultTable.drop_duplicates)
+
+    Returns:
+        Tuple[ResultTable, List[str]]: All responses and summaries, and the files that were loaded
+    """
+    files = find_result_files(paths)
+    workers = workers or os.cpu_count() or 1
+    logger.info(f"Loading {len(files)} candidate files with {workers} worker(s)")
+
+    if workers == 1 or len(files) <= 1:
+        tables = [_load_or_none(path) for path in files]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(files))) as executor:
+            tables = list(executor.map(_load_or_none, files))
+
+    loaded = [path for path, table in zip(files, tables) if table is not None]
+    table = ResultTable.concat(tables)
+    return (table if keep_duplicates else table.drop_duplicates()), loaded
+
+
+def main():
+    """Load historic results of every format and summarise or combine them."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load result files of every historic format into one table")
+    parser.add_argument("paths", nargs="+", help="Result files, spill directories or folders to search")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--keep-duplicates", action="store_true",
+                        help="Keep identical copies of a node's responses found in several files")
+    parser.add_argument("--output", help="Write the combined responses as a raw_results-style pickle for the analyzer")
+
+    args = parser.parse_args()
+
+    table, loaded = load_all(args.paths, args.workers, args.keep_duplicates)
+    if not loaded:
+        print("No result files found")
+        return
+
+    counts = table.responses.assign(with_vectors=table.has_vector()).groupby(["source", "format"], sort=False).agg(
+        nodes=("node", "nunique"), questions=("question", "nunique"), responses=("response", "size"),
+        with_vectors=("with_vectors", "sum"))
+    summaries = table.summaries.groupby(["source", "format"], sort=False).size().rename("summaries")
+    overview = counts.join(summaries, how="outer").fillna(0).reset_index()
+    overview["source"] = overview["source"].map(lambda source: os.path.relpath(source))
+    print(overview.to_markdown(index=False))
+    print(f"\n{len(table)} responses and {len(table.summaries)} summaries from {len(loaded)} files; "
+          f"embedding models: {', '.join(f'{name} ({matrix.shape[1]}d)' for name, matrix in table.vectors.items()) or 'none'}")
+
+    if args.output:
+        with open(args.output, "wb") as f:
+            pickle.dump(table.to_results(), f)
+        print(f"Combined results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Logging Setup
+
+Non-blocking logging for the runner and analyzer. Records are put on an
+in-memory queue by the calling thread and written to the log file and console
+by a single listener thread, so file and terminal I/O never sits in a request
+worker's path.
+
+Per-request chatter ("Processing ...", block banners, per-question details) is
+logged with an `event` name in `extra`. Such records can be sampled per level:
+with LOG_SAMPLE_EVERY = {"INFO": 50}, one in 50 INFO records of each event is
+kept. Every record is still counted, and a periodic summary reports the totals
+per event, so nothing is lost silently. Warnings and errors are never sampled.
+
+Records can also carry structured fields (model, question, repeat, ...) in
+`extra`. With structured=True the log file gets one JSON object per line that
+includes them.
+"""
+
+import json
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from collections import Counter
+from typing import Dict, Optional
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record, including its `extra` fields, as one JSON line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        document = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRIBUTES:
+                document[key] = value
+        if record.exc_info:
+            document["exception"] = self.formatException(record.exc_info)
+        return json.dumps(document, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps one in N records per (event, level) and counts everything it sees."""
+
+    def __init__(self, sample_every: Optional[Dict[str, int]] = None):
+        super().__init__()
+        self.sample_every = {}
+        self.set_rates(sample_every or {})
+        self._counts: Counter = Counter()
+        self._kept: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def set_rates(self, sample_every: Dict[str, int]):
+        """Set the sampling rate per level name (e.g. {"INFO": 50}); 1 keeps everything."""
+        self.sample_every = {logging.getLevelName(level.upper()): max(1, int(rate))
+                             for level, rate in sample_every.items()}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        if event is None or record.levelno >= logging.WARNING:
+            return True
+        key = (event, record.levelname)
+        with self._lock:
+            self._counts[key] += 1
+            keep = (self._counts[key] - 1) % self.sample_every.get(record.levelno, 1) == 0
+            if keep:
+                self._kept[key] += 1
+        return keep
+
+    def drain(self) -> Dict:
+        """Return and reset the counts since the last call: {(event, level): (seen, kept)}."""
+        with self._lock:
+            counts = {key: (seen, self._kept[key]) for key, seen in self._counts.items()}
+            self._counts.clear()
+            self._kept.clear()
+        return counts
+
+
+class _Summarizer(threading.Thread):
+    """Logs the sampled events' totals every interval."""
+
+    def __init__(self, sampler: SamplingFilter, interval: float):
+        super().__init__(name="log-summary", daemon=True)
+        self.sampler = sampler
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        counts = self.sampler.drain()
+        if not counts:
+            return
+        parts = [f"{event} {level}: {seen} ({kept} shown)"
+                 for (event, level), (seen, kept) in sorted(counts.items())]
+        logging.getLogger("log_summary").info("Log summary: " + "; ".join(parts))
+
+    def stop(self):
+        self._stop_event.set()
+        self.flush()
+
+
+_sampler: Optional[SamplingFilter] = None
+_summarizer: Optional[_Summarizer] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(log_file: str, level: int = logging.INFO, structured: bool = False,
+                      sample_every: Optional[Dict[str, int]] = None, summary_interval: float = 60):
+    """
+    Route the root logger through a queue to a file and the console.
+
+    Like logging.basicConfig, this does nothing if the root logger already has
+    handlers, so the first module to configure logging decides where it goes.
+
+    Args:
+        log_file: File to write log records to
+        level: Root log level
+        structured: Write JSON lines (with `extra` fields) to the file instead of text
+        sample_every: Sampling rate per level for records with an `event`
+        summary_interval: Seconds between aggregate summaries of sampled events
+    """
+    global _sampler, _summarizer, _listener
+
+    root = logging.getLogger()
+    if root.handlers:
+        return
+
+    file_handler = logging.FileHandler(log_file)
+    file_handler.setFormatter(JsonFormatter() if structured else logging.Formatter(TEXT_FORMAT))
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    _sampler = SamplingFilter(sample_every)
+    queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(_sampler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, file_handler, console_handler,
+                                               respect_handler_level=True)
+    _listener.start()
+
+    _summarizer = _Summarizer(_sampler, summary_interval)
+    _summarizer.start()
+
+    atexit.register(shutdown_logging)
+
+
+def update_logging(sample_every: Optional[Dict[str, int]] = None, summary_interval: Optional[float] = None,
+                   structured: Optional[bool] = None):
+    """
+    Change logging settings after configure_logging (e.g. from an experiment Config).
+
+    Args:
+        sample_every: Sampling rate per level name, e.g. {"INFO": 50}
+        summary_interval: Seconds between aggregate summaries
+        structured: Switch the log file between JSON lines and text
+    """
+    if _sampler is not None and sample_every is not None:
+        _sampler.set_rates(sample_every)
+    if _summarizer is not None and summary_interval:
+        _summarizer.interval = summary_interval
+    if _listener is not None and structured is not None:
+        _listener.handlers[0].setFormatter(JsonFormatter() if structured else logging.Formatter(TEXT_FORMAT))
+
+
+def shutdown_logging():
+    """Write the final summary and flush everything still queued."""
+    global _listener, _summarizer
+    if _summarizer is not None:
+        _summarizer.stop()
+        _summarizer = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
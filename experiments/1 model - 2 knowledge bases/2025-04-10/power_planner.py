@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Repeat Count Planner
+
+Predicts how many repeats per question (and how many questions) a run needs
+by subsampling stored runs: for each repeat count k and question count m,
+many random draws of k answers per node and m questions are taken, the
+separation verdict is recomputed on every draw, and the share of draws that
+agree with the full run's verdict is reported.
+
+The verdict is a moment-based two-sample test on centroid distances. For a
+node pair and question, with sample covariances S_i, S_j of k answers each,
+the squared distance D = ||m_i - m_j||^2 between the sample centroids has,
+if both nodes run the same model, mean (tr S_i + tr S_j) / k and variance
+2 tr((S_i + S_j)^2) / k^2 (tr(S^2) estimated without bias). Summed over the
+questions, D is compared with a scaled chi-square of matching mean and
+variance, and the pair counts as separated above its 1 - `alpha` quantile.
+
+Note that draws share the run's finite pool of answers, so a pair whose
+full-run evidence is borderline is flagged in more (or fewer) draws than
+fresh runs would be.
+
+Everything above only needs inner products, so each question's answers are
+reduced to one pooled Gram matrix up front. A draw is a (B, n) selection
+matrix per node; centroid norms and cross products come from W G W^T, and
+the covariance traces from (B, k, k) blocks of the Gram matrix. All B draws
+of a repeat count are evaluated together, and question subsets are random
+(B, Q) masks over the per-question terms.
+
+The expected wall time of a configuration uses the latencies measured in
+the stored runs and the configured per-node concurrency.
+"""
+
+import os
+import math
+import itertools
+import logging
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from reference_library import item_embedding, load_results
+
+logger = logging.getLogger(__name__)
+
+
+def _centered(blocks: np.ndarray) -> np.ndarray:
+    """Double-center (B, k, l) Gram blocks: H A H."""
+    return (blocks - blocks.mean(axis=2, keepdims=True) - blocks.mean(axis=1, keepdims=True)
+            + blocks.mean(axis=(1, 2), keepdims=True))
+
+
+def draw_subsamples(rng: np.random.Generator, size: int, repeats: int, num_draws: int) -> np.ndarray:
+    """(num_draws, repeats) indexes drawn without replacement from range(size)."""
+    return np.argsort(rng.random((num_draws, size)), axis=1)[:, :repeats]
+
+
+def question_terms(gram: np.ndarray, offsets: Sequence[int], draws: List[np.ndarray],
+                   pairs: List[Tuple[int, int]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Test statistic terms of one question for every draw and node pair.
+
+    Args:
+        gram: Pooled (N, N) Gram matrix of all nodes' answers to the question
+        offsets: Start of each node's rows in the pooled matrix
+        draws: Per node, (B, k) indexes of the answers in each draw
+        pairs: Node index pairs
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Squared centroid distances,
+        their null means and their null variances, all (P, B)
+    """
+    k = draws[0].shape[1]
+    rows = [draw + offset for draw, offset in zip(draws, offsets)]
+    num_draws = rows[0].shape[0]
+
+    traces, squared_traces, centroid_norms = [], [], []
+    for index in rows:
+        blocks = gram[index[:, :, None], index[:, None, :]]  # (B, k, k)
+        centroid_norms.append(blocks.mean(axis=(1, 2)))
+        centered = _centered(blocks)
+        trace = np.trace(centered, axis1=1, axis2=2) / (k - 1)
+        frobenius = (centered ** 2).sum(axis=(1, 2)) / (k - 1) ** 2
+        # Unbiased tr(Sigma^2) from a sample covariance of k answers
+        squared_traces.append(np.maximum((k - 1) ** 2 / ((k - 2) * (k + 1)) * (frobenius - trace ** 2 / (k - 1)), 0.0))
+        traces.append(trace)
+
+    distance = np.empty((len(pairs), num_draws))
+    expected = np.empty((len(pairs), num_draws))
+    variance = np.empty((len(pairs), num_draws))
+    for p_index, (i, j) in enumerate(pairs):
+        cross = gram[rows[i][:, :, None], rows[j][:, None, :]]  # (B, k, k)
+        cross_trace = (_centered(cross) ** 2).sum(axis=(1, 2)) / (k - 1) ** 2
+        distance[p_index] = centroid_norms[i] + centroid_norms[j] - 2 * cross.mean(axis=(1, 2))
+        expected[p_index] = (traces[i] + traces[j]) / k
+        variance[p_index] = 2 * (squared_traces[i] + squared_traces[j] + 2 * cross_trace) / k ** 2
+
+    return distance, expected, variance
+
+
+class RunSamples:
+    """One stored run reduced to per-question Gram matrices."""
+
+    def __init__(self, results: Dict[str, Dict[str, List[Dict]]], embedder: str, questions: List[str]):
+        """
+        Args:
+            results: Run results {node: {question: [items]}}
+            embedder: Embedding model whose vectors to use
+            questions: Question keys to include
+        """
+        self.nodes = list(results)
+        self.pairs = list(itertools.combinations(range(len(self.nodes)), 2))
+        self.questions, self.grams, self.offsets = [], [], []
+        self.sizes = np.zeros(len(self.nodes), dtype=int)
+        self.latencies = {node: [item["latency"] for items in results[node].values() for item in items
+                                 if item.get("latency") is not None] for node in self.nodes}
+
+        per_question = []
+        for question in questions:
+            vectors = [[vector for vector in (item_embedding(item, embedder) for item in results[node].get(question, []))
+                        if vector.size > 0] for node in self.nodes]
+            if min(len(node_vectors) for node_vectors in vectors) < 3:
+                logger.warning(f"{question}: fewer than 3 answers for some node; left out")
+                continue
+            per_question.append((question, vectors))
+
+        if not per_question:
+            return
+        # Every question is subsampled from the same number of answers per node
+        self.sizes = np.array([min(len(vectors[n]) for _, vectors in per_question) for n in range(len(self.nodes))])
+        for question, vectors in per_question:
+            pooled = np.vstack([np.vstack(node_vectors[:size]) for node_vectors, size in zip(vectors, self.sizes)])
+            self.questions.append(question)
+            self.grams.append(pooled @ pooled.T)
+        self.offsets = np.concatenate([[0], np.cumsum(self.sizes)[:-1]])
+
+    def terms(self, repeats: int, num_draws: int, rng: np.random.Generator) -> np.ndarray:
+        """
+        Per-question statistic terms for random draws of `repeats` answers per node.
+
+        Returns:
+            np.ndarray: (3, P, Q, B) squared distances, null means and null variances
+        """
+        terms = np.empty((3, len(self.pairs), len(self.questions), num_draws))
+        for q_index, gram in enumerate(self.grams):
+            draws = [draw_subsamples(rng, size, repeats, num_draws) for size in self.sizes]
+            terms[:, :, q_index] = question_terms(gram, self.offsets, draws, self.pairs)
+        return terms
+
+
+def verdicts(terms: np.ndarray, mask: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    Separation verdicts from per-question terms.
+
+    Args:
+        terms: (3, P, Q, B) squared distances, null means and null variances
+        mask: (Q, B) questions included in each draw
+        alpha: Significance level
+
+    Returns:
+        np.ndarray: (P, B) booleans, True where the pair is separated
+    """
+    distance, expected, variance = (terms * mask).sum(axis=2)
+    # Null distribution of the summed distance as a scaled chi-square with matching moments
+    dof = 2 * expected ** 2 / np.maximum(variance, 1e-300)
+    return distance > expected * stats.chi2.ppf(1 - alpha, dof) / dof
+
+
+def question_masks(rng: np.random.Generator, num_questions: int, count: int, num_draws: int) -> np.ndarray:
+    """(Q, B) masks selecting `count` random questions per draw."""
+    chosen = draw_subsamples(rng, num_questions, count, num_draws)
+    mask = np.zeros((num_draws, num_questions))
+    mask[np.arange(num_draws)[:, None], chosen] = 1.0
+    return mask.T
+
+
+def power_table(runs: Dict[str, RunSamples], repeat_counts: Sequence[int], question_counts: Sequence[int],
+                num_draws: int = 1000, alpha: float = 0.05, seed: int = 0) -> pd.DataFrame:
+    """
+    Verdict agreement between subsampled and full runs.
+
+    Args:
+        runs: Reduced runs by name
+        repeat_counts: Answers per node per question to try
+        question_counts: Numbers of questions to try
+        num_draws: Random draws per configuration
+        alpha: One-sided significance level of the verdict
+        seed: Random seed
+
+    Returns:
+        pd.DataFrame: One row per (run, node pair, repeats, questions) with the
+        full run's verdict and the share of draws that agree with it
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for name, run in runs.items():
+        if not run.questions or not run.pairs:
+            continue
+        num_questions = len(run.questions)
+        full_size = int(run.sizes.min())
+        full = verdicts(run.terms(full_size, 1, rng), np.ones((num_questions, 1)), alpha)[:, 0]
+
+        for repeats in sorted(set(repeat_counts)):
+            if repeats < 3 or repeats > full_size:
+                logger.warning(f"{name}: skipping {repeats} repeats (run has {full_size}, at least 3 needed)")
+                continue
+            terms = run.terms(repeats, num_draws, rng)
+            for count in sorted(set(question_counts)):
+                if count > num_questions:
+                    continue
+                separated = verdicts(terms, question_masks(rng, num_questions, count, num_draws), alpha)
+                for p_index, (i, j) in enumerate(run.pairs):
+                    rows.append({
+                        "run": name,
+                        "node1": run.nodes[i],
+                        "node2": run.nodes[j],
+                        "repeats": repeats,
+                        "questions": count,
+                        "full_run": repeats == full_size and count == num_questions,
+                        "full_verdict": bool(full[p_index]),
+                        "separated_rate": float(separated[p_index].mean()),
+                        "agreement": float((separated[p_index] == full[p_index]).mean())
+                    })
+            logger.info(f"{name}: {repeats} repeats done")
+
+    return pd.DataFrame(rows)
+
+
+def node_latencies(runs: Dict[str, RunSamples]) -> Dict[str, List[float]]:
+    """Measured completion-call latencies of every node over all runs (empty for nodes without any)."""
+    latencies: Dict[str, List[float]] = {}
+    for run in runs.values():
+        for node, values in run.latencies.items():
+            latencies.setdefault(node, []).extend(values)
+    return latencies
+
+
+def wall_time(runs: Dict[str, RunSamples], repeats: int, questions: int, concurrency: Dict[str, int],
+              samples_per_request: int = 1) -> float:
+    """
+    Expected seconds to collect `repeats` answers to `questions` questions from every node.
+
+    Nodes are run one after another, each with its measured mean latency per
+    completion call and its concurrency. Nodes without measured latencies are
+    left out of the total; NaN if no node has any.
+    """
+    measured = {node: values for node, values in node_latencies(runs).items() if values}
+    if not measured:
+        return float("nan")
+    requests = questions * math.ceil(repeats / samples_per_request)
+    return float(sum(requests * np.mean(values) / concurrency.get(node, 1) for node, values in measured.items()))
+
+
+def recommend(table: pd.DataFrame, reliability: float) -> pd.DataFrame:
+    """
+    Configurations by cost, with whether they reach the target reliability.
+
+    Reliability is the worst agreement over node pairs the full runs separate;
+    pairs the full runs don't separate are reported as the worst false alarm rate.
+    A configuration the size of the full run agrees with itself by construction,
+    so it never counts as meeting the target.
+
+    Returns:
+        pd.DataFrame: One row per (repeats, questions), cheapest first
+    """
+    separated = table[table["full_verdict"]]
+    not_separated = table[~table["full_verdict"]]
+    summary = separated.groupby(["repeats", "questions"])["agreement"].min().rename("reliability").to_frame()
+    summary["false_alarm"] = not_separated.groupby(["repeats", "questions"])["separated_rate"].max()
+    summary["full_run"] = table.groupby(["repeats", "questions"])["full_run"].all()
+    summary = summary.reset_index()
+    summary["generations_per_node"] = summary["repeats"] * summary["questions"]
+    summary["meets_target"] = (summary["reliability"] >= reliability) & ~summary["full_run"]
+    return summary.sort_values(["generations_per_node", "repeats"]).reset_index(drop=True)
+
+
+def main():
+    """Plan repeat and question counts from stored runs."""
+    import argparse
+    from experiment_runner import Config
+
+    config = Config()
+
+    parser = argparse.ArgumentParser(description="Predict the repeats and questions needed from stored runs")
+    parser.add_argument("results_files", nargs="+", help="raw_results pickle/JSON files or spill directories")
+    parser.add_argument("--embedder", default=config.EMBEDDING_MODEL, help="Embedding model to use")
+    parser.add_argument("--repeats", type=int, nargs="+", default=[5, 10, 15, 20, 25], help="Repeat counts to try")
+    parser.add_argument("--questions", type=int, nargs="+", help="Question counts to try (default: 5, 10, ... all)")
+    parser.add_argument("--draws", type=int, default=1000, help="Random draws per configuration")
+    parser.add_argument("--alpha", type=float, default=0.05, help="Significance level of the separation verdict")
+    parser.add_argument("--reliability", type=float, default=0.95,
+                        help="Share of draws that must reproduce the full run's verdict")
+    parser.add_argument("--output", help="Write the per-pair table to this CSV file")
+
+    args = parser.parse_args()
+
+    runs = {}
+    for results_file in args.results_files:
+        if not os.path.exists(results_file):
+            print(f"Error: Results file {results_file} not found")
+            return
+        results = load_results(results_file)
+        # The run's own questions, not the current Config's
+        questions = sorted({question for node_results in results.values() for question in node_results},
+                           key=lambda question: int(question[1:]))
+        runs[os.path.basename(results_file.rstrip("/"))] = RunSamples(results, args.embedder, questions)
+
+    max_questions = max(len(run.questions) for run in runs.values())
+    question_counts = args.questions or sorted(set(list(range(5, max_questions, 5)) + [max_questions]))
+    table = power_table(runs, args.repeats, question_counts, args.draws, args.alpha)
+    if table.empty:
+        print("Error: no runs with answers from at least two nodes")
+        return
+    if args.output:
+        table.to_csv(args.output, index=False)
+
+    summary = recommend(table, args.reliability)
+    if not table["full_verdict"].any():
+        print("No node pair is separated in the full runs; nothing to plan for")
+        return
+
+    concurrency = {node: config.NODE_MAX_WORKERS.get(node, config.MAX_WORKERS)
+                   for run in runs.values() for node in run.nodes}
+    unmeasured = [node for node, values in node_latencies(runs).items() if not values]
+    if unmeasured:
+        logger.warning(f"No latencies recorded for {', '.join(unmeasured)}; left out of the wall time estimates")
+    summary["wall_time_s"] = [wall_time(runs, repeats, questions, concurrency, config.SAMPLES_PER_REQUEST)
+                              for repeats, questions in zip(summary["repeats"], summary["questions"])]
+    print(f"\nVerdict reliability (worst separated pair) at alpha={args.alpha}:\n")
+    print(summary.to_markdown(index=False, floatfmt=".3f"))
+
+    feasible = summary[summary["meets_target"]]
+    if feasible.empty:
+        print(f"\nNo configuration smaller than the stored runs reaches reliability {args.reliability}; "
+              f"the runs can't show that fewer repeats would do, and more may be needed")
+        return
+    best = feasible.iloc[0]
+    if np.isnan(best["wall_time_s"]):
+        duration = "wall time unknown: the runs record no latencies"
+    elif unmeasured:
+        duration = (f"about {best['wall_time_s'] / 60:.1f} min, not counting {', '.join(unmeasured)} "
+                    f"(no recorded latencies)")
+    else:
+        duration = f"about {best['wall_time_s'] / 60:.1f} min for all nodes"
+    print(f"\nRecommended: NUM_REPEATS = {int(best['repeats'])} with {int(best['questions'])} questions "
+          f"(reliability {best['reliability']:.3f}, {int(best['generations_per_node'])} generations per node, "
+          f"{duration})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Progress Tracking
+
+Event-driven progress for a run. Workers report each finished request with
+ProgressTracker.record; the tracker keeps O(1) counters per node and overall,
+plus a short window of completion times for the rolling throughput, so
+reporting never rescans the results.
+
+From those counters it derives per-node and overall progress, throughput,
+failure rate and an ETA, prints a one-line console status and periodically
+writes the same data to a JSON status file for schedulers and dashboards.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+
+class _NodeProgress:
+    __slots__ = ("total", "completed", "failed", "latency_sum", "latency_count", "started", "finished", "skipped")
+
+    def __init__(self, total: int):
+        self.total = total
+        self.completed = 0
+        self.failed = 0
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.started = None
+        self.finished = None
+        self.skipped = False
+
+
+class ProgressTracker:
+    """Counts completed and failed responses per node and reports progress."""
+
+    def __init__(self, totals: Dict[str, int], status_file: Optional[str] = None,
+                 window: float = 60, status_interval: float = 5, print_interval: float = 0.5):
+        """
+        Initialize the tracker.
+
+        Args:
+            totals: Expected responses per node
+            status_file: JSON file to write the status to (None to disable)
+            window: Seconds of completions used for the rolling throughput
+            status_interval: Minimum seconds between status file writes
+            print_interval: Minimum seconds between console updates
+        """
+        self.nodes = {name: _NodeProgress(total) for name, total in totals.items()}
+        self.status_file = status_file
+        self.window = window
+        self.status_interval = status_interval
+        self.print_interval = print_interval
+        self.started = time.time()
+        self.concurrency: Dict[str, int] = {}
+
+        self._lock = threading.Lock()
+        # (timestamp, responses) per recorded event, trimmed to the window
+        self._recent = deque()
+        self._recent_count = 0
+        self._last_status = 0.0
+        self._last_print = 0.0
+        self._report_lock = threading.Lock()
+
+    def start_node(self, name: str, concurrency: int = 1):
+        """Mark a node as being worked on, with the number of concurrent requests it gets."""
+        with self._lock:
+            self.nodes[name].started = time.time()
+            self.concurrency[name] = concurrency
+        self._report(force=True)
+
+    def finish_node(self, name: str):
+        """Mark a node as done."""
+        with self._lock:
+            self.nodes[name].finished = time.time()
+        self._report(force=True)
+
+    def skip_node(self, name: str):
+        """Mark a node as skipped (e.g. never became available); its remaining responses count as failed."""
+        with self._lock:
+            node = self.nodes[name]
+            node.failed += max(0, node.total - node.completed - node.failed)
+            node.skipped = True
+            node.finished = time.time()
+        self._report(force=True)
+
+    def record(self, name: str, completed: int, failed: int = 0, latency: Optional[float] = None):
+        """
+        Record the outcome of one request.
+
+        Args:
+            name: Node name
+            completed: Responses received
+            failed: Responses that were asked for but not received
+            latency: Seconds the request took
+        """
+        now = time.time()
+        with self._lock:
+            node = self.nodes[name]
+            node.completed += completed
+            node.failed += failed
+            if latency is not None:
+                node.latency_sum += latency
+                node.latency_count += 1
+
+            self._recent.append((now, completed))
+            self._recent_count += completed
+            while self._recent and self._recent[0][0] < now - self.window:
+                self._recent_count -= self._recent.popleft()[1]
+        self._report()
+
+    def _throughput(self, now: float) -> float:
+        """Responses per second over the rolling window."""
+        span = min(self.window, now - self.started)
+        return self._recent_count / span if span > 0 else 0.0
+
+    def snapshot(self) -> Dict:
+        """
+        Get the current progress.
+
+        Returns:
+            Dict: Overall and per-node counters, throughput, failure rate and ETA
+        """
+        now = time.time()
+        with self._lock:
+            throughput = self._throughput(now)
+            nodes = {}
+            remaining_seconds = 0.0
+            for name, node in self.nodes.items():
+                done = node.completed + node.failed
+                remaining = max(0, node.total - done)
+                mean_latency = node.latency_sum / node.latency_count if node.latency_count else None
+                # Nodes run one after another; a node's ETA uses its own measured
+                # latency, or the overall throughput before it has any
+                if remaining and mean_latency:
+                    node_eta = remaining * mean_latency / max(1, self.concurrency.get(name, 1))
+                elif remaining and throughput:
+                    node_eta = remaining / throughput
+                else:
+                    node_eta = None
+                if node_eta:
+                    remaining_seconds += node_eta
+                nodes[name] = {
+                    "total": node.total,
+                    "completed": node.completed,
+                    "failed": node.failed,
+                    "progress": done / node.total if node.total else 1.0,
+                    "failure_rate": node.failed / done if done else 0.0,
+                    "mean_latency": mean_latency,
+                    "state": ("skipped" if node.skipped else "done" if node.finished
+                              else "running" if node.started else "pending"),
+                    "eta_seconds": node_eta
+                }
+
+            total = sum(node.total for node in self.nodes.values())
+            completed = sum(node.completed for node in self.nodes.values())
+            failed = sum(node.failed for node in self.nodes.values())
+
+        return {
+            "updated": datetime.now().isoformat(),
+            "elapsed_seconds": now - self.started,
+            "total": total,
+            "completed": completed,
+            "failed": failed,
+            "progress": (completed + failed) / total if total else 1.0,
+            "failure_rate": failed / (completed + failed) if completed + failed else 0.0,
+            "throughput": throughput,
+            "eta_seconds": remaining_seconds,
+            "eta": (datetime.now() + timedelta(seconds=remaining_seconds)).isoformat(timespec="seconds"),
+            "nodes": nodes
+        }
+
+    def _report(self, force: bool = False):
+        now = time.time()
+        write_status = self.status_file and (force or now - self._last_status >= self.status_interval)
+        print_line = force or now - self._last_print >= self.print_interval
+        if not (write_status or print_line):
+            return
+        # One reporter at a time; a worker that finds it busy just skips this update
+        if not self._report_lock.acquire(blocking=force):
+            return
+        try:
+            self._emit(now, write_status, print_line)
+        finally:
+            self._report_lock.release()
+
+    def _emit(self, now: float, write_status: bool, print_line: bool):
+        status = self.snapshot()
+        if print_line:
+            self._last_print = now
+            running = [name for name, node in status["nodes"].items() if node["state"] == "running"]
+            node_part = ", ".join(f"{name} {status['nodes'][name]['progress']:.0%}" for name in running)
+            print(f"\r[{status['progress']:.1%}] {status['completed']}/{status['total']} responses"
+                  f"{' (' + node_part + ')' if node_part else ''} | {status['throughput']:.2f}/s | "
+                  f"failed {status['failure_rate']:.1%} | ETA {timedelta(seconds=int(status['eta_seconds']))}   ",
+                  end="", flush=True)
+        if write_status:
+            self._last_status = now
+            self.write_status(status)
+
+    def write_status(self, status: Optional[Dict] = None):
+        """Atomically write the status file."""
+        if not self.status_file:
+            return
+        status = status or self.snapshot()
+        directory = os.path.dirname(os.path.abspath(self.status_file))
+        os.makedirs(directory, exist_ok=True)
+        temp_file = f"{self.status_file}.tmp"
+        with open(temp_file, "w") as f:
+            json.dump(status, f, indent=2)
+        os.replace(temp_file, self.status_file)
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Question Discriminativeness
+
+Scores every question by how well it separates nodes, mined from all stored
+runs and embedders, and picks the smallest question subset that still
+separates every pair of nodes.
+
+For a run, an embedder and a pair of nodes (a "context"), a question's
+separation is the squared distance between the two nodes' true centroids
+in units of the noise on that distance with `repeats` answers per node:
+
+    separation = (||m_i - m_j||^2 - d (v_i / n_i + v_j / n_j)) / (d (v_i + v_j) / repeats)
+
+where m, v and n are the stored run's sample centroids, mean per-dimension
+variances and answer counts; the subtracted term removes the sampling bias
+of the squared distance, so nodes running the same model score about 0.
+For independent questions separations add up. All (question, context)
+values form one (Q, P) matrix.
+
+Runs are only combined when they asked the same questions: each run's
+question keys come from the run itself and its question texts from the
+Config of the folder it was saved in (for the mode its node names imply),
+and runs are grouped by the hash of those texts. A run whose texts can't be
+recovered is ranked on its own.
+
+The probe set is chosen greedily on that matrix: each step adds the
+question with the largest gain in sum over contexts of min(combined
+separation, target), until every context reaches the target or nothing
+improves. That objective is monotone submodular, so the greedy cover is
+within a logarithmic factor of the smallest set.
+"""
+
+import os
+import itertools
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from catalog import experiment_folder, run_mode, run_questions, runner_config
+from reference_library import VARIANCE_FLOOR, item_embedding, load_results, questions_hash
+
+logger = logging.getLogger(__name__)
+
+
+def run_embedders(results: Dict[str, Dict[str, List[Dict]]], default: str) -> List[str]:
+    """Embedding models present in a run: the keys of "embeddings", or just the default one."""
+    for node_results in results.values():
+        for items in node_results.values():
+            for item in items:
+                if "embeddings" in item:
+                    return list(item["embeddings"])
+                return [default]
+    return [default]
+
+
+def separation_matrix(results: Dict[str, Dict[str, List[Dict]]], embedder: str, questions: List[str],
+                      repeats: int) -> Tuple[np.ndarray, List[Tuple[str, str]]]:
+    """
+    Separation of every node pair on every question for one run and embedder.
+
+    Returns:
+        Tuple[np.ndarray, List]: (Q, P) separations (NaN where a node lacks
+        answers) and the P node pairs
+    """
+    nodes = list(results)
+    centroids, dispersion = None, np.full((len(nodes), len(questions)), np.nan)
+    counts = np.zeros((len(nodes), len(questions)))
+    for n_index, node in enumerate(nodes):
+        for q_index, question in enumerate(questions):
+            vectors = [vector for vector in (item_embedding(item, embedder) for item in results[node].get(question, []))
+                       if vector.size > 0]
+            if len(vectors) < 2:
+                continue
+            stacked = np.vstack(vectors)
+            if centroids is None:
+                centroids = np.full((len(nodes), len(questions), stacked.shape[1]), np.nan)
+            centroids[n_index, q_index] = stacked.mean(axis=0)
+            dispersion[n_index, q_index] = max(float(stacked.var(axis=0, ddof=1).mean()), VARIANCE_FLOOR)
+            counts[n_index, q_index] = len(vectors)
+
+    pairs = list(itertools.combinations(range(len(nodes)), 2))
+    if centroids is None or not pairs:
+        return np.empty((len(questions), 0)), []
+
+    first, second = [list(side) for side in zip(*pairs)]
+    dim = centroids.shape[2]
+    squared = ((centroids[first] - centroids[second]) ** 2).sum(axis=2)  # (P, Q)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bias = dim * (dispersion[first] / counts[first] + dispersion[second] / counts[second])
+    noise = dim * (dispersion[first] + dispersion[second]) / repeats
+    return ((squared - bias) / noise).T, [(nodes[i], nodes[j]) for i, j in pairs]
+
+
+def group_runs(results_files: List[str]) -> List[Dict]:
+    """
+    Load runs and group them by the question list they asked.
+
+    A run's question keys are those in its results; its texts are the
+    question list of its folder's Config for the mode its nodes imply, used
+    only if it has one text per key. Runs with the same texts share a group;
+    a run without texts gets a group of its own.
+
+    Returns:
+        List[Dict]: Groups with "hash" (None if the texts are unknown), "questions"
+        (keys), "texts" (or None) and "runs" ({file: results})
+    """
+    groups: Dict[str, Dict] = {}
+    for results_file in results_files:
+        results = load_results(results_file)
+        questions = sorted({question for node_results in results.values() for question in node_results},
+                           key=lambda question: int(question[1:]))
+        config = runner_config(experiment_folder(results_file))
+        texts = run_questions(config, run_mode(config, results))
+        if texts and len(texts) != len(questions):
+            logger.warning(f"{results_file} has {len(questions)} questions but its folder's Config lists "
+                           f"{len(texts)}; ranking it on its own")
+            texts = None
+        elif not texts:
+            logger.warning(f"Question texts of {results_file} are unknown; ranking it on its own")
+        digest = questions_hash(texts) if texts else None
+        group = groups.setdefault(digest or results_file, {"hash": digest, "questions": questions,
+                                                            "texts": texts, "runs": {}})
+        group["runs"][results_file] = results
+    return list(groups.values())
+
+
+def collect_separations(runs: Dict[str, Dict[str, Dict[str, List[Dict]]]], embedders: Optional[List[str]],
+                        questions: List[str], repeats: int,
+                        default_embedder: str) -> Tuple[np.ndarray, pd.DataFrame]:
+    """
+    Separation matrix over all runs, embedders and node pairs.
+
+    Args:
+        runs: Results of runs that asked the same questions, by file
+        embedders: Embedding models to use (None = every embedder in each run)
+        questions: Question keys of the runs
+        repeats: Answers per node per question planned
+        default_embedder: Embedder of runs that don't record one
+
+    Returns:
+        Tuple[np.ndarray, pd.DataFrame]: (Q, P) separations and the P contexts (run, embedder, node1, node2)
+    """
+    blocks, contexts = [], []
+    for results_file, results in runs.items():
+        for embedder in embedders or run_embedders(results, default_embedder):
+            matrix, pairs = separation_matrix(results, embedder, questions, repeats)
+            if not pairs:
+                logger.warning(f"No {embedder} embeddings for two or more nodes in {results_file}")
+                continue
+            blocks.append(matrix)
+            contexts.extend({"run": os.path.basename(results_file.rstrip("/")), "embedder": embedder,
+                             "node1": node1, "node2": node2} for node1, node2 in pairs)
+            logger.info(f"{results_file}: {len(pairs)} node pairs with {embedder}")
+
+    if not blocks:
+        return np.empty((len(questions), 0)), pd.DataFrame(columns=["run", "embedder", "node1", "node2"])
+    return np.hstack(blocks), pd.DataFrame(contexts)
+
+
+def rank_questions(separations: np.ndarray, questions: List[str],
+                   texts: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Rank questions by separation.
+
+    Returns:
+        pd.DataFrame: Per question the median, mean and worst-pair separation and
+        the contexts it was measured in, best question first
+    """
+    import warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        df = pd.DataFrame({
+            "question": questions,
+            "median_separation": np.nanmedian(separations, axis=1),
+            "mean_separation": np.nanmean(separations, axis=1),
+            "worst_pair_separation": np.nanmin(separations, axis=1),
+            "contexts": np.isfinite(separations).sum(axis=1)
+        })
+    if texts and len(texts) >= len(questions):
+        df["text"] = texts[:len(questions)]
+    return df.sort_values(["worst_pair_separation", "median_separation"], ascending=False).reset_index(drop=True)
+
+
+def separable_contexts(separations: np.ndarray, target: float) -> np.ndarray:
+    """Contexts whose separation over all questions reaches the target: (P,) mask."""
+    return np.nan_to_num(np.maximum(separations, 0.0)).sum(axis=0) >= target
+
+
+def select_probe_set(separations: np.ndarray, target: float, max_questions: Optional[int] = None,
+                     questions: Optional[List[str]] = None) -> Tuple[List[int], pd.DataFrame]:
+    """
+    Greedy submodular cover: the fewest questions whose combined separation reaches the target in every context.
+
+    Contexts the full question set can't separate (e.g. two nodes running the
+    same model) are left out, or the greedy steps would only chase their noise.
+
+    Args:
+        separations: (Q, P) separations (NaN counts as 0)
+        target: Combined separation each context must reach
+        max_questions: Optional cap on the set size
+        questions: Question keys for the steps table (default: Q1, Q2, ...)
+
+    Returns:
+        Tuple[List[int], pd.DataFrame]: Chosen question indexes in order, and per step
+        the coverage, the weakest context's combined separation and the contexts at target
+    """
+    gains = np.nan_to_num(np.maximum(separations, 0.0))[:, separable_contexts(separations, target)]
+    num_questions, num_contexts = gains.shape
+    combined = np.zeros(num_contexts)
+    chosen: List[int] = []
+    steps = []
+    limit = min(max_questions or num_questions, num_questions)
+
+    while num_contexts and len(chosen) < limit and (combined < target).any():
+        capped = np.minimum(combined, target).sum()
+        marginal = np.minimum(combined[None, :] + gains, target).sum(axis=1) - capped
+        marginal[chosen] = -np.inf
+        best = int(np.argmax(marginal))
+        if marginal[best] <= 0:
+            break
+        chosen.append(best)
+        combined += gains[best]
+        steps.append({
+            "step": len(chosen),
+            "question": questions[best] if questions else f"Q{best + 1}",
+            "coverage": float(np.minimum(combined, target).sum() / (target * num_contexts)),
+            "weakest_context": float(combined.min()),
+            "contexts_at_target": int((combined >= target).sum())
+        })
+
+    return chosen, pd.DataFrame(steps)
+
+
+def main():
+    """Rank questions of stored runs and choose a minimal probe set."""
+    import argparse
+    from experiment_runner import Config
+
+    config = Config()
+
+    parser = argparse.ArgumentParser(description="Rank questions by node separation and pick a minimal probe set")
+    parser.add_argument("results_files", nargs="+", help="raw_results pickle/JSON files or spill directories")
+    parser.add_argument("--embedder", action="append", dest="embedders",
+                        help="Embedding model to use (repeatable; default: every embedder in each run)")
+    parser.add_argument("--repeats", type=int, default=config.NUM_REPEATS, help="Answers per node per question planned")
+    parser.add_argument("--target", type=float, default=10.0,
+                        help="Combined separation every node pair must reach (in units of the noise)")
+    parser.add_argument("--max-questions", type=int, help="Upper bound on the probe set size")
+    parser.add_argument("--output", help="Write the ranking to this CSV file")
+
+    args = parser.parse_args()
+
+    rankings = []
+    for group in group_runs(args.results_files):
+        questions = group["questions"]
+        label = f"question set {group['hash']}" if group["hash"] else f"{next(iter(group['runs']))} (unknown questions)"
+        print(f"\n## {label}: {len(group['runs'])} run(s), {len(questions)} questions")
+
+        separations, contexts = collect_separations(group["runs"], args.embedders, questions, args.repeats,
+                                                    config.EMBEDDING_MODEL)
+        if separations.shape[1] == 0:
+            print("Error: no runs with embeddings for at least two nodes")
+            continue
+
+        separable = separable_contexts(separations, args.target)
+        if not separable.all():
+            totals = np.nan_to_num(np.maximum(separations, 0.0)).sum(axis=0)
+            print(f"\nNode pairs not separable at target {args.target} even with all questions (left out):\n")
+            print(contexts.assign(total=totals)[~separable].to_markdown(index=False, floatfmt=".3f"))
+        if not separable.any():
+            continue
+
+        ranking = rank_questions(separations[:, separable], questions, group["texts"])
+        print(f"\nQuestion ranking over {int(separable.sum())} (run, embedder, node pair) contexts:\n")
+        print(ranking.to_markdown(index=False, floatfmt=".2f"))
+        rankings.append(ranking.assign(question_set=group["hash"]))
+
+        chosen, steps = select_probe_set(separations, args.target, args.max_questions, questions)
+        print(f"\nGreedy probe set for combined separation >= {args.target} at {args.repeats} repeats:\n")
+        print(steps.to_markdown(index=False, floatfmt=".3f"))
+        print(f"\nProbe set: {', '.join(questions[index] for index in chosen)} "
+              f"({len(chosen)} of {len(questions)} questions, "
+              f"{len(chosen) * args.repeats} instead of {len(questions) * args.repeats} generations per node)")
+
+    if args.output and rankings:
+        pd.concat(rankings, ignore_index=True).to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
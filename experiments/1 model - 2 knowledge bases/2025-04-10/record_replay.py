@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Record / Replay of Node Traffic
+
+Captures every HTTP exchange the runner makes (completions, embeddings,
+availability checks, capacity metadata) so a run can be replayed later
+without any nodes. Replaying the same archive gives every runner change the
+same realistic workload: the scheduler, batching and I/O paths see the
+recorded responses with the recorded (or scaled) latencies, on any machine.
+
+Both modes are requests transport adapters mounted on the runner's session:
+
+- RecordingAdapter sends requests normally and appends each exchange to a
+  gzip-compressed JSON-lines archive.
+- ReplayAdapter answers from an archive. Requests are matched on method, URL
+  and a hash of the JSON body; identical requests (e.g. repeats of a question)
+  get the recorded responses in their original order, wrapping around when a
+  replay asks for more than was recorded. Embedding calls whose batch was
+  composed differently than during recording (batches depend on timing) are
+  answered from the individually recorded vectors.
+"""
+
+import gzip
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.models import PreparedRequest, Response
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FORMAT = "node-traffic"
+ARCHIVE_VERSION = 1
+
+
+def request_key(method: str, url: str, body) -> str:
+    """
+    Identify a request independently of JSON key order and whitespace.
+
+    Args:
+        method: HTTP method
+        url: Full request URL
+        body: Request body (bytes, str or None)
+
+    Returns:
+        str: Hex digest identifying the request
+    """
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", errors="replace")
+    try:
+        canonical = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")) if body else ""
+    except ValueError:
+        canonical = body
+    return hashlib.sha256(f"{method} {url}\n{canonical}".encode("utf-8")).hexdigest()
+
+
+def load_archive(path: str) -> List[Dict]:
+    """
+    Read the exchanges stored in an archive.
+
+    An archive cut short (e.g. by a killed run) yields the exchanges written before the cut.
+
+    Args:
+        path: Archive file
+
+    Returns:
+        List[Dict]: Exchanges in recording order
+    """
+    exchanges = []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                record = json.loads(line)
+                if record.get("format") != ARCHIVE_FORMAT:
+                    exchanges.append(record)
+        except (EOFError, ValueError):
+            logger.warning(f"Archive {path} is truncated; using the {len(exchanges)} complete exchanges")
+    return exchanges
+
+
+class RecordingAdapter(HTTPAdapter):
+    """HTTP adapter that records every exchange to an archive."""
+
+    def __init__(self, archive_file: str, **kwargs):
+        """
+        Initialize the adapter.
+
+        Args:
+            archive_file: Archive to write (appended to if it exists)
+            **kwargs: Passed on to HTTPAdapter (e.g. pool_maxsize)
+        """
+        super().__init__(**kwargs)
+        self.archive_file = archive_file
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._start = time.monotonic()
+
+    def _write(self, record: Dict):
+        with self._lock:
+            if self._file is None:
+                # Each open starts a new gzip member; readers concatenate them
+                self._file = gzip.open(self.archive_file, "at", encoding="utf-8")
+                self._file.write(json.dumps({"format": ARCHIVE_FORMAT, "version": ARCHIVE_VERSION}) + "\n")
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self.recorded += 1
+
+    def send(self, request: PreparedRequest, **kwargs) -> Response:
+        started = time.monotonic()
+        response = super().send(request, **kwargs)
+        elapsed = time.monotonic() - started
+
+        body = request.body.decode("utf-8", errors="replace") if isinstance(request.body, bytes) else request.body
+        self._write({
+            "key": request_key(request.method, request.url, body),
+            "method": request.method,
+            "url": request.url,
+            "request": body,
+            "status": response.status_code,
+            "content_type": response.headers.get("Content-Type", ""),
+            "response": response.text,
+            "elapsed": round(elapsed, 6),
+            "offset": round(started - self._start, 6)
+        })
+        return response
+
+    def close(self):
+        """Close the connection pools and flush the archive."""
+        super().close()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                logger.info(f"Recorded {self.recorded} exchanges to {self.archive_file}")
+
+
+class ReplayAdapter(BaseAdapter):
+    """HTTP adapter that serves recorded exchanges instead of contacting nodes."""
+
+    def __init__(self, archive_file: str, latency_scale: float = 1.0):
+        """
+        Load an archive for replay.
+
+        Args:
+            archive_file: Archive written by RecordingAdapter
+            latency_scale: Multiplier for recorded latencies (0 replays without waiting)
+        """
+        super().__init__()
+        self.archive_file = archive_file
+        self.latency_scale = latency_scale
+        self._exchanges: Dict[str, List[Dict]] = defaultdict(list)
+        self._cursors: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self.served = 0
+        self.unmatched = 0
+        # (url, model, encoding_format, text) -> (recorded vector, latency of its call)
+        self._vectors: Dict[tuple, tuple] = {}
+
+        exchanges = load_archive(archive_file)
+        for exchange in exchanges:
+            self._exchanges[exchange["key"]].append(exchange)
+            if exchange["url"].endswith("/v1/embeddings") and exchange["status"] == 200:
+                self._index_embeddings(exchange)
+        logger.info(f"Replaying {len(exchanges)} exchanges ({len(self._exchanges)} distinct requests) "
+                    f"from {archive_file} at {latency_scale}x latency")
+
+    def _index_embeddings(self, exchange: Dict):
+        """Remember each vector of a recorded embedding call by its input text."""
+        try:
+            request = json.loads(exchange["request"])
+            data = json.loads(exchange["response"])["data"]
+        except (TypeError, ValueError, KeyError):
+            return
+        texts = request.get("input", [])
+        texts = [texts] if isinstance(texts, str) else texts
+        for position, entry in enumerate(data):
+            index = entry.get("index", position)
+            if index < len(texts):
+                key = (exchange["url"], request.get("model"), request.get("encoding_format"), texts[index])
+                self._vectors[key] = (entry["embedding"], exchange["elapsed"])
+
+    def _compose_embeddings(self, request: PreparedRequest) -> Optional[Dict]:
+        """Build an embedding exchange for a batch that was not recorded as such."""
+        if not request.url.endswith("/v1/embeddings"):
+            return None
+        try:
+            payload = json.loads(request.body)
+        except (TypeError, ValueError):
+            return None
+        texts = payload.get("input", [])
+        texts = [texts] if isinstance(texts, str) else texts
+        found = [self._vectors.get((request.url, payload.get("model"), payload.get("encoding_format"), text))
+                 for text in texts]
+        if not texts or any(vector is None for vector in found):
+            return None
+        return {
+            "status": 200,
+            "content_type": "application/json",
+            "response": json.dumps({
+                "data": [{"index": index, "embedding": vector} for index, (vector, _) in enumerate(found)],
+                "model": payload.get("model")
+            }),
+            "elapsed": max(elapsed for _, elapsed in found)
+        }
+
+    def _next_exchange(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            candidates = self._exchanges.get(key)
+            if not candidates:
+                return None
+            exchange = candidates[self._cursors[key] % len(candidates)]
+            self._cursors[key] += 1
+            return exchange
+
+    def send(self, request: PreparedRequest, stream=False, timeout=None, verify=True, cert=None,
+             proxies=None) -> Response:
+        exchange = self._next_exchange(request_key(request.method, request.url, request.body))
+        if exchange is None:
+            exchange = self._compose_embeddings(request)
+        with self._lock:
+            if exchange is None:
+                self.unmatched += 1
+            else:
+                self.served += 1
+        if exchange is None:
+            raise requests.exceptions.ConnectionError(
+                f"No recorded response for {request.method} {request.url}", request=request)
+
+        delay = exchange["elapsed"] * self.latency_scale
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        if read_timeout is not None and delay > read_timeout:
+            time.sleep(read_timeout)
+            raise requests.exceptions.ReadTimeout(f"Replayed response took {delay:.1f}s", request=request)
+        if delay > 0:
+            time.sleep(delay)
+
+        response = Response()
+        response.status_code = exchange["status"]
+        response.headers = CaseInsensitiveDict({"Content-Type": exchange["content_type"]})
+        response._content = exchange["response"].encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(seconds=delay)
+        response.reason = "OK" if response.status_code < 400 else "Error"
+        return response
+
+    def close(self):
+        """Report replay coverage."""
+        if self.served or self.unmatched:
+            logger.info(f"Replay served {self.served} responses, {self.unmatched} requests had no recording")
+
+
+def summarize_archive(path: str):
+    """Print exchange counts and latencies per endpoint for an archive."""
+    import pandas as pd
+    from urllib.parse import urlsplit
+
+    exchanges = load_archive(path)
+    if not exchanges:
+        print(f"{path}: no exchanges")
+        return
+
+    df = pd.DataFrame({
+        "node": [urlsplit(exchange["url"]).netloc for exchange in exchanges],
+        "path": [urlsplit(exchange["url"]).path for exchange in exchanges],
+        "status": [exchange["status"] for exchange in exchanges],
+        "elapsed": [exchange["elapsed"] for exchange in exchanges]
+    })
+    summary = df.groupby(["node", "path"]).agg(
+        requests=("elapsed", "size"),
+        errors=("status", lambda status: int((status >= 400).sum())),
+        mean_latency=("elapsed", "mean"),
+        p95_latency=("elapsed", lambda elapsed: elapsed.quantile(0.95))
+    ).reset_index()
+
+    span = max(exchange["offset"] + exchange["elapsed"] for exchange in exchanges)
+    print(f"\n=== {path} ===")
+    print(f"{len(exchanges)} exchanges over {span:.1f} seconds\n")
+    print(summary.to_string(index=False, float_format=lambda value: f"{value:.3f}"))
+
+
+def main():
+    """Summarize recorded archives."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize recorded node traffic archives")
+    parser.add_argument("archives", nargs="+", help="Archives written with Config.RECORD_FILE")
+
+    args = parser.parse_args()
+
+    for archive in args.archives:
+        summarize_archive(archive)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Offline Re-embedding
+
+Computes a new set of embeddings for the responses of an existing run without
+regenerating any completions, e.g. to try another embedding model or to fill
+in embeddings lost to an embedding outage.
+
+Responses are streamed from the run's result files (raw_results_*.pkl,
+raw_results_*.json or model_results/*_results_*.json) in chunks through a
+batched, concurrent EmbeddingPool. Every vector is stored in a content-hash
+cache (one per embedding model) as soon as its chunk completes, so repeated
+answers are embedded once and an interrupted pass resumes where it stopped
+when the same command is run again.
+
+The result is an embedding set file linked to the original run by path and
+checksum. The analyzer attaches it with --embedding-set and analyzes it with
+--embedder.
+"""
+
+import os
+import re
+import json
+import pickle
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from embedding_pool import EmbeddingPool
+
+logger = logging.getLogger(__name__)
+
+MODEL_RESULTS_PATTERN = re.compile(r"^(?P<model>.+)_results_\d{8}_\d{6}\.json$")
+
+
+def content_hash(text: str) -> str:
+    """SHA-256 of a response text, used as its cache key."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_checksum(path: str) -> str:
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_run_results(path: str) -> Dict[str, Dict[str, List[Dict]]]:
+    """
+    Load a run's results as {model: {question: [items]}}.
+
+    Args:
+        path: A raw_results pickle or JSON file, or a per-model model_results JSON file
+
+    Returns:
+        Dict: The results; items carry at least "repeat" and "response"
+    """
+    if path.endswith(".pkl"):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    with open(path) as f:
+        data = json.load(f)
+
+    # model_results files hold a single model's {question: [items]}
+    match = MODEL_RESULTS_PATTERN.match(os.path.basename(path))
+    if match and all(re.fullmatch(r"Q\d+", key) for key in data):
+        return {match.group("model"): data}
+    return data
+
+
+def iter_responses(results: Dict[str, Dict[str, List[Dict]]]) -> Iterator[Tuple[str, str, int, str]]:
+    """Yield (model, question, index, response text) for every stored response."""
+    for model, model_data in results.items():
+        for q_key, q_data in model_data.items():
+            for index, item in enumerate(q_data):
+                yield model, q_key, index, item.get("response", "")
+
+
+class EmbeddingCache:
+    """Append-only, content-addressed store of embedding vectors for one embedding model."""
+
+    def __init__(self, cache_dir: str, embedding_model: str):
+        """
+        Open (or create) the cache for an embedding model.
+
+        Args:
+            cache_dir: Root directory of all embedding caches
+            embedding_model: Embedding model whose vectors are stored
+        """
+        self.directory = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", embedding_model))
+        os.makedirs(self.directory, exist_ok=True)
+        self.index_file = os.path.join(self.directory, "index.txt")
+        self.vectors_file = os.path.join(self.directory, "vectors.f32")
+        self.meta_file = os.path.join(self.directory, "meta.json")
+
+        self.embedding_model = embedding_model
+        self.dim = None
+        self.rows: Dict[str, int] = {}
+
+        if os.path.exists(self.meta_file):
+            with open(self.meta_file) as f:
+                self.dim = json.load(f)["dim"]
+
+        if self.dim and os.path.exists(self.index_file):
+            # Vectors are written before their index line, so a partial last
+            # write leaves at most an unreferenced vector behind
+            complete_rows = os.path.getsize(self.vectors_file) // (4 * self.dim)
+            with open(self.index_file) as f:
+                for row, line in enumerate(f):
+                    key = line.strip()
+                    if row >= complete_rows or len(key) != 64:
+                        break
+                    self.rows[key] = row
+            with open(self.vectors_file, "r+b") as f:
+                f.truncate(len(self.rows) * 4 * self.dim)
+            with open(self.index_file, "w") as f:
+                f.writelines(f"{key}\n" for key in self.rows)
+
+        logger.info(f"Embedding cache {self.directory}: {len(self.rows)} vectors")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def add(self, vectors: Dict[str, np.ndarray]):
+        """
+        Append vectors to the cache.
+
+        Args:
+            vectors: Mapping of content hash to float32 vector
+        """
+        new = {key: vector for key, vector in vectors.items() if key not in self.rows and len(vector) > 0}
+        if not new:
+            return
+
+        if self.dim is None:
+            self.dim = len(next(iter(new.values())))
+            with open(self.meta_file, "w") as f:
+                json.dump({"embedding_model": self.embedding_model, "dim": self.dim}, f)
+
+        block = np.vstack(list(new.values())).astype(np.float32, copy=False)
+        with open(self.vectors_file, "ab") as f:
+            f.write(block.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.index_file, "a") as f:
+            f.writelines(f"{key}\n" for key in new)
+
+        for key in new:
+            self.rows[key] = len(self.rows)
+
+    def get_many(self, keys: List[str]) -> np.ndarray:
+        """
+        Read vectors for cached content hashes.
+
+        Args:
+            keys: Content hashes, all present in the cache
+
+        Returns:
+            np.ndarray: float32 array of shape (len(keys), dim), in key order
+        """
+        vectors = np.memmap(self.vectors_file, dtype=np.float32, mode="r").reshape(-1, self.dim)
+        return np.array(vectors[[self.rows[key] for key in keys]])
+
+
+class ReEmbedder:
+    """Streams an existing run's responses through an embedding pool."""
+
+    def __init__(self, endpoints: List[str], embedding_model: str, cache_dir: str = "./embedding_cache",
+                 chunk_size: int = 512, timeout: float = 16, batch_size: int = 32,
+                 batch_wait: float = 0.05, workers_per_endpoint: int = 2, prefer_base64: bool = True):
+        """
+        Initialize the re-embedder.
+
+        Args:
+            endpoints: Base URLs of the embedding servers
+            embedding_model: Embedding model to use
+            cache_dir: Root directory of the content-hash caches
+            chunk_size: Responses embedded (and cached) per step
+            timeout: Request timeout in seconds
+            batch_size: Maximum texts per /v1/embeddings call
+            batch_wait: Seconds a pool worker waits to fill a batch
+            workers_per_endpoint: Concurrent embedding calls per endpoint
+            prefer_base64: Request base64-encoded vectors when supported
+        """
+        self.endpoints = list(endpoints)
+        self.embedding_model = embedding_model
+        self.chunk_size = chunk_size
+        self.pool_options = {
+            "timeout": timeout,
+            "batch_size": batch_size,
+            "batch_wait": batch_wait,
+            "workers_per_endpoint": workers_per_endpoint,
+            "prefer_base64": prefer_base64
+        }
+        self.cache = EmbeddingCache(cache_dir, embedding_model)
+
+    def _fill_cache(self, pool: EmbeddingPool, texts: Dict[str, str]) -> int:
+        """Embed the given {hash: text} misses and add them to the cache; return failures."""
+        futures = {key: pool.submit(text) for key, text in texts.items()}
+        vectors = {}
+        failures = 0
+        for key, future in futures.items():
+            try:
+                vectors[key] = future.result()
+            except Exception as e:
+                logger.error(f"Failed to embed response {key[:12]}: {str(e)}")
+                failures += 1
+        self.cache.add(vectors)
+        return failures
+
+    def run(self, results_file: str, output_dir: Optional[str] = None) -> str:
+        """
+        Re-embed every response of a run and write the embedding set.
+
+        Args:
+            results_file: Result file of the original run
+            output_dir: Where to write the embedding set (defaults to the results file's directory)
+
+        Returns:
+            str: Path to the embedding set file
+        """
+        results = load_run_results(results_file)
+        total = sum(1 for _ in iter_responses(results))
+        logger.info(f"Re-embedding {total} responses from {results_file} with {self.embedding_model} "
+                    f"({len(self.cache)} vectors already cached)")
+
+        # Pass 1: stream responses through the pool, chunk by chunk, skipping cached texts
+        embedded = 0
+        failures = 0
+        pending: Dict[str, str] = {}
+        pool = EmbeddingPool(self.endpoints, self.embedding_model, **self.pool_options)
+        try:
+            for position, (_, _, _, text) in enumerate(iter_responses(results), start=1):
+                key = content_hash(text)
+                if key not in self.cache and text:
+                    pending[key] = text
+                if len(pending) >= self.chunk_size or position == total:
+                    if pending:
+                        failures += self._fill_cache(pool, pending)
+                        embedded += len(pending)
+                        pending = {}
+                    print(f"\rRe-embedded {position}/{total} responses "
+                          f"({embedded} new, {failures} failed)", end="")
+        finally:
+            pool.close()
+        print()
+
+        # Pass 2: assemble the embedding set from the cache
+        embeddings: Dict[str, Dict[str, List[np.ndarray]]] = {}
+        response_hashes: Dict[str, Dict[str, List[str]]] = {}
+        missing = 0
+        for model, model_data in results.items():
+            embeddings[model] = {}
+            response_hashes[model] = {}
+            for q_key, q_data in model_data.items():
+                keys = [content_hash(item.get("response", "")) for item in q_data]
+                cached = [key for key in keys if key in self.cache]
+                vectors = iter(self.cache.get_many(cached)) if cached else iter(())
+                embeddings[model][q_key] = [
+                    next(vectors) if key in self.cache else np.array([], dtype=np.float32)
+                    for key in keys
+                ]
+                response_hashes[model][q_key] = keys
+                missing += len(keys) - len(cached)
+
+        embedding_set = {
+            "embedding_model": self.embedding_model,
+            "source_file": os.path.abspath(results_file),
+            "source_sha256": file_checksum(results_file),
+            "created": datetime.now().isoformat(),
+            "endpoints": self.endpoints,
+            "embeddings": embeddings,
+            "response_hashes": response_hashes
+        }
+
+        output_dir = output_dir or os.path.dirname(os.path.abspath(results_file))
+        os.makedirs(output_dir, exist_ok=True)
+        source_stem = os.path.splitext(os.path.basename(results_file))[0]
+        model_slug = re.sub(r"[^A-Za-z0-9_.-]", "_", self.embedding_model)
+        output_file = os.path.join(output_dir, f"embeddings_{model_slug}_{source_stem}.pkl")
+        with open(output_file, "wb") as f:
+            pickle.dump(embedding_set, f)
+
+        if missing:
+            logger.warning(f"{missing} responses have no embedding; run the command again to retry them")
+        logger.info(f"Saved embedding set to {output_file}")
+
+        return output_file
+
+
+def load_embedding_set(path: str) -> Dict:
+    """Load an embedding set written by ReEmbedder.run."""
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def attach_embedding_set(results: Dict[str, Dict[str, List[Dict]]], embedding_set: Dict) -> int:
+    """
+    Add an embedding set's vectors to a run's results, under item["embeddings"][embedding_model].
+
+    Items whose response no longer matches the hash recorded in the set are left out.
+
+    Args:
+        results: The original run's results (modified in place)
+        embedding_set: Embedding set from load_embedding_set
+
+    Returns:
+        int: Number of items that received a vector
+    """
+    embedding_model = embedding_set["embedding_model"]
+    attached = 0
+    mismatched = 0
+
+    for model, model_data in results.items():
+        for q_key, q_data in model_data.items():
+            vectors = embedding_set["embeddings"].get(model, {}).get(q_key, [])
+            hashes = embedding_set["response_hashes"].get(model, {}).get(q_key, [])
+            for item, vector, key in zip(q_data, vectors, hashes):
+                if content_hash(item.get("response", "")) != key:
+                    mismatched += 1
+                    continue
+                item.setdefault("embeddings", {})[embedding_model] = vector
+                attached += len(vector) > 0
+
+    if mismatched:
+        logger.warning(f"{mismatched} responses do not match embedding set {embedding_model} and were skipped")
+    return attached
+
+
+def main():
+    """Re-embed the responses of existing result files."""
+    import argparse
+    from experiment_runner import Config
+
+    config = Config()
+
+    parser = argparse.ArgumentParser(description="Re-embed stored responses without regenerating completions")
+    parser.add_argument("results_files", nargs="+", help="raw_results_*.pkl/.json or model_results/*_results_*.json files")
+    parser.add_argument("--embedding-model", default=config.EMBEDDING_MODEL, help="Embedding model to use")
+    parser.add_argument("--endpoint", action="append", dest="endpoints",
+                        help="Embedding server base URL (repeatable; defaults to Config.EMBEDDING_ENDPOINTS)")
+    parser.add_argument("--cache-dir", default="./embedding_cache", help="Content-hash cache directory")
+    parser.add_argument("--output-dir", help="Where to write embedding sets (default: next to each results file)")
+    parser.add_argument("--chunk-size", type=int, default=512, help="Responses embedded and cached per step")
+
+    args = parser.parse_args()
+
+    endpoints = args.endpoints
+    if not endpoints:
+        if isinstance(config.EMBEDDING_ENDPOINTS, dict):
+            endpoints = config.EMBEDDING_ENDPOINTS.get(args.embedding_model, [])
+        else:
+            endpoints = config.EMBEDDING_ENDPOINTS
+    if not endpoints:
+        print("Error: no embedding endpoint given (use --endpoint or Config.EMBEDDING_ENDPOINTS)")
+        return
+
+    reembedder = ReEmbedder(
+        endpoints,
+        args.embedding_model,
+        cache_dir=args.cache_dir,
+        chunk_size=args.chunk_size,
+        timeout=config.TIMEOUT,
+        batch_size=config.EMBEDDING_BATCH_SIZE,
+        batch_wait=config.EMBEDDING_BATCH_WAIT,
+        workers_per_endpoint=config.EMBEDDING_WORKERS_PER_ENDPOINT,
+        prefer_base64=config.EMBEDDING_BASE64
+    )
+
+    for results_file in args.results_files:
+        if not os.path.exists(results_file):
+            print(f"Error: Results file {results_file} not found")
+            continue
+        output_file = reembedder.run(results_file, args.output_dir)
+        print(f"Embedding set saved to: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,554 @@
+#!/usr/bin/env python3
+"""
+Reference Fingerprint Library
+
+A reusable record of what each model "looks like" to an embedding model on a
+given question set, built from completed runs. For every (model, embedder,
+question set) the library keeps, per question, the response count, the
+centroid of the response embeddings and their dispersion (mean per-dimension
+variance). Adding further runs of the same model merges them into the
+existing reference with the pooled mean and variance.
+
+On disk a library is a directory with index.json (question sets, reference
+metadata and source runs) and one .npz per (embedder, question set) holding
+the stacked (R, Q, d) centroids and (R, Q) dispersions and counts of its R
+references, so identification is a handful of array operations over all
+references at once:
+
+Given a few responses per question from an unknown node, the squared
+distance from their mean to every reference centroid is scaled by what it
+would be if the node ran that model, d * var * (1/n + 1/N). The mean of that
+ratio over questions is the score (about 1 for the right model, much larger
+otherwise).
+
+Embedding dimensions are far from independent, so under a match the ratio
+varies like chi^2_k / k with k the effective dimension of the responses,
+tr(S)^2 / tr(S^2), rather than the embedding size d. The library stores 1/k
+per question, pooled into one k per identification. Allowing for the noise
+of the reference's own dispersion, the score then follows an F distribution,
+whose upper tail is the reference's fit p-value and whose log density is
+its log-likelihood. That depends only on how well each reference fits, not
+on its number of responses, so references merged from more runs aren't
+preferred on the same data.
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+import warnings
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from reembed import file_checksum, load_run_results
+from result_store import is_spill_directory, load_spilled_results
+
+logger = logging.getLogger(__name__)
+
+# Smallest dispersion used in scores, so references with identical responses
+# (zero variance) don't divide by zero
+VARIANCE_FLOOR = 1e-8
+
+# Standard deviations above their own sampling noise at which two reference
+# centroids count as separated on a question
+SEPARATION_Z = 3.0
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+
+
+def questions_hash(questions: List[str]) -> str:
+    """Short hash identifying a question list's texts and order."""
+    return hashlib.sha256("\n".join(questions).encode("utf-8")).hexdigest()[:16]
+
+
+def primary_embedder(path: str) -> Optional[str]:
+    """
+    Embedding model of a stored run's "embedding" field.
+
+    Spill directories record it in their manifest; for result files it is the
+    first embedding model of the run folder's runner Config. None if unknown.
+    """
+    if is_spill_directory(path):
+        with open(os.path.join(path, "manifest.json")) as f:
+            return json.load(f)["embedding_models"][0]
+    from catalog import experiment_folder, runner_config
+    config = runner_config(experiment_folder(path))
+    return (config.get("EMBEDDING_MODELS") or [config.get("EMBEDDING_MODEL")])[0]
+
+
+def load_results(path: str) -> Dict[str, Dict[str, List[Dict]]]:
+    """
+    Load {node: {question: [items]}} from a results pickle/JSON file or a spill directory.
+
+    Items of single-embedder runs get an "embeddings" entry naming the run's
+    embedding model, so item_embedding finds no vector for any other model.
+    """
+    results = load_spilled_results(path) if is_spill_directory(path) else load_run_results(path)
+    embedder = primary_embedder(path)
+    if not embedder:
+        logger.info(f"Embedding model of {path} is unknown; its vectors are used for any embedder name")
+        return results
+    for node_results in results.values():
+        for items in node_results.values():
+            for item in items:
+                vector = item.get("embedding")
+                if "embeddings" not in item and vector is not None and len(vector) > 0:
+                    item["embeddings"] = {embedder: vector}
+    return results
+
+
+def item_embedding(item: Dict, embedder: str) -> np.ndarray:
+    """
+    An item's vector for the given embedding model.
+
+    Multi-embedder runs, and single-embedder runs read with load_results, keep
+    them by model in "embeddings"; other items only have "embedding", which is
+    taken to be from the requested model.
+    """
+    if "embeddings" in item:
+        vector = item["embeddings"].get(embedder, [])
+    else:
+        vector = item.get("embedding", [])
+    return np.asarray(vector if vector is not None else [], dtype=np.float64)
+
+
+def inverse_dimension(stacked: np.ndarray) -> float:
+    """
+    Inverse effective dimension tr(S^2) / tr(S)^2 of responses' covariance S.
+
+    Both traces come from the (n, n) Gram matrix, with the small-sample
+    corrections of Bai and Saranadasa. Unlike its reciprocal, this estimate is
+    nearly unbiased with a handful of responses, so estimates are averaged in
+    this form and only inverted when used. NaN with fewer than 4 responses or
+    a degenerate estimate.
+    """
+    m = len(stacked) - 1
+    if m < 3:
+        return float("nan")
+    centered = stacked - stacked.mean(axis=0)
+    gram = centered @ centered.T / m
+    trace = float(np.trace(gram))
+    trace_of_square = m * m / ((m - 1) * (m + 2)) * (float((gram ** 2).sum()) - trace ** 2 / m)
+    square_of_trace = trace ** 2 - 2 * trace_of_square / m
+    if trace_of_square <= 0 or square_of_trace <= 0:
+        return float("nan")
+    return float(np.clip(trace_of_square / square_of_trace, 1.0 / stacked.shape[1], 1.0))
+
+
+def question_statistics(items: List[Dict], embedder: str) -> Optional[Tuple[int, np.ndarray, float, float]]:
+    """
+    Count, centroid, mean per-dimension variance and inverse effective dimension of responses to a question.
+
+    Returns:
+        Optional[Tuple]: (count, centroid, dispersion, inverse dimension), None if no item has an embedding
+    """
+    vectors = [vector for vector in (item_embedding(item, embedder) for item in items) if vector.size > 0]
+    if not vectors:
+        return None
+    stacked = np.vstack(vectors)
+    return len(vectors), stacked.mean(axis=0), float(stacked.var(axis=0).mean()), inverse_dimension(stacked)
+
+
+class ReferenceLibrary:
+    """Stores reference statistics per (model, embedder, question set) and identifies unknown nodes."""
+
+    def __init__(self, directory: str = "./reference_library"):
+        """
+        Open a library, creating an empty one if the directory has no index.
+
+        Args:
+            directory: Library directory
+        """
+        self.directory = directory
+        self.index_file = os.path.join(directory, "index.json")
+        if os.path.exists(self.index_file):
+            with open(self.index_file) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {"question_sets": {}, "references": []}
+        # Loaded arrays per (embedder, question set)
+        self._groups: Dict[Tuple[str, str], Dict[str, np.ndarray]] = {}
+
+    def _group_file(self, embedder: str, question_set: str) -> str:
+        return os.path.join(self.directory, f"{_slug(embedder)}__{_slug(question_set)}.npz")
+
+    def _references(self, embedder: str, question_set: str) -> List[Dict]:
+        return [reference for reference in self.index["references"]
+                if reference["embedder"] == embedder and reference["question_set"] == question_set]
+
+    def group(self, embedder: str, question_set: str) -> Dict[str, np.ndarray]:
+        """
+        Stacked statistics of all references for an embedder and question set.
+
+        Returns:
+            Dict[str, np.ndarray]: "models" (R,), "centroids" (R, Q, d), "dispersion",
+            "inverse_dimension" and "counts" (R, Q); empty if there are no such references
+        """
+        key = (embedder, question_set)
+        if key not in self._groups:
+            path = self._group_file(embedder, question_set)
+            if not os.path.exists(path):
+                return {}
+            with np.load(path) as data:
+                group = {name: data[name] for name in data.files}
+            if "inverse_dimension" not in group:
+                logger.warning(f"{path} predates effective dimensions; re-add its runs for calibrated posteriors")
+                group["inverse_dimension"] = np.full(group["counts"].shape, np.nan)
+            self._groups[key] = group
+        return self._groups[key]
+
+    def register_question_set(self, name: str, questions: List[str]):
+        """
+        Record a question set's texts; a name can't be reused for different questions.
+
+        Raises:
+            ValueError: If the name is already registered with other questions
+        """
+        digest = questions_hash(questions)
+        existing = self.index["question_sets"].get(name)
+        if existing and existing["hash"] != digest:
+            raise ValueError(f"Question set {name} is already registered with different questions")
+        self.index["question_sets"][name] = {"hash": digest, "questions": list(questions)}
+
+    def questions(self, question_set: str) -> List[str]:
+        """Question texts of a registered question set."""
+        return self.index["question_sets"][question_set]["questions"]
+
+    def add_results(self, results: Dict[str, Dict[str, List[Dict]]], embedder: str, question_set: str,
+                    source: str, labels: Optional[Dict[str, str]] = None) -> List[str]:
+        """
+        Add or merge the nodes of a run as references.
+
+        Args:
+            results: Run results {node: {question: [items]}}
+            embedder: Embedding model whose vectors to use
+            question_set: Registered question set the run asked
+            source: Identifier of the run (e.g. a file checksum); runs already added are skipped
+            labels: Optional node name -> reference model name (defaults to the node name)
+
+        Returns:
+            List[str]: Reference models that were added or updated
+        """
+        if question_set not in self.index["question_sets"]:
+            raise ValueError(f"Unknown question set {question_set}; register it first")
+        num_questions = len(self.questions(question_set))
+        labels = labels or {}
+
+        group = dict(self.group(embedder, question_set))
+        references = self._references(embedder, question_set)
+        models = [reference["model"] for reference in references]
+        updated = []
+
+        for node, node_results in results.items():
+            model = labels.get(node, node)
+            if model in models and source in references[models.index(model)]["sources"]:
+                logger.info(f"{model} from {source} is already in the library")
+                continue
+
+            stats = [question_statistics(node_results.get(f"Q{i+1}", []), embedder) for i in range(num_questions)]
+            if not any(stats):
+                logger.warning(f"No {embedder} embeddings for {node}; not added")
+                continue
+            dim = next(stat[1].shape[0] for stat in stats if stat)
+
+            counts = np.array([stat[0] if stat else 0 for stat in stats])
+            centroids = np.vstack([stat[1] if stat else np.zeros(dim) for stat in stats])
+            dispersion = np.array([stat[2] if stat else 0.0 for stat in stats])
+            inverse = np.array([stat[3] if stat else np.nan for stat in stats])
+
+            if not group:
+                group = {
+                    "models": np.array([], dtype=object),
+                    "centroids": np.empty((0, num_questions, dim), dtype=np.float32),
+                    "dispersion": np.empty((0, num_questions)),
+                    "inverse_dimension": np.empty((0, num_questions)),
+                    "counts": np.empty((0, num_questions), dtype=np.int64)
+                }
+            if group["centroids"].shape[2] != dim:
+                raise ValueError(f"{embedder} vectors of {node} have {dim} dimensions, "
+                                 f"the library has {group['centroids'].shape[2]}")
+
+            if model in models:
+                # Pool with the existing reference: combined mean and mean per-dimension variance
+                r = models.index(model)
+                old_counts = group["counts"][r]
+                old_centroids = group["centroids"][r].astype(np.float64)
+                total = old_counts + counts
+                safe_total = np.maximum(total, 1)
+                merged = (old_counts[:, None] * old_centroids + counts[:, None] * centroids) / safe_total[:, None]
+                between = np.mean((old_centroids - centroids) ** 2, axis=1)
+                group["dispersion"][r] = (old_counts * group["dispersion"][r] + counts * dispersion
+                                          + old_counts * counts / safe_total * between) / safe_total
+                # Count-weighted mean of the inverse dimensions either side has
+                old_inverse = group["inverse_dimension"][r]
+                old_weight = np.where(np.isfinite(old_inverse), old_counts, 0)
+                new_weight = np.where(np.isfinite(inverse), counts, 0)
+                with np.errstate(invalid="ignore"):
+                    group["inverse_dimension"][r] = (old_weight * np.nan_to_num(old_inverse)
+                                                     + new_weight * np.nan_to_num(inverse)) / (old_weight + new_weight)
+                group["centroids"][r] = merged
+                group["counts"][r] = total
+                references[r]["sources"].append(source)
+            else:
+                group["models"] = np.append(group["models"], model).astype(object)
+                group["centroids"] = np.concatenate([group["centroids"], centroids[None].astype(np.float32)])
+                group["dispersion"] = np.concatenate([group["dispersion"], dispersion[None]])
+                group["inverse_dimension"] = np.concatenate([group["inverse_dimension"], inverse[None]])
+                group["counts"] = np.concatenate([group["counts"], counts[None]])
+                reference = {"model": model, "embedder": embedder, "question_set": question_set,
+                             "dim": dim, "sources": [source]}
+                self.index["references"].append(reference)
+                references.append(reference)
+                models.append(model)
+
+            references[models.index(model)]["responses"] = int(group["counts"][models.index(model)].sum())
+            references[models.index(model)]["updated"] = datetime.now().isoformat(timespec="seconds")
+            updated.append(model)
+
+        if updated:
+            self._groups[(embedder, question_set)] = group
+        return updated
+
+    def save(self):
+        """Write the index and every modified group."""
+        os.makedirs(self.directory, exist_ok=True)
+        for (embedder, question_set), group in self._groups.items():
+            np.savez(self._group_file(embedder, question_set),
+                     models=np.asarray(group["models"], dtype=str),
+                     centroids=group["centroids"],
+                     dispersion=group["dispersion"],
+                     inverse_dimension=group["inverse_dimension"],
+                     counts=group["counts"])
+        temp_file = f"{self.index_file}.tmp"
+        with open(temp_file, "w") as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(temp_file, self.index_file)
+
+    def identify(self, samples: Dict[str, np.ndarray], embedder: str, question_set: str,
+                 top_k: Optional[int] = 5) -> pd.DataFrame:
+        """
+        Rank the references by how well they explain an unknown node's responses.
+
+        Args:
+            samples: Question key -> (n, d) response embeddings of the unknown node
+            embedder: Embedding model the samples were embedded with
+            question_set: Question set the samples answer
+            top_k: Number of references to return (None for all)
+
+        Returns:
+            pd.DataFrame: model, score (mean normalized squared distance; ~1 for a match),
+            distance (mean centroid distance), effective_dimension, fit_pvalue (chance
+            of a score at least this large from the reference's own model), log_likelihood
+            (density of the score, flat below its mode), posterior and questions used, best match first
+        """
+        group = self.group(embedder, question_set)
+        if not group:
+            raise ValueError(f"No references for {embedder} on question set {question_set}")
+
+        fit = fit_references(group, samples)
+        log_likelihood = fit["log_likelihood"]
+        finite = np.isfinite(log_likelihood)
+        posterior = np.zeros(len(log_likelihood))
+        if finite.any():
+            posterior[finite] = np.exp(log_likelihood[finite] - log_likelihood[finite].max())
+            posterior /= posterior.sum()
+
+        df = pd.DataFrame({
+            "model": group["models"].astype(str),
+            "score": fit["score"],
+            "distance": fit["distance"],
+            "effective_dimension": fit["effective_dimension"],
+            "fit_pvalue": fit["fit_pvalue"],
+            "log_likelihood": log_likelihood,
+            "posterior": posterior,
+            "questions": fit["questions"]
+        })
+        df = df.sort_values(["log_likelihood", "score"], ascending=[False, True]).reset_index(drop=True)
+        return df.head(top_k) if top_k else df
+
+    def summary(self) -> pd.DataFrame:
+        """One row per reference with its embedder, question set, responses and source runs."""
+        return pd.DataFrame([
+            {"model": reference["model"], "embedder": reference["embedder"],
+             "question_set": reference["question_set"], "responses": reference.get("responses", 0),
+             "runs": len(reference["sources"]), "updated": reference.get("updated")}
+            for reference in self.index["references"]
+        ])
+
+
+def group_dimension(group: Dict[str, np.ndarray], q_index: Optional[List[int]] = None) -> float:
+    """
+    Effective dimension of a group's responses, pooled over references and questions (all, or q_index).
+
+    One value for all references, so references that fit equally well get
+    the same likelihood. The full embedding size if no estimate is stored.
+    """
+    inverse = group["inverse_dimension"] if q_index is None else group["inverse_dimension"][:, q_index]
+    inverse = inverse[np.isfinite(inverse)]
+    return float(1 / inverse.mean()) if inverse.size else float(group["centroids"].shape[2])
+
+
+def separated_distances(group: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Squared distances between reference centroids per question, less the centroids' own noise: (Q, R, R).
+
+    Sample centroids of the same model lie about d (v_i / N_i + v_j / N_j)
+    apart. That noise is subtracted, and distances not SEPARATION_Z standard
+    deviations (under chi^2_k) above it are set to 0, so choosing questions by
+    them doesn't pick the questions where a reference's centroid happens to be
+    off. NaN where either reference has no answers.
+    """
+    centroids = np.moveaxis(group["centroids"].astype(np.float64), 1, 0)  # (Q, R, d)
+    counts = group["counts"].T.astype(float)  # (Q, R)
+    sample_correction = np.where(counts > 1, counts / np.maximum(counts - 1, 1), 1.0)
+    variance = np.maximum(group["dispersion"].T * sample_correction, VARIANCE_FLOOR)
+    noise_per_reference = variance / np.maximum(counts, 1)
+    dim = centroids.shape[2]
+
+    norms = (centroids ** 2).sum(axis=2)
+    squared = np.maximum(norms[:, :, None] + norms[:, None, :]
+                         - 2 * np.einsum("qrd,qsd->qrs", centroids, centroids), 0.0)
+    noise = dim * (noise_per_reference[:, :, None] + noise_per_reference[:, None, :])
+    z = (squared / noise - 1) * np.sqrt(group_dimension(group) / 2)
+    separated = np.where(z > SEPARATION_Z, squared - noise, 0.0)
+    known = counts > 0
+    return np.where(known[:, :, None] & known[:, None, :], separated, np.nan)
+
+
+def fit_references(group: Dict[str, np.ndarray], samples: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    How well every reference of a group explains a node's responses (see ReferenceLibrary.identify).
+
+    Args:
+        group: Reference group from ReferenceLibrary.group
+        samples: Question key -> (n, d) response embeddings of the node
+
+    Returns:
+        Dict[str, np.ndarray]: (R,) "score", "distance", "fit_pvalue", "log_likelihood"
+        and "questions" used, and the pooled "effective_dimension"
+
+    Raises:
+        ValueError: If no sample answers a question of the group
+    """
+    num_questions = group["centroids"].shape[1]
+    q_index = [int(key[1:]) - 1 for key, vectors in samples.items()
+               if re.fullmatch(r"Q\d+", key) and 0 < int(key[1:]) <= num_questions and len(vectors) > 0]
+    if not q_index:
+        raise ValueError("No responses to questions of this question set")
+    keys = [f"Q{i+1}" for i in q_index]
+
+    means = np.vstack([np.asarray(samples[key], dtype=np.float64).mean(axis=0) for key in keys])
+    n = np.array([len(samples[key]) for key in keys], dtype=float)
+    centroids = group["centroids"][:, q_index].astype(np.float64)
+    counts = group["counts"][:, q_index].astype(float)
+    # Stored dispersions are population variances; scale them to sample variances
+    sample_correction = np.where(counts > 1, counts / np.maximum(counts - 1, 1), 1.0)
+    dispersion = np.maximum(group["dispersion"][:, q_index] * sample_correction, VARIANCE_FLOOR)
+    dim = centroids.shape[2]
+
+    # (R, Q') squared distances of the query means to every reference centroid
+    squared = np.maximum((means ** 2).sum(axis=1)[None, :] + (centroids ** 2).sum(axis=2)
+                         - 2 * np.einsum("rqd,qd->rq", centroids, means), 0.0)
+    known = counts > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_variance = dispersion * (1 / n[None, :] + np.where(known, 1 / counts, 0.0))
+        ratio = np.where(known, squared / (dim * mean_variance), np.nan)
+    used = known.sum(axis=1)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        score = np.nanmean(ratio, axis=1)
+        distance = np.nanmean(np.where(known, np.sqrt(squared), np.nan), axis=1)
+
+    # Under a match each ratio varies like chi^2_k / k over the reference's estimated
+    # dispersion, whose own noise has k (N - 1) degrees of freedom, so the score follows
+    # F(k Q', k sum(N - 1)). Below the density's mode (or 1, for fewer than 3 degrees of
+    # freedom) it is held flat: a reference can fit too well by sharing responses with
+    # the query, but not by being the wrong model
+    effective = group_dimension(group, q_index)
+    numerator = effective * np.maximum(used, 1)
+    denominator = effective * np.maximum(np.where(known, counts - 1, 0).sum(axis=1), 1)
+    mode = np.maximum(numerator - 2, 1.0) / numerator * denominator / (denominator + 2)
+    log_likelihood = np.where(used > 0, stats.f.logpdf(np.maximum(np.nan_to_num(score), mode),
+                                                       numerator, denominator), -np.inf)
+    fit_pvalue = np.where(used > 0, stats.f.sf(np.nan_to_num(score), numerator, denominator), 0.0)
+
+    return {"score": score, "distance": distance, "effective_dimension": effective, "fit_pvalue": fit_pvalue,
+            "log_likelihood": log_likelihood, "questions": used}
+
+
+def node_samples(node_results: Dict[str, List[Dict]], embedder: str) -> Dict[str, np.ndarray]:
+    """Stack one node's response embeddings per question, for ReferenceLibrary.identify."""
+    samples = {}
+    for q_key, items in node_results.items():
+        vectors = [vector for vector in (item_embedding(item, embedder) for item in items) if vector.size > 0]
+        if vectors:
+            samples[q_key] = np.vstack(vectors)
+    return samples
+
+
+def main():
+    """Add runs to a reference library, list it, or identify the nodes of a run."""
+    import argparse
+    from experiment_runner import Config
+
+    config = Config()
+    question_sets = {"models": config.MODEL_QUESTIONS, "knowledge_bases": config.KB_QUESTIONS}
+
+    parser = argparse.ArgumentParser(description="Reference fingerprint library of model response statistics")
+    parser.add_argument("--library", default="./reference_library", help="Library directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = subparsers.add_parser("add", help="Add the nodes of completed runs as references")
+    add_parser.add_argument("results_files", nargs="+", help="raw_results pickle/JSON files or spill directories")
+    add_parser.add_argument("--embedder", default=config.EMBEDDING_MODEL, help="Embedding model to use")
+    add_parser.add_argument("--question-set", choices=sorted(question_sets), default=config.EXPERIMENT_MODE,
+                            help="Question set the runs asked")
+    add_parser.add_argument("--label", action="append", default=[],
+                            help="NODE=MODEL to store a node under another name (repeatable)")
+
+    identify_parser = subparsers.add_parser("identify", help="Identify the nodes of a run against the library")
+    identify_parser.add_argument("results_file", help="raw_results pickle/JSON file or spill directory")
+    identify_parser.add_argument("--node", action="append", dest="nodes", help="Node to identify (default: all)")
+    identify_parser.add_argument("--embedder", default=config.EMBEDDING_MODEL, help="Embedding model to use")
+    identify_parser.add_argument("--question-set", choices=sorted(question_sets), default=config.EXPERIMENT_MODE,
+                                 help="Question set the run asked")
+    identify_parser.add_argument("--top", type=int, default=5, help="References to show per node")
+
+    subparsers.add_parser("list", help="List the references in the library")
+
+    args = parser.parse_args()
+    library = ReferenceLibrary(args.library)
+
+    if args.command == "add":
+        library.register_question_set(args.question_set, question_sets[args.question_set])
+        labels = dict(label.split("=", 1) for label in args.label)
+        for results_file in args.results_files:
+            if not os.path.exists(results_file):
+                print(f"Error: Results file {results_file} not found")
+                continue
+            source = results_file if os.path.isdir(results_file) else file_checksum(results_file)
+            added = library.add_results(load_results(results_file), args.embedder, args.question_set, source, labels)
+            print(f"{results_file}: {', '.join(added) if added else 'nothing new'}")
+        library.save()
+
+    elif args.command == "identify":
+        results = load_results(args.results_file)
+        for node in args.nodes or list(results):
+            matches = library.identify(node_samples(results[node], args.embedder), args.embedder,
+                                       args.question_set, args.top)
+            print(f"\n{node}:")
+            print(matches.to_markdown(index=False, floatfmt=".4f"))
+
+    else:
+        print(library.summary().to_markdown(index=False))
+
+
+if __name__ == "__main__":
+    main()
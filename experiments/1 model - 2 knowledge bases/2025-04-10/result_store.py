@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Spilled Result Store
+
+Disk-backed storage for memory-bounded runs. Instead of holding every
+response and embedding in ExperimentRunner.results until save_raw_data, the
+runner appends each result item here as soon as it is complete:
+
+- response text and metadata go to <node>/records.jsonl, one line per item
+- embeddings go to <node>/<embedder>.f32 as raw float32 rows
+
+In memory the store keeps only the node being run: per-question running
+statistics (Welford mean and variance per dimension) and a small index of
+row numbers. When the node finishes, its statistics are written to
+<node>/stats_<embedder>.npz and a summary to <node>/stats.json, and the
+in-memory state is dropped, so memory stays flat regardless of the number of
+nodes, questions or repeats.
+
+load_spilled_results rebuilds the usual {node: {question: [items]}} structure
+with memory-mapped embeddings, which is what ExperimentAnalyzer reads when
+given a spill directory.
+"""
+
+import os
+import re
+import json
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Result item fields stored in records.jsonl (embeddings are stored separately)
+RECORD_EXCLUDED_FIELDS = ("embedding", "embeddings")
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+
+
+def _json_value(value):
+    """Serialize numpy scalars in result records."""
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+class _RunningStats:
+    """Welford accumulator for per-dimension mean and variance."""
+
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self, dim: int):
+        self.count = 0
+        self.mean = np.zeros(dim, dtype=np.float64)
+        self.m2 = np.zeros(dim, dtype=np.float64)
+
+    def add(self, vector: np.ndarray):
+        self.count += 1
+        delta = vector - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (vector - self.mean)
+
+    @property
+    def variance(self) -> np.ndarray:
+        # Population variance, matching np.std in the analyzer
+        return self.m2 / self.count if self.count else self.m2
+
+
+class ResultStore:
+    """Appends result items to disk and keeps running statistics for the current node."""
+
+    def __init__(self, directory: str, embedding_models: List[str], num_questions: int):
+        """
+        Create the store.
+
+        Args:
+            directory: Spill directory for this run (created if missing)
+            embedding_models: Embedding models stored per item; the first is the primary one
+            num_questions: Number of questions in the run
+        """
+        self.directory = directory
+        self.embedding_models = list(embedding_models)
+        self.num_questions = num_questions
+        os.makedirs(directory, exist_ok=True)
+
+        self.nodes: List[str] = []
+        self.dims: Dict[str, int] = {}
+        self.truncated = 0
+
+        # State of the node being written
+        self._node: Optional[str] = None
+        self._records = None
+        self._vector_files: Dict[str, object] = {}
+        self._rows: Dict[str, int] = {}
+        self._stats: Dict[tuple, _RunningStats] = {}
+        self._index: Dict[str, List[tuple]] = {}
+
+        self._write_manifest()
+
+    def _write_manifest(self):
+        manifest = {
+            "format": "spilled-results",
+            "created": datetime.now().isoformat(),
+            "embedding_models": self.embedding_models,
+            "num_questions": self.num_questions,
+            "dims": self.dims,
+            "nodes": self.nodes,
+            "node_dirs": {node: _slug(node) for node in self.nodes}
+        }
+        with open(os.path.join(self.directory, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+    def start_node(self, name: str):
+        """Open the files for a node's results."""
+        if self._node is not None:
+            self.finish_node()
+        node_dir = os.path.join(self.directory, _slug(name))
+        os.makedirs(node_dir, exist_ok=True)
+
+        self._node = name
+        self._records = open(os.path.join(node_dir, "records.jsonl"), "w")
+        self._vector_files = {
+            embedding_model: open(os.path.join(node_dir, f"{_slug(embedding_model)}.f32"), "wb")
+            for embedding_model in self.embedding_models
+        }
+        self._rows = {embedding_model: 0 for embedding_model in self.embedding_models}
+        self._stats = {}
+        self._index = {}
+        self.truncated = 0
+
+        if name not in self.nodes:
+            self.nodes.append(name)
+            self._write_manifest()
+
+    def append(self, q_key: str, items: List[Dict]):
+        """
+        Write result items of the current node.
+
+        Args:
+            q_key: Question key (e.g. "Q1")
+            items: Result items with resolved embeddings (not Futures)
+        """
+        for item in items:
+            vectors = item.get("embeddings") or {self.embedding_models[0]: item.get("embedding", [])}
+            rows = {}
+            for embedding_model in self.embedding_models:
+                vector = np.asarray(vectors.get(embedding_model, []), dtype=np.float32)
+                if vector.size == 0:
+                    rows[embedding_model] = -1
+                    continue
+                if embedding_model not in self.dims:
+                    self.dims[embedding_model] = int(vector.shape[0])
+                    self._write_manifest()
+                self._vector_files[embedding_model].write(vector.tobytes())
+                rows[embedding_model] = self._rows[embedding_model]
+                self._rows[embedding_model] += 1
+
+                key = (q_key, embedding_model)
+                if key not in self._stats:
+                    self._stats[key] = _RunningStats(vector.shape[0])
+                self._stats[key].add(vector.astype(np.float64))
+
+            record = {key: value for key, value in item.items() if key not in RECORD_EXCLUDED_FIELDS}
+            record["question"] = q_key
+            record["rows"] = rows
+            self._records.write(json.dumps(record, default=_json_value) + "\n")
+            self._index.setdefault(q_key, []).append((item["repeat"], rows[self.embedding_models[0]]))
+            self.truncated += bool(item.get("truncated"))
+
+    def finish_node(self) -> Dict[str, Dict[str, Dict]]:
+        """
+        Close the current node's files and write its statistics.
+
+        Returns:
+            Dict: Per embedder and question: count, mean_stddev and rms_scatter
+        """
+        if self._node is None:
+            return {}
+
+        self._records.close()
+        for vector_file in self._vector_files.values():
+            vector_file.close()
+
+        node_dir = os.path.join(self.directory, _slug(self._node))
+        summary = {}
+        for embedding_model in self.embedding_models:
+            summary[embedding_model] = {}
+            arrays = {}
+            for (q_key, stats_model), stats in self._stats.items():
+                if stats_model != embedding_model:
+                    continue
+                std_per_dim = np.sqrt(stats.variance)
+                summary[embedding_model][q_key] = {
+                    "count": stats.count,
+                    "mean_stddev": float(np.mean(std_per_dim)),
+                    "rms_scatter": float(np.sqrt(np.mean(np.square(std_per_dim)))),
+                    "zero_std_dims": int(np.sum(std_per_dim == 0))
+                }
+                arrays[f"{q_key}_mean"] = stats.mean.astype(np.float32)
+                arrays[f"{q_key}_var"] = stats.variance.astype(np.float32)
+                arrays[f"{q_key}_count"] = np.array(stats.count)
+            if arrays:
+                np.savez(os.path.join(node_dir, f"stats_{_slug(embedding_model)}.npz"), **arrays)
+
+        with open(os.path.join(node_dir, "stats.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+
+        stored = sum(len(rows) for rows in self._index.values())
+        logger.info(f"Spilled {stored} results for {self._node} to {node_dir}")
+
+        self._node = None
+        self._records = None
+        self._vector_files = {}
+        self._stats = {}
+        self._index = {}
+        return summary
+
+    def close(self):
+        """Finish the current node, if any."""
+        self.finish_node()
+
+
+def is_spill_directory(path: str) -> bool:
+    """True if path is a spill directory written by ResultStore."""
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, "manifest.json"))
+
+
+def load_spilled_results(directory: str, mmap: bool = True) -> Dict[str, Dict[str, List[Dict]]]:
+    """
+    Rebuild {node: {question: [items]}} from a spill directory.
+
+    Args:
+        directory: Spill directory written by ResultStore
+        mmap: Memory-map embeddings instead of reading them into memory
+
+    Returns:
+        Dict: Results in the runner's usual structure, items sorted by repeat;
+        "embedding" holds the primary embedder's vector and, for multi-embedder
+        runs, "embeddings" holds all of them
+    """
+    with open(os.path.join(directory, "manifest.json")) as f:
+        manifest = json.load(f)
+
+    embedding_models = manifest["embedding_models"]
+    results = {}
+    for node in manifest["nodes"]:
+        node_dir = os.path.join(directory, manifest["node_dirs"][node])
+        matrices = {}
+        for embedding_model in embedding_models:
+            path = os.path.join(node_dir, f"{_slug(embedding_model)}.f32")
+            dim = manifest["dims"].get(embedding_model)
+            if dim and os.path.exists(path) and os.path.getsize(path) > 0:
+                if mmap:
+                    matrices[embedding_model] = np.memmap(path, dtype=np.float32, mode="r").reshape(-1, dim)
+                else:
+                    matrices[embedding_model] = np.fromfile(path, dtype=np.float32).reshape(-1, dim)
+
+        empty = np.array([], dtype=np.float32)
+        node_results: Dict[str, List[Dict]] = {f"Q{i+1}": [] for i in range(manifest["num_questions"])}
+        with open(os.path.join(node_dir, "records.jsonl")) as f:
+            for line in f:
+                record = json.loads(line)
+                rows = record.pop("rows")
+                q_key = record.pop("question")
+                vectors = {
+                    embedding_model: matrices[embedding_model][row] if row >= 0 and embedding_model in matrices else empty
+                    for embedding_model, row in rows.items()
+                }
+                record["embedding"] = vectors[embedding_models[0]]
+                if len(embedding_models) > 1:
+                    record["embeddings"] = vectors
+                node_results.setdefault(q_key, []).append(record)
+
+        for q_items in node_results.values():
+            q_items.sort(key=lambda item: item["repeat"])
+        results[node] = node_results
+
+    return results
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Runner Throughput Benchmark
+
+Measures the client side of ExperimentRunner: how many requests per second it
+can drive, how much CPU it spends per request and how much memory it holds on
+to as a run grows. Each workload runs a full models x questions x repeats
+experiment against in-process stand-in nodes that answer like an OpenAI-style
+server after a configurable latency.
+
+The stand-in nodes run in this process, so the CPU time their handler
+threads use is measured per request and subtracted from the process total.
+Results can be stored as a baseline and later runs compared against it,
+flagging throughput, CPU or memory regressions beyond a tolerance.
+"""
+
+import os
+import gc
+import json
+import time
+import base64
+import hashlib
+import logging
+import resource
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Workloads: nodes x questions x repeats
+WORKLOADS = {
+    "smoke": {"nodes": 2, "questions": 5, "repeats": 5},
+    "default": {"nodes": 3, "questions": 20, "repeats": 10},
+    "wide": {"nodes": 8, "questions": 20, "repeats": 5},
+    "deep": {"nodes": 2, "questions": 20, "repeats": 50}
+}
+
+# Metrics compared against the baseline, and whether higher is better
+COMPARED_METRICS = {
+    "requests_per_second": True,
+    "cpu_ms_per_request": False,
+    "rss_growth_kb_per_request": False
+}
+
+
+class StandInNode:
+    """An OpenAI-style chat/embeddings server for one fake node."""
+
+    def __init__(self, name: str, latency: float = 0.01, response_words: int = 120,
+                 embedding_dim: int = 1536, slots: int = 4):
+        """
+        Start the node on an ephemeral local port.
+
+        Args:
+            name: Node name, mixed into responses and embeddings
+            latency: Seconds each completion takes
+            response_words: Words per completion
+            embedding_dim: Length of embedding vectors
+            slots: Parallel slots reported on /props
+        """
+        self.name = name
+        self.latency = latency
+        self.response_words = response_words
+        self.embedding_dim = embedding_dim
+        self.slots = slots
+        self.requests = 0
+        self.cpu_seconds = 0.0
+        self._lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _completion(self, payload: Dict) -> Dict:
+        question = payload["messages"][-1]["content"]
+        count = payload.get("n", 1)
+        choices = []
+        for index in range(count):
+            seed = np.random.default_rng().integers(1 << 30)
+            words = [f"{self.name}-{question[:12]}-{(seed + i) % 997}" for i in range(self.response_words)]
+            choices.append({
+                "index": index,
+                "message": {"role": "assistant", "content": " ".join(words)},
+                "finish_reason": "stop"
+            })
+        return {
+            "choices": choices,
+            "usage": {
+                "prompt_tokens": 40,
+                "completion_tokens": self.response_words * count,
+                "total_tokens": 40 + self.response_words * count
+            }
+        }
+
+    def _embeddings(self, payload: Dict) -> Dict:
+        data = []
+        for index, text in enumerate(payload["input"]):
+            seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+            vector = np.random.default_rng(seed).standard_normal(self.embedding_dim).astype(np.float32)
+            if payload.get("encoding_format") == "base64":
+                encoded = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+            else:
+                encoded = vector.tolist()
+            data.append({"index": index, "embedding": encoded})
+        return {"data": data, "model": payload.get("model")}
+
+    def _make_handler(self):
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, document: Dict):
+                body = json.dumps(document).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                cpu_start = time.thread_time()
+                if self.path == "/props":
+                    self._send(200, {"total_slots": node.slots})
+                else:
+                    self._send(404, {"error": "not found"})
+                node._account(time.thread_time() - cpu_start)
+
+            def do_POST(self):
+                cpu_start = time.thread_time()
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path == "/v1/chat/completions":
+                    document = node._completion(payload)
+                    # Sleeping costs no CPU, so it is left out of the accounting window
+                    node._account(time.thread_time() - cpu_start)
+                    time.sleep(node.latency)
+                    cpu_start = time.thread_time()
+                    self._send(200, document)
+                elif self.path == "/v1/embeddings":
+                    self._send(200, node._embeddings(payload))
+                else:
+                    self._send(404, {"error": "not found"})
+                node._account(time.thread_time() - cpu_start, request=True)
+
+        return Handler
+
+    def _account(self, cpu_seconds: float, request: bool = False):
+        with self._lock:
+            self.cpu_seconds += cpu_seconds
+            self.requests += request
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _rss_bytes() -> int:
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # Peak RSS in KB on Linux; the best available elsewhere
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@contextmanager
+def _working_directory(path: str):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def run_workload(name: str, nodes: int, questions: int, repeats: int, latency: float = 0.01,
+                 response_words: int = 120, embedding_dim: int = 1536, slots: int = 4,
+                 overrides: Optional[Dict] = None) -> Dict:
+    """
+    Run one full experiment against stand-in nodes and measure the runner.
+
+    Args:
+        name: Workload name
+        nodes: Number of stand-in nodes (models)
+        questions: Questions per node
+        repeats: Repeats per question
+        latency: Seconds each stand-in completion takes
+        response_words: Words per stand-in completion
+        embedding_dim: Length of stand-in embedding vectors
+        slots: Parallel slots each stand-in node reports
+        overrides: Extra Config attributes to set (e.g. {"SCHEDULING_POLICY": "grouped"})
+
+    Returns:
+        Dict: Measurements for the workload
+    """
+    from experiment_runner import Config, ExperimentRunner
+
+    stand_ins = [StandInNode(f"node-{i+1}", latency, response_words, embedding_dim, slots) for i in range(nodes)]
+
+    config = Config()
+    config.EXPERIMENT_MODE = "models"
+    config.MODELS = {node.name: node.url for node in stand_ins}
+    config.MODEL_QUESTIONS = [f"Benchmark question {i+1}: describe item {i+1}." for i in range(questions)]
+    config.NUM_REPEATS = repeats
+    config.REQUEST_DELAY = 0
+    for key, value in (overrides or {}).items():
+        setattr(config, key, value)
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="runner_benchmark_") as workdir, _working_directory(workdir):
+            gc.collect()
+            rss_start = _rss_bytes()
+            cpu_start = time.process_time()
+            wall_start = time.perf_counter()
+
+            runner = ExperimentRunner(config)
+            runner.run_sequential_experiment()
+
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            rss_growth = _rss_bytes() - rss_start
+
+            save_start = time.perf_counter()
+            runner.save_raw_data()
+            save_seconds = time.perf_counter() - save_start
+    finally:
+        for node in stand_ins:
+            node.close()
+
+    responses = sum(len(q_items) for model_data in runner.results.values() for q_items in model_data.values())
+    server_requests = sum(node.requests for node in stand_ins)
+    client_cpu = cpu - sum(node.cpu_seconds for node in stand_ins)
+    del runner
+
+    return {
+        "workload": name,
+        "nodes": nodes,
+        "questions": questions,
+        "repeats": repeats,
+        "latency": latency,
+        "responses": responses,
+        "http_requests": server_requests,
+        "wall_seconds": wall,
+        "requests_per_second": responses / wall if wall > 0 else 0.0,
+        "cpu_ms_per_request": 1000 * client_cpu / max(responses, 1),
+        "rss_growth_mb": rss_growth / (1 << 20),
+        "rss_growth_kb_per_request": rss_growth / 1024 / max(responses, 1),
+        "save_raw_data_seconds": save_seconds,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+def load_baseline(path: str) -> Dict[str, Dict]:
+    """Load stored baseline measurements keyed by workload name."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path: str, measurements: List[Dict]):
+    """Store measurements as the baseline for their workloads, keeping other workloads."""
+    baseline = load_baseline(path)
+    for measurement in measurements:
+        baseline[measurement["workload"]] = measurement
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2)
+    logger.info(f"Saved baseline for {[m['workload'] for m in measurements]} to {path}")
+
+
+def compare_to_baseline(measurements: List[Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """
+    Compare measurements with the baseline.
+
+    Args:
+        measurements: Results of run_workload
+        baseline: Stored measurements keyed by workload name
+        tolerance: Allowed relative change in the bad direction (e.g. 0.1 = 10%)
+
+    Returns:
+        List[str]: One message per regression
+    """
+    regressions = []
+    for measurement in measurements:
+        reference = baseline.get(measurement["workload"])
+        if not reference:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = reference[metric], measurement[metric]
+            if old <= 0:
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                regressions.append(f"{measurement['workload']}: {metric} {old:.3f} -> {new:.3f} ({change:+.1%})")
+    return regressions
+
+
+def main():
+    """Run runner benchmarks and compare them with the stored baseline."""
+    import argparse
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Benchmark ExperimentRunner throughput against stand-in nodes")
+    parser.add_argument("--workload", action="append", choices=sorted(WORKLOADS),
+                        help="Workload to run (repeatable; default: smoke and default)")
+    parser.add_argument("--latency", type=float, default=0.01, help="Seconds per stand-in completion")
+    parser.add_argument("--response-words", type=int, default=120, help="Words per stand-in completion")
+    parser.add_argument("--embedding-dim", type=int, default=1536, help="Stand-in embedding length")
+    parser.add_argument("--slots", type=int, default=4, help="Parallel slots per stand-in node")
+    parser.add_argument("--baseline", default="./benchmarks/runner_baseline.json", help="Baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression")
+
+    args = parser.parse_args()
+    baseline_path = os.path.abspath(args.baseline)
+
+    measurements = []
+    for name in args.workload or ["smoke", "default"]:
+        print(f"\n===== Benchmark workload: {name} {WORKLOADS[name]} =====")
+        measurements.append(run_workload(
+            name,
+            latency=args.latency,
+            response_words=args.response_words,
+            embedding_dim=args.embedding_dim,
+            slots=args.slots,
+            **WORKLOADS[name]
+        ))
+
+    columns = ["workload", "responses", "wall_seconds", "requests_per_second", "cpu_ms_per_request",
+               "rss_growth_mb", "rss_growth_kb_per_request", "save_raw_data_seconds"]
+    print("\n=== Runner Benchmark ===")
+    print(pd.DataFrame(measurements)[columns].to_markdown(index=False, floatfmt=".3f"))
+
+    regressions = compare_to_baseline(measurements, load_baseline(baseline_path), args.tolerance)
+    if regressions:
+        print(f"\nRegressions beyond {args.tolerance:.0%} against {baseline_path}:")
+        for regression in regressions:
+            print(f"- {regression}")
+    elif os.path.exists(baseline_path):
+        print(f"\nNo regressions against {baseline_path}")
+
+    if args.save_baseline:
+        save_baseline(baseline_path, measurements)
+        print(f"\nBaseline saved to {baseline_path}")
+
+    if regressions:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Request Scheduling Policies
+
+Decides the order in which the runner sends (question, repeat) requests to a
+node. The order matters for throughput: llama-server keeps a KV prefix cache
+per slot, so asking the same question back to back lets it reuse the processed
+prompt, while rotating through every question evicts it on each request.
+
+Each policy turns (questions, repeats, samples per request) into a list of
+WorkItems. New policies are added by registering them in SCHEDULING_POLICIES.
+"""
+
+import random
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+
+class WorkItem(NamedTuple):
+    """One completion call: `count` samples of question `q_idx`."""
+    q_idx: int  # Zero-based question index
+    first_repeat: int  # One-based repeat index of the first sample
+    count: int  # Number of samples requested in this call
+    block: str  # Label of the schedule block this call belongs to, for logging
+
+
+def _repeat_blocks(num_repeats: int, block_size: int) -> List[range]:
+    """Split repeats 1..num_repeats into consecutive chunks of block_size."""
+    block_size = max(1, block_size)
+    return [range(start + 1, min(start + block_size, num_repeats) + 1)
+            for start in range(0, num_repeats, block_size)]
+
+
+def round_robin_schedule(num_questions: int, num_repeats: int, block_size: int = 1,
+                         rng: Optional[random.Random] = None) -> List[WorkItem]:
+    """
+    Rotate through every question once before repeating any (the v3 "staggered" order).
+    """
+    items = []
+    for repeats in _repeat_blocks(num_repeats, block_size):
+        if len(repeats) == 1:
+            block = f"repeat {repeats[0]}/{num_repeats} for all questions"
+        else:
+            block = f"repeats {repeats[0]}-{repeats[-1]}/{num_repeats} for all questions"
+        for q_idx in range(num_questions):
+            items.append(WorkItem(q_idx, repeats[0], len(repeats), block))
+    return items
+
+
+def grouped_schedule(num_questions: int, num_repeats: int, block_size: int = 1,
+                     rng: Optional[random.Random] = None) -> List[WorkItem]:
+    """
+    Send all repeats of one question back to back (the 03-18 order), so the
+    node can reuse its cached prompt prefix.
+    """
+    items = []
+    for q_idx in range(num_questions):
+        block = f"all repeats of Q{q_idx+1}"
+        for repeats in _repeat_blocks(num_repeats, block_size):
+            items.append(WorkItem(q_idx, repeats[0], len(repeats), block))
+    return items
+
+
+def random_blocks_schedule(num_questions: int, num_repeats: int, block_size: int = 1,
+                           rng: Optional[random.Random] = None) -> List[WorkItem]:
+    """
+    Randomized complete blocks: every block asks each question once, in a
+    freshly shuffled order, so ordering effects average out across questions.
+    """
+    rng = rng or random.Random()
+    blocks = _repeat_blocks(num_repeats, block_size)
+    items = []
+    for b_idx, repeats in enumerate(blocks):
+        block = f"randomized block {b_idx+1}/{len(blocks)}"
+        order = list(range(num_questions))
+        rng.shuffle(order)
+        for q_idx in order:
+            items.append(WorkItem(q_idx, repeats[0], len(repeats), block))
+    return items
+
+
+SCHEDULING_POLICIES: Dict[str, Callable[..., List[WorkItem]]] = {
+    "round_robin": round_robin_schedule,
+    "grouped": grouped_schedule,
+    "random_blocks": random_blocks_schedule,
+}
+
+# Policies that send the same prompt back to back and benefit from prefix-cache hints
+CACHE_FRIENDLY_POLICIES = {"grouped"}
+
+
+def build_schedule(policy: str, num_questions: int, num_repeats: int,
+                   block_size: int = 1, seed: Optional[int] = None) -> List[WorkItem]:
+    """
+    Build the request order for one node.
+
+    Args:
+        policy: Name of a policy in SCHEDULING_POLICIES
+        num_questions: Number of questions
+        num_repeats: Number of repeats per question
+        block_size: Samples requested per completion call
+        seed: Optional seed for randomized policies
+
+    Returns:
+        List[WorkItem]: Completion calls in the order they should be sent
+    """
+    if policy not in SCHEDULING_POLICIES:
+        raise ValueError(f"Unknown scheduling policy '{policy}'. "
+                         f"Choose from: {', '.join(SCHEDULING_POLICIES)}")
+    return SCHEDULING_POLICIES[policy](num_questions, num_repeats, block_size, random.Random(seed))
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Multivariate Two-Sample Tests
+
+Tests, for every model pair and question, whether the two models' response
+embeddings come from the same distribution, instead of eyeballing centroid
+distance against mean_stddev:
+
+- a permutation test on the Euclidean distance between the two centroids
+- a shrinkage-regularised Hotelling's T² (Ledoit-Wolf shrinkage of the
+  pooled covariance towards a scaled identity), also with a permutation
+  p-value, since with 25 samples in 1536 dimensions no F approximation holds
+
+Both statistics are computed from Gram matrices of inner products, so
+nothing of size d is touched after the Gram is built. For N = n1 + n2
+pooled samples, a centroid difference is w^T X for a weight vector w, its
+squared norm is w^T G w, and the shrunk covariance is inverted through the
+Woodbury identity on the N x N within-group Gram C G C. The permutations of
+one model pair are a (B, N) label matrix, and all questions with the same
+sample counts are evaluated together as batched matrix products. Work is
+spread over a process pool by model pair and block of questions; only the
+small Gram blocks are sent to the workers.
+"""
+
+import os
+import itertools
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Permutations evaluated per batch in the Hotelling statistic, bounding the (Q, B, N, N) temporaries
+HOTELLING_BATCH = 64
+
+
+def stack_embeddings(results: Dict, model: str, question: str) -> np.ndarray:
+    """Stack one model-question pair's non-empty embeddings into an (n, d) float64 array."""
+    vectors = [np.asarray(item["embedding"], dtype=np.float64)
+               for item in results[model].get(question, [])
+               if item.get("embedding") is not None and len(item["embedding"]) > 0]
+    if not vectors:
+        return np.empty((0, 0))
+    return np.vstack(vectors)
+
+
+def permutation_labels(n1: int, n2: int, num_permutations: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Group-1 indicators for the observed split followed by random relabellings.
+
+    Returns:
+        np.ndarray: (num_permutations + 1, n1 + n2) float array; row 0 is the observed split
+    """
+    total = n1 + n2
+    observed = np.concatenate([np.ones(n1), np.zeros(n2)])
+    order = rng.random((num_permutations, total)).argsort(axis=1)
+    return np.vstack([observed, observed[order]])
+
+
+def centroid_distance_statistics(gram: np.ndarray, labels: np.ndarray, n1: int, n2: int) -> np.ndarray:
+    """
+    Squared centroid distances for every question and labelling.
+
+    Args:
+        gram: (Q, N, N) pooled Gram matrices
+        labels: (B, N) group-1 indicators
+
+    Returns:
+        np.ndarray: (Q, B) squared distances
+    """
+    weights = labels / n1 - (1 - labels) / n2
+    return np.einsum("bn,qnm,bm->qb", weights, gram, weights, optimize=True)
+
+
+def hotelling_statistics(gram: np.ndarray, labels: np.ndarray, n1: int, n2: int, dim: int,
+                         batch: int = HOTELLING_BATCH) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Shrinkage Hotelling's T² for every question and labelling.
+
+    Args:
+        gram: (Q, N, N) pooled Gram matrices
+        labels: (B, N) group-1 indicators
+        n1, n2: Group sizes
+        dim: Embedding dimension d
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (Q, B) T² statistics and (Q, B) shrinkage intensities
+    """
+    total = n1 + n2
+    num_questions = gram.shape[0]
+    t2 = np.empty((num_questions, labels.shape[0]))
+    shrinkage = np.empty_like(t2)
+    identity = np.eye(total)
+
+    for start in range(0, labels.shape[0], batch):
+        ind1 = labels[start:start + batch]
+        ind2 = 1 - ind1
+        weights = ind1 / n1 - ind2 / n2
+
+        # Within-group centering matrices C (B, N, N) and centered Grams K = C G C (Q, B, N, N)
+        centering = (identity
+                     - np.einsum("bi,bj->bij", ind1, ind1) / n1
+                     - np.einsum("bi,bj->bij", ind2, ind2) / n2)
+        centered = np.einsum("bij,qjk,bkl->qbil", centering, gram, centering, optimize=True)
+
+        # Ledoit-Wolf shrinkage of S = Z^T Z / N towards m I, from K = Z Z^T
+        k_diag = np.einsum("qbii->qbi", centered)
+        k_fro2 = np.einsum("qbij,qbij->qb", centered, centered)
+        mean_var = k_diag.sum(axis=-1) / total / dim
+        dispersion = k_fro2 / total ** 2 / dim - mean_var ** 2
+        spread = ((k_diag ** 2).sum(axis=-1) - k_fro2 / total) / (total ** 2 * dim)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lam = np.where(dispersion > 0, np.minimum(spread, dispersion) / dispersion, 1.0)
+        lam = np.clip(lam, 0.0, 1.0)
+
+        # S* = a I + c Z^T Z; delta^T S*^-1 delta via Woodbury in N dimensions
+        a = np.maximum(lam * mean_var, 1e-12)
+        c = (1 - lam) / total
+        delta_sq = np.einsum("bn,qnm,bm->qb", weights, gram, weights, optimize=True)
+        z_delta = np.einsum("bij,qjk,bk->qbi", centering, gram, weights, optimize=True)
+        # With full shrinkage (c = 0) there is no correction; a unit ridge keeps the solve well-posed
+        ridge = np.where(c > 0, a / np.maximum(c, 1e-300), 1.0)
+        solved = np.linalg.solve(centered + ridge[..., None, None] * identity, z_delta[..., None])[..., 0]
+        correction = np.where(c > 0, np.einsum("qbi,qbi->qb", z_delta, solved), 0.0)
+        quad = (delta_sq - correction) / a
+
+        t2[:, start:start + batch] = n1 * n2 / total * quad
+        shrinkage[:, start:start + batch] = lam
+
+    return t2, shrinkage
+
+
+def _permutation_p_values(statistics: np.ndarray) -> np.ndarray:
+    """p-values from (Q, B) statistics whose column 0 is the observed one."""
+    observed = statistics[:, :1]
+    exceed = (statistics[:, 1:] >= observed * (1 - 1e-12)).sum(axis=1)
+    return (1 + exceed) / statistics.shape[1]
+
+
+def _test_block(task: Dict) -> List[Dict]:
+    """Run both tests for one model pair on a block of questions with equal sample counts."""
+    gram, n1, n2, dim = task["gram"], task["n1"], task["n2"], task["dim"]
+    rng = np.random.default_rng(task["seed"])
+    labels = permutation_labels(n1, n2, task["num_permutations"], rng)
+
+    distances = centroid_distance_statistics(gram, labels, n1, n2)
+    t2, shrinkage = hotelling_statistics(gram, labels, n1, n2, dim)
+    distance_p = _permutation_p_values(distances)
+    t2_p = _permutation_p_values(t2)
+
+    rows = []
+    for index, question in enumerate(task["questions"]):
+        rows.append({
+            "question": question,
+            "model1": task["model1"],
+            "model2": task["model2"],
+            "n1": n1,
+            "n2": n2,
+            "centroid_distance": float(np.sqrt(max(distances[index, 0], 0.0))),
+            "distance_p": float(distance_p[index]),
+            "hotelling_t2": float(t2[index, 0]),
+            "shrinkage": float(shrinkage[index, 0]),
+            "t2_p": float(t2_p[index])
+        })
+    return rows
+
+
+def benjamini_hochberg(p_values: np.ndarray) -> np.ndarray:
+    """Benjamini-Hochberg adjusted p-values (false discovery rate)."""
+    p_values = np.asarray(p_values, dtype=float)
+    if p_values.size == 0:
+        return p_values
+    order = np.argsort(p_values)
+    ranked = p_values[order] * p_values.size / np.arange(1, p_values.size + 1)
+    adjusted = np.minimum.accumulate(ranked[::-1])[::-1]
+    result = np.empty_like(adjusted)
+    result[order] = np.minimum(adjusted, 1.0)
+    return result
+
+
+def two_sample_tests(results: Dict, models: List[str], questions: List[str], num_permutations: int = 999,
+                     workers: Optional[int] = None, seed: int = 0, questions_per_task: int = 5) -> pd.DataFrame:
+    """
+    Run the permutation and shrinkage Hotelling tests for every model pair and question.
+
+    Args:
+        results: Raw results {model: {question: [items]}}
+        models: Models to compare
+        questions: Question keys to test
+        num_permutations: Random relabellings per test
+        workers: Worker processes (None = one per CPU, 1 = run in this process)
+        seed: Base random seed
+        questions_per_task: Questions evaluated together per worker task
+
+    Returns:
+        pd.DataFrame: One row per (question, model pair) with the statistics,
+        permutation p-values and Benjamini-Hochberg q-values over all tests
+    """
+    # Gram blocks per question over all models at once, so each model's block is computed once
+    tasks = []
+    seeds = np.random.SeedSequence(seed)
+    for question in questions:
+        stacked = {model: stack_embeddings(results, model, question) for model in models}
+        present = [model for model in models if stacked[model].shape[0] >= 2]
+        if len(present) < 2:
+            continue
+        pooled = np.vstack([stacked[model] for model in present])
+        gram = pooled @ pooled.T
+        offsets = dict(zip(present, np.cumsum([0] + [stacked[model].shape[0] for model in present])))
+
+        for model1, model2 in itertools.combinations(present, 2):
+            n1, n2 = stacked[model1].shape[0], stacked[model2].shape[0]
+            index = np.r_[offsets[model1]:offsets[model1] + n1, offsets[model2]:offsets[model2] + n2]
+            tasks.append({
+                "question": question,
+                "model1": model1,
+                "model2": model2,
+                "n1": n1,
+                "n2": n2,
+                "dim": pooled.shape[1],
+                "gram": gram[np.ix_(index, index)]
+            })
+
+    # Group questions with equal sample counts per pair into vectorized blocks
+    groups: Dict[tuple, List[Dict]] = {}
+    for task in tasks:
+        groups.setdefault((task["model1"], task["model2"], task["n1"], task["n2"], task["dim"]), []).append(task)
+
+    blocks = []
+    for (model1, model2, n1, n2, dim), group in groups.items():
+        for start in range(0, len(group), questions_per_task):
+            chunk = group[start:start + questions_per_task]
+            blocks.append({
+                "model1": model1,
+                "model2": model2,
+                "n1": n1,
+                "n2": n2,
+                "dim": dim,
+                "questions": [task["question"] for task in chunk],
+                "gram": np.stack([task["gram"] for task in chunk]),
+                "num_permutations": num_permutations
+            })
+    for block, child_seed in zip(blocks, seeds.spawn(len(blocks))):
+        block["seed"] = child_seed
+
+    workers = workers or os.cpu_count() or 1
+    logger.info(f"Two-sample tests: {len(tasks)} (question, pair) tests in {len(blocks)} blocks, "
+                f"{num_permutations} permutations, {workers} worker(s)")
+
+    rows = []
+    if workers == 1 or len(blocks) <= 1:
+        for block in blocks:
+            rows.extend(_test_block(block))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(blocks))) as executor:
+            for block_rows in executor.map(_test_block, blocks):
+                rows.extend(block_rows)
+
+    df = pd.DataFrame(rows)
+    if len(df) > 0:
+        df["distance_q"] = benjamini_hochberg(df["distance_p"].values)
+        df["t2_q"] = benjamini_hochberg(df["t2_p"].values)
+        question_order = {question: index for index, question in enumerate(questions)}
+        df = df.assign(order=df["question"].map(question_order))
+        df = df.sort_values(["order", "model1", "model2"]).drop(columns="order").reset_index(drop=True)
+    return df
+
+
+def summarize_tests(tests_df: pd.DataFrame, alpha: float = 0.05) -> pd.DataFrame:
+    """
+    Summarize test results per model pair.
+
+    Args:
+        tests_df: Output of two_sample_tests
+        alpha: Significance level applied to the q-values
+
+    Returns:
+        pd.DataFrame: Per pair, the share of questions separated by each test and the median p-values
+    """
+    if len(tests_df) == 0:
+        return pd.DataFrame()
+    return tests_df.groupby(["model1", "model2"]).agg(
+        questions=("question", "size"),
+        distance_separated=("distance_q", lambda q: float((q < alpha).mean())),
+        t2_separated=("t2_q", lambda q: float((q < alpha).mean())),
+        median_distance_p=("distance_p", "median"),
+        median_t2_p=("t2_p", "median")
+    ).reset_index()
@@ -6,6 +6,7 @@ Simple script to run the experiment and then analyze the results.
 import os
 from experiment_runner import Config, ExperimentRunner
 from experiment_analyzer import ExperimentAnalyzer
+from fingerprint import LogprobFingerprinter, divergence_table
 
 def main():
     # Create a default configuration
@@ -16,9 +17,23 @@ def main():
     print("Select experiment mode:")
     print("1. Multiple Models (3 models, no knowledge base)")
     print("2. Knowledge Bases (1 model, 2 knowledge bases)")
-    mode = input("Enter mode (1 or 2): ")
+    print("3. Fingerprint (greedy logprob probes, 1 request per probe)")
+    mode = input("Enter mode (1, 2 or 3): ")
     
-    if mode == "2":
+    if mode == "3":
+        print("\nFingerprinting the following models:")
+        for model, url in config.MODELS.items():
+            print(f"- {model}: {url}")
+        
+        fingerprinter = LogprobFingerprinter(config)
+        fingerprints = fingerprinter.run()
+        paths = fingerprinter.save_fingerprints(fingerprints)
+        print(f"\nFingerprints saved to: {', '.join(paths)}")
+        
+        print("\nPairwise fingerprint divergence (0 = identical, 0.693 = unrelated):")
+        print(divergence_table(fingerprints).to_markdown(index=False, floatfmt=".4f"))
+        return
+    elif mode == "2":
         config.EXPERIMENT_MODE = "knowledge_bases"
         print("\nConfiguring Knowledge Base Experiment...")
         
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Span Tracing
+
+Opt-in wall-clock instrumentation for the runner and analyzer. Code marks its
+stages with `span(...)`; when tracing is enabled, each span becomes a
+trace-event "complete" event (Chrome trace format) carrying tags such as
+model, question and repeat, and the file can be opened in chrome://tracing or
+Perfetto. A per-stage summary shows where a run's wall time went, which a
+sampling profiler can't show for a run that mostly waits on the network.
+
+When tracing is disabled, `span` returns a shared no-op context manager.
+"""
+
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Collects spans and writes them as a trace-event JSON file."""
+
+    def __init__(self):
+        self.trace_file: Optional[str] = None
+        self.events: List[Dict] = []
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+        self._thread_names: Dict[int, str] = {}
+        self._saved = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.trace_file is not None
+
+    def enable(self, trace_file: str):
+        """
+        Start recording spans.
+
+        Args:
+            trace_file: Where save() writes the trace; also written at interpreter exit
+        """
+        if self.trace_file is None:
+            atexit.register(self.save)
+        self.trace_file = trace_file
+        logger.info(f"Tracing spans to {trace_file}")
+
+    @contextmanager
+    def _record(self, name: str, category: str, tags: Dict):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            thread = threading.current_thread()
+            self._thread_names.setdefault(thread.ident, thread.name)
+            # list.append is atomic, so worker threads need no lock here
+            self.events.append({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": (start - self._origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": self._pid,
+                "tid": thread.ident,
+                "args": tags
+            })
+
+    def span(self, name: str, category: str = "runner", **tags):
+        """
+        Time a stage.
+
+        Args:
+            name: Stage name (e.g. "completion", "embedding", "request_delay")
+            category: Component the stage belongs to ("runner", "analyzer", ...)
+            **tags: Values to attach, e.g. model, question, repeat
+
+        Returns:
+            A context manager timing the enclosed block
+        """
+        if self.trace_file is None:
+            return _NULL_SPAN
+        return self._record(name, category, tags)
+
+    def summary(self) -> pd.DataFrame:
+        """
+        Summarize recorded time per stage.
+
+        Returns:
+            pd.DataFrame: Count, total, mean and p95 seconds per (category, stage)
+        """
+        if not self.events:
+            return pd.DataFrame()
+        df = pd.DataFrame({
+            "category": [event["cat"] for event in self.events],
+            "stage": [event["name"] for event in self.events],
+            "seconds": [event["dur"] / 1e6 for event in self.events]
+        })
+        summary = df.groupby(["category", "stage"])["seconds"].agg(
+            count="size",
+            total="sum",
+            mean="mean",
+            p95=lambda seconds: seconds.quantile(0.95)
+        ).reset_index()
+        return summary.sort_values("total", ascending=False)
+
+    def save(self) -> Optional[str]:
+        """
+        Write the trace file and log the per-stage summary.
+
+        Returns:
+            Optional[str]: Path of the trace file, None if tracing is disabled
+        """
+        if self.trace_file is None or not self.events:
+            return None
+        if len(self.events) == self._saved:
+            # Nothing new since the last save (e.g. the exit hook after an explicit save)
+            return self.trace_file
+
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": name}}
+            for tid, name in self._thread_names.items()
+        ]
+        directory = os.path.dirname(os.path.abspath(self.trace_file))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.trace_file, "w") as f:
+            json.dump({"traceEvents": metadata + self.events, "displayTimeUnit": "ms"}, f)
+        self._saved = len(self.events)
+
+        logger.info(f"Wrote {len(self.events)} spans to {self.trace_file}\n"
+                    + self.summary().to_string(index=False, float_format=lambda value: f"{value:.3f}"))
+        return self.trace_file
+
+
+# Process-wide tracer used by the runner and analyzer
+tracer = Tracer()
+span = tracer.span
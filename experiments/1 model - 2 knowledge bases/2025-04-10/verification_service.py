@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+"""
+Online Verification Service
+
+A long-running local HTTP service that spot-checks live nodes against the
+reference library (see reference_library.py) instead of a full multi-hour
+batch run. A caller submits "node X claims model Y" and gets a job id; the
+service then
+
+1. picks a small probe set: the questions on which the claimed model's
+   reference is furthest from its nearest other reference, relative to
+   their dispersion
+2. asks the node those questions concurrently, within a request budget and
+   a deadline, using the same sampling parameters as the reference runs
+   (with VERIFY_ADAPTIVE, questions are instead chosen round by round by
+   expected information gain until one reference dominates; see
+   adaptive_prober.py)
+3. embeds the answers with the reference embedder and scores them against
+   every reference, and
+4. returns a verdict with a confidence, from each reference's fit test (the
+   F test of its score in ReferenceLibrary.identify) at level
+   1 - VERIFY_CONFIDENCE:
+   - rejected if the claimed model's own reference doesn't fit the answers
+     (confidence 1 - its p-value),
+   - verified if it fits and every other reference is rejected (confidence
+     1 - the largest other p-value),
+   - inconclusive otherwise, e.g. when another reference fits as well
+     (no confidence).
+
+Jobs wait in a queue served by a fixed number of worker threads. Identical
+jobs (same node, claim, embedder and question set) are deduplicated: while
+one is queued or running, and for VERIFY_RESULT_TTL seconds after it
+finished, every caller gets the same job. Finished jobs are dropped after
+that time.
+
+Endpoints:
+    POST /verify       {"node_url", "claim", "embedder"?, "question_set"?, "budget"?}
+    GET  /jobs/<id>    job status and verdict (?wait=SECONDS blocks until done;
+                       404 once the job has been dropped)
+    GET  /jobs         all jobs
+    GET  /health
+"""
+
+import re
+import json
+import time
+import uuid
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import requests
+
+from adaptive_prober import AdaptiveProber
+from embedding_client import EmbeddingClient
+from reference_library import ReferenceLibrary, separated_distances
+
+if TYPE_CHECKING:
+    from experiment_runner import Config
+
+logger = logging.getLogger(__name__)
+
+
+def select_probes(group: Dict[str, np.ndarray], claim: str, num_questions: int) -> List[int]:
+    """
+    Choose the questions that best tell the claimed model apart from the other references.
+
+    Each question is scored by the squared distance between the claim's centroid
+    and the nearest other reference's centroid, less the centroids' own noise
+    (see separated_distances), in units of d times twice the other reference's
+    dispersion; questions some other reference has no answers to can't tell
+    the claim from it and come last, and questions that separate equally (e.g.
+    not at all, when every reference runs the same model) stay in question
+    order. The claim's own dispersion is left out of the score: choosing the
+    questions where it happens to be low would inflate the claim's score and
+    bias its fit test.
+
+    Args:
+        group: Reference group from ReferenceLibrary.group
+        claim: Claimed reference model
+        num_questions: Probe questions wanted
+
+    Returns:
+        List[int]: Question indexes, most discriminating first
+    """
+    models = list(group["models"].astype(str))
+    claim_index = models.index(claim)
+    dim = group["centroids"].shape[2]
+    available = group["counts"][claim_index] > 0
+
+    others = [index for index in range(len(models)) if index != claim_index]
+    if others:
+        separated = separated_distances(group)[:, claim_index, others]  # (Q, others)
+        scale = 2 * dim * group["dispersion"][others].T
+        separation = np.where(np.isnan(separated), -np.inf, separated / np.maximum(scale, 1e-12))
+        score = separation.min(axis=1)
+    else:
+        score = np.zeros(len(available))
+
+    score = np.where(available, score, -np.inf)
+    ranked = [int(index) for index in np.argsort(-score, kind="stable") if available[index]]
+    return ranked[:num_questions]
+
+
+class VerificationJob:
+    """One "node claims model" check and its outcome."""
+
+    def __init__(self, key: Tuple, node_url: str, claim: str, embedder: str, question_set: str, budget: int):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.node_url = node_url
+        self.claim = claim
+        self.embedder = embedder
+        self.question_set = question_set
+        self.budget = budget
+        self.status = "queued"
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.callers = 1
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.done = threading.Event()
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "node_url": self.node_url,
+            "claim": self.claim,
+            "embedder": self.embedder,
+            "question_set": self.question_set,
+            "budget": self.budget,
+            "status": self.status,
+            "created": datetime.fromtimestamp(self.created).isoformat(timespec="seconds"),
+            "seconds": (self.finished or time.time()) - (self.started or self.created) if self.started else None,
+            "callers": self.callers,
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class Verifier:
+    """Probes a node and turns its answers into a verdict against the reference library."""
+
+    def __init__(self, config: "Config", library: ReferenceLibrary):
+        self.config = config
+        self.library = library
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=config.VERIFY_CONCURRENCY * config.VERIFY_WORKERS)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._embedding_clients: Dict[Tuple[str, str], EmbeddingClient] = {}
+        self._lock = threading.Lock()
+
+    def embedding_client(self, node_url: str, embedder: str) -> EmbeddingClient:
+        """
+        Client for the embedder: a reference endpoint when configured, else the node itself.
+
+        Embedding on the node under test means trusting it to embed honestly, so
+        reference endpoints are preferred.
+        """
+        endpoints = self.config.EMBEDDING_ENDPOINTS
+        if isinstance(endpoints, dict):
+            endpoints = endpoints.get(embedder, [])
+        base_url = endpoints[0] if endpoints else node_url
+        with self._lock:
+            key = (base_url, embedder)
+            if key not in self._embedding_clients:
+                if not endpoints:
+                    logger.warning(f"No reference embedding endpoint for {embedder}; embedding on {node_url}")
+                self._embedding_clients[key] = EmbeddingClient(base_url, embedder, self.session,
+                                                               timeout=self.config.TIMEOUT,
+                                                               prefer_base64=self.config.EMBEDDING_BASE64)
+            return self._embedding_clients[key]
+
+    def _probe(self, node_url: str, question: str, embedder: str, deadline: float) -> Optional[np.ndarray]:
+        """Ask one question and embed the answer; None if it failed or ran out of time."""
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return None
+        payload = {
+            "messages": [
+                {"role": "system", "content": self.config.SYSTEM_PROMPT},
+                {"role": "user", "content": question}
+            ],
+            "temperature": self.config.TEMPERATURE,
+            "max_tokens": self.config.MAX_TOKENS,
+            "top_p": self.config.TOP_P
+        }
+        try:
+            response = self.session.post(f"{node_url}/v1/chat/completions", json=payload,
+                                         timeout=min(self.config.TIMEOUT, remaining))
+            response.raise_for_status()
+            text = response.json()["choices"][0]["message"]["content"]
+            return self.embedding_client(node_url, embedder).embed_one(text)
+        except (requests.exceptions.RequestException, KeyError, IndexError, ValueError) as e:
+            logger.warning(f"Probe of {node_url} failed: {e}")
+            return None
+
+    def _collect_fixed(self, job: VerificationJob, group: Dict[str, np.ndarray],
+                       deadline: float) -> Tuple[Dict[str, List[np.ndarray]], int]:
+        """Ask the most discriminating questions for the claim, all at once; returns answers and requests sent."""
+        questions = self.library.questions(job.question_set)
+        # At least two answers per probe question where the budget allows, so a small budget
+        # means fewer questions; the total never exceeds the budget
+        probes = select_probes(group, job.claim, min(self.config.VERIFY_QUESTIONS, max(1, job.budget // 2)))
+        repeats = max(2, job.budget // max(1, len(probes)))
+        asks = [index for _ in range(repeats) for index in probes][:job.budget]
+
+        answers: Dict[str, List[np.ndarray]] = {f"Q{index + 1}": [] for index in probes}
+        with ThreadPoolExecutor(max_workers=self.config.VERIFY_CONCURRENCY) as executor:
+            futures = {
+                executor.submit(self._probe, job.node_url, questions[index], job.embedder, deadline): index
+                for index in asks
+            }
+            for future in as_completed(futures):
+                vector = future.result()
+                if vector is not None:
+                    answers[f"Q{futures[future] + 1}"].append(vector)
+        return {key: vectors for key, vectors in answers.items() if vectors}, len(futures)
+
+    def _collect_adaptive(self, job: VerificationJob, group: Dict[str, np.ndarray],
+                          deadline: float) -> Tuple[Dict[str, List[np.ndarray]], int]:
+        """
+        Ask rounds of VERIFY_CONCURRENCY questions chosen by expected information
+        gain, updating the belief after each round, until one reference dominates.
+        """
+        questions = self.library.questions(job.question_set)
+        prober = AdaptiveProber(group, threshold=self.config.VERIFY_CONFIDENCE, max_probes=job.budget,
+                                temperature=self.config.VERIFY_TEMPERATURE,
+                                fit_level=1 - self.config.VERIFY_CONFIDENCE)
+        answers: Dict[str, List[np.ndarray]] = {}
+        requests_used = 0
+        with ThreadPoolExecutor(max_workers=self.config.VERIFY_CONCURRENCY) as executor:
+            while time.time() < deadline and requests_used < job.budget:
+                batch = prober.next_questions(min(self.config.VERIFY_CONCURRENCY, job.budget - requests_used))
+                if not batch:
+                    break
+                vectors = list(executor.map(
+                    lambda index: self._probe(job.node_url, questions[index], job.embedder, deadline), batch))
+                requests_used += len(batch)
+                for index, vector in zip(batch, vectors):
+                    if vector is None:
+                        prober.asked[index] = prober.max_per_question
+                        continue
+                    prober.update(index, vector)
+                    answers.setdefault(f"Q{index + 1}", []).append(vector)
+        return answers, requests_used
+
+    def verify(self, job: VerificationJob) -> Dict:
+        """
+        Run a verification job.
+
+        Returns:
+            Dict: verdict, confidence (None when inconclusive), the claim's score,
+            fit p-value and posterior, the largest fit p-value among the other
+            references, the best matching reference, probes used and the ranking
+            of all references
+        """
+        group = self.library.group(job.embedder, job.question_set)
+        if not group or job.claim not in list(group["models"].astype(str)):
+            raise ValueError(f"No reference for {job.claim} with {job.embedder} on question set {job.question_set}")
+
+        deadline = time.time() + self.config.VERIFY_DEADLINE
+        if self.config.VERIFY_ADAPTIVE:
+            answers, requests_used = self._collect_adaptive(job, group, deadline)
+        else:
+            answers, requests_used = self._collect_fixed(job, group, deadline)
+
+        samples = {key: np.vstack(vectors) for key, vectors in answers.items()}
+        if not samples:
+            raise RuntimeError(f"No usable answers from {job.node_url} within {self.config.VERIFY_DEADLINE}s")
+
+        ranking = self.library.identify(samples, job.embedder, job.question_set, top_k=None)
+        claim_row = ranking[ranking["model"] == job.claim].iloc[0]
+        best_row = ranking.iloc[0]
+        claim_pvalue = float(claim_row["fit_pvalue"])
+        # With no other reference nothing shows the probes could tell models apart
+        others = ranking[ranking["model"] != job.claim]
+        alternative_pvalue = float(others["fit_pvalue"].max()) if len(others) else 1.0
+        alpha = 1 - self.config.VERIFY_CONFIDENCE
+
+        if claim_pvalue < alpha:
+            verdict, confidence = "rejected", 1 - claim_pvalue
+        elif alternative_pvalue < alpha:
+            verdict, confidence = "verified", 1 - alternative_pvalue
+        else:
+            verdict, confidence = "inconclusive", None
+
+        return {
+            "verdict": verdict,
+            "confidence": confidence,
+            "claim_score": float(claim_row["score"]),
+            "claim_fit_pvalue": claim_pvalue,
+            "alternative_fit_pvalue": alternative_pvalue,
+            "claim_posterior": float(claim_row["posterior"]),
+            "best_match": best_row["model"],
+            "probe_questions": list(samples),
+            "requests": requests_used,
+            "answers": int(sum(len(vectors) for vectors in samples.values())),
+            "ranking": ranking[["model", "score", "distance", "fit_pvalue", "posterior"]].to_dict(orient="records")
+        }
+
+
+class VerificationService:
+    """Job queue, deduplication and worker threads around a Verifier."""
+
+    def __init__(self, config: "Config", library: Optional[ReferenceLibrary] = None):
+        self.config = config
+        self.library = library or ReferenceLibrary(config.REFERENCE_LIBRARY)
+        self.verifier = Verifier(config, self.library)
+        self.jobs: Dict[str, VerificationJob] = {}
+        self._by_key: Dict[Tuple, VerificationJob] = {}
+        self._queue: "queue.Queue[Optional[VerificationJob]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = [threading.Thread(target=self._worker, name=f"verify-{index}", daemon=True)
+                         for index in range(config.VERIFY_WORKERS)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, node_url: str, claim: str, embedder: Optional[str] = None,
+               question_set: Optional[str] = None, budget: Optional[int] = None) -> Tuple[VerificationJob, bool]:
+        """
+        Queue a job, or join an identical one that is pending or recently finished.
+
+        Returns:
+            Tuple[VerificationJob, bool]: The job and whether it was deduplicated
+        """
+        node_url = node_url.rstrip("/")
+        embedder = embedder or self.config.EMBEDDING_MODEL
+        question_set = question_set or self.config.EXPERIMENT_MODE
+        budget = min(int(budget or self.config.VERIFY_REQUEST_BUDGET), self.config.VERIFY_REQUEST_BUDGET)
+        if budget < 1:
+            raise ValueError(f"budget must be at least 1, got {budget}")
+        key = (node_url, claim, embedder, question_set)
+
+        with self._lock:
+            self._evict_finished()
+            existing = self._by_key.get(key)
+            if existing and (existing.finished is None or (existing.status == "done" and
+                             time.time() - existing.finished < self.config.VERIFY_RESULT_TTL)):
+                existing.callers += 1
+                return existing, True
+            job = VerificationJob(key, node_url, claim, embedder, question_set, budget)
+            self.jobs[job.id] = job
+            self._by_key[key] = job
+        self._queue.put(job)
+        logger.info(f"Queued verification {job.id}: {node_url} claims {claim} ({embedder}, {question_set})")
+        return job, False
+
+    def _evict_finished(self):
+        """Drop jobs finished more than VERIFY_RESULT_TTL seconds ago (call with the lock held)."""
+        cutoff = time.time() - self.config.VERIFY_RESULT_TTL
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished and job.finished < cutoff]:
+            job = self.jobs.pop(job_id)
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+
+    def job_list(self) -> List[VerificationJob]:
+        """Jobs still kept: pending, running or finished within VERIFY_RESULT_TTL."""
+        with self._lock:
+            self._evict_finished()
+            return list(self.jobs.values())
+
+    def get_job(self, job_id: str) -> Optional[VerificationJob]:
+        """A kept job by id, None if unknown or evicted."""
+        with self._lock:
+            self._evict_finished()
+            return self.jobs.get(job_id)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            job.status = "running"
+            job.started = time.time()
+            try:
+                job.result = self.verifier.verify(job)
+                job.status = "done"
+                confidence = job.result["confidence"]
+                logger.info(f"Verification {job.id}: {job.result['verdict']}"
+                            f"{f' ({confidence:.3f})' if confidence is not None else ''} "
+                            f"in {time.time() - job.started:.1f}s")
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                logger.error(f"Verification {job.id} failed: {e}")
+            finally:
+                job.finished = time.time()
+                job.done.set()
+
+    def close(self):
+        """Stop the workers after the queued jobs."""
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+
+def make_handler(service: VerificationService):
+    """Build the HTTP request handler class bound to a service."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: Dict):
+            data = json.dumps(body, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/verify":
+                return self._send(404, {"error": "not found"})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                job, deduplicated = service.submit(body["node_url"], body["claim"], body.get("embedder"),
+                                                   body.get("question_set"), body.get("budget"))
+            except (ValueError, KeyError, TypeError) as e:
+                return self._send(400, {"error": f"bad request: {e}"})
+            self._send(202, {**job.to_dict(), "deduplicated": deduplicated})
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/health":
+                return self._send(200, {"status": "ok", "queued": service._queue.qsize(),
+                                        "jobs": len(service.job_list())})
+            if url.path == "/jobs":
+                return self._send(200, {"jobs": [job.to_dict() for job in service.job_list()]})
+            match = re.fullmatch(r"/jobs/([0-9a-f]+)", url.path)
+            job = service.get_job(match.group(1)) if match else None
+            if job is None:
+                return self._send(404, {"error": "not found"})
+            try:
+                wait = float(parse_qs(url.query).get("wait", ["0"])[0])
+            except ValueError as e:
+                return self._send(400, {"error": f"bad request: {e}"})
+            if wait > 0:
+                job.done.wait(min(wait, service.config.VERIFY_DEADLINE * 2))
+            self._send(200, job.to_dict())
+
+        def log_message(self, format, *args):
+            logger.debug(f"{self.address_string()} {format % args}")
+
+    return Handler
+
+
+def main():
+    """Run the verification service."""
+    import argparse
+    from experiment_runner import Config
+
+    config = Config()
+
+    parser = argparse.ArgumentParser(description="Verify live nodes against the reference library over HTTP")
+    parser.add_argument("--library", default=config.REFERENCE_LIBRARY, help="Reference library directory")
+    parser.add_argument("--host", default=config.VERIFY_HOST, help="Address to listen on")
+    parser.add_argument("--port", type=int, default=config.VERIFY_PORT, help="Port to listen on")
+
+    args = parser.parse_args()
+
+    service = VerificationService(config, ReferenceLibrary(args.library))
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    logger.info(f"Verification service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()